@@ -2,18 +2,30 @@ import csv
 from datetime import datetime, timedelta
 import pandas as pd
 import numpy as np
-from scipy.optimize import least_squares
 from ephemeris_manager import EphemerisManager
-import simplekml
+from raw_log_loader import load_raw_log
+from pseudorange_solver import PseudorangeSolver
+from orbit import satellite_positions, orbit_parameters, gps_transmit_time
+from orbit_cache import OrbitCache
+from atmosphere import atmospheric_delay
+from integrity import IntegrityMonitor
+from measurement_selection import MeasurementSelector
+from carrier_smoothing import HatchFilter
+from trajectory_writers import KmlTrajectoryWriter
+from metrics import registry
 from gnss_lib_py.utils.constants import CONSTELLATION_ANDROID, CONSTELLATION_CHARS
 
 class Parser:
     LIGHTSPEED = 2.99792458e8
     WEEKSEC = 604800
     
-    def __init__(self, ephemeris_data_directory):
-        self.manager = EphemerisManager(ephemeris_data_directory)
+    def __init__(self, ephemeris_data_directory, manager=None):
+        self.manager = manager if manager is not None else EphemerisManager(ephemeris_data_directory)
         self.gpsepoch = datetime(1980, 1, 6, 0, 0, 0)
+        # fitted orbits shared by every request that sees the same broadcast records
+        self.orbit_cache = OrbitCache()
+        self.integrity = IntegrityMonitor()
+        self.selector = MeasurementSelector()
     
     def open_file(self, filepath):
         with open(filepath) as csvfile:
@@ -22,7 +34,20 @@ class Parser:
         measurements = pd.DataFrame(measurements)
         return measurements
 
-    def formatDF(self, measurements):
+    def open_log(self, filepath):
+        # GnssLogger text log -> same lowerCamelCase columns the app posts, ready for formatDF
+        measurements = load_raw_log(filepath)
+        return measurements.rename(columns=lambda column: column[0].lower() + column[1:])
+
+    @staticmethod
+    def clock_reference(measurements):
+        # (fullBiasNanos, biasNanos) of the first measurement; receive times formatted against
+        # one reference all read the same continuous receiver clock
+        bias = measurements['biasNanos'].iloc[0] if 'biasNanos' in measurements else 0.0
+        return int(measurements['fullBiasNanos'].iloc[0]), float(np.nan_to_num(bias))
+
+    @registry.timed('formatDF')
+    def formatDF(self, measurements, clock_reference=None):
         if measurements.empty:
             print("No measurements to process.")
             return measurements
@@ -57,7 +82,13 @@ class Parser:
         measurements['FullBiasNanos'] = pd.to_numeric(measurements['fullBiasNanos'])
         measurements['ReceivedSvTimeNanos'] = pd.to_numeric(measurements['receivedSvTimeNanos'])
         measurements['PseudorangeRateMetersPerSecond'] = pd.to_numeric(measurements['pseudorangeRateMetersPerSecond'])
+        measurements['PseudorangeRateUncertaintyMetersPerSecond'] = pd.to_numeric(measurements.get('pseudorangeRateUncertaintyMetersPerSecond', np.nan))
         measurements['ReceivedSvTimeUncertaintyNanos'] = pd.to_numeric(measurements['receivedSvTimeUncertaintyNanos'])
+        measurements['CarrierFrequencyHz'] = pd.to_numeric(measurements.get('carrierFrequencyHz', np.nan))
+        measurements['State'] = pd.to_numeric(measurements.get('state', np.nan))
+        measurements['AccumulatedDeltaRangeMeters'] = pd.to_numeric(measurements.get('accumulatedDeltaRangeMeters', np.nan))
+        measurements['AccumulatedDeltaRangeState'] = pd.to_numeric(measurements.get('accumulatedDeltaRangeState', 0))
+        measurements['AccumulatedDeltaRangeUncertaintyMeters'] = pd.to_numeric(measurements.get('accumulatedDeltaRangeUncertaintyMeters', np.nan))
         measurements['BiasNanos'] = pd.to_numeric(measurements.get('biasNanos', 0))
         measurements['TimeOffsetNanos'] = pd.to_numeric(measurements.get('timeOffsetNanos', 0))
 
@@ -72,20 +103,25 @@ class Parser:
         measurements.loc[measurements['UnixTime'] - measurements['UnixTime'].shift() > timedelta(milliseconds=200), 'Epoch'] = 1
         measurements['Epoch'] = measurements['Epoch'].cumsum()
 
-        if len(measurements) > 0:
-            measurements['gnss_receive_time_nanoseconds'] = measurements['TimeNanos'] + measurements['TimeOffsetNanos'] - (measurements['FullBiasNanos'].iloc[0] + measurements['BiasNanos'].iloc[0])
-        else:
-            measurements['gnss_receive_time_nanoseconds'] = np.nan
-
-        measurements['GpsWeekNumber'] = np.floor(1e-9 * measurements['gnss_receive_time_nanoseconds'] / self.WEEKSEC)
-        measurements['time_since_reference'] = 1e-9 * measurements['gnss_receive_time_nanoseconds'] - self.WEEKSEC * measurements['GpsWeekNumber']
+        # Receive time in integer nanoseconds of one receiver clock, reduced to the week before any
+        # float conversion: as float64 an absolute GPS time in ns only resolves 256 ns (77 m)
+        full_bias, bias = clock_reference if clock_reference is not None else self.clock_reference(measurements)
+        receive_nanos = measurements['TimeNanos'].to_numpy().astype(np.int64) - np.int64(full_bias)
+        week_nanos = np.int64(self.WEEKSEC * 10**9)
+        receive_week_nanos = receive_nanos % week_nanos
+        measurements['gnss_receive_time_nanoseconds'] = receive_nanos
+        measurements['GpsWeekNumber'] = receive_nanos // week_nanos
+        measurements['time_since_reference'] = 1e-9 * (receive_week_nanos + (measurements['TimeOffsetNanos'].to_numpy() - bias))
         measurements['transmit_time_seconds'] = 1e-9 * (measurements['ReceivedSvTimeNanos'] + measurements['TimeOffsetNanos'])
 
-        measurements['pseudorange_seconds'] = measurements['time_since_reference'] - measurements['transmit_time_seconds']
+        # the difference is also taken in integer nanoseconds; TimeOffsetNanos is on both sides
+        received_sv_nanos = measurements['ReceivedSvTimeNanos'].to_numpy().astype(np.int64)
+        measurements['pseudorange_seconds'] = 1e-9 * ((receive_week_nanos - received_sv_nanos) - bias)
         measurements['Pseudorange_Measurement'] = self.LIGHTSPEED * measurements['pseudorange_seconds']
 
         return measurements
 
+    @registry.timed('generate_epoch')
     def generate_epoch(self, measurements):
         epoch = 0
         num_sats = 0
@@ -109,86 +145,169 @@ class Parser:
         ephemeris = self.manager.get_ephemeris(timestamp, sats)
 
         return one_epoch, ephemeris
+
+    @registry.timed('generate_epochs')
+    def generate_epochs(self, measurements, min_satellites=5):
+        # Batch counterpart of generate_epoch: keeps every epoch with enough satellites,
+        # one row per (Epoch, satPRN), each with the ephemeris record valid at its own epoch
+        epochs = measurements.loc[measurements['pseudorange_seconds'] < 0.1].drop_duplicates(subset=['Epoch', 'satPRN'])
+        num_sats = epochs.groupby('Epoch')['satPRN'].transform('size')
+        epochs = epochs.loc[num_sats >= min_satellites].sort_values('Epoch', kind='stable').reset_index(drop=True)
+        if epochs.empty:
+            return pd.DataFrame(), pd.DataFrame()
+
+        ephemeris = self.manager.get_ephemeris_rows(epochs['UnixTime'], epochs['satPRN'])
+        has_ephemeris = ephemeris['t_oe'].notna().to_numpy()
+        epochs = epochs.loc[has_ephemeris].reset_index(drop=True)
+        ephemeris = ephemeris.loc[has_ephemeris].reset_index(drop=True)
+        return epochs, ephemeris
+
+    def solve_epochs(self, measurements, min_satellites=5, smooth=True):
+        epochs, ephemeris = self.generate_epochs(measurements, min_satellites)
+        if epochs.empty:
+            return pd.DataFrame()
+        if smooth:
+            epochs['Pseudorange_Measurement'] = self.smooth_pseudoranges(epochs)
+
+        sv_position = self.calculate_satellite_position(ephemeris, epochs['transmit_time_seconds'])
+        sv_velocity = self.calculate_satellite_velocity(ephemeris, epochs['transmit_time_seconds'])
+        xs = sv_position[['Sat.X', 'Sat.Y', 'Sat.Z']].to_numpy()
+        pr = (epochs['Pseudorange_Measurement'] + self.LIGHTSPEED * sv_position['Sat.bias']).to_numpy()
+        sat_velocity = sv_velocity[['Sat.VX', 'Sat.VY', 'Sat.VZ']].to_numpy()
+        rate = (epochs['PseudorangeRateMetersPerSecond'] + self.LIGHTSPEED * sv_velocity['Sat.drift']).to_numpy()
+
+        # signal checks first, solve, then the elevation mask and weights at each epoch's first fix
+        selection = self.select_measurements(epochs, xs)
+        keep = selection.keep
+        registry.count_satellites(epochs['Constellation'].to_numpy()[~keep], 'gnss_satellites_excluded_total', reason='selection')
+        epochs, xs, pr, sat_velocity, rate = epochs.loc[keep].reset_index(drop=True), xs[keep], pr[keep], sat_velocity[keep], rate[keep]
+        if epochs.empty:
+            return pd.DataFrame()
+        epoch_index = np.unique(epochs['Epoch'].to_numpy(), return_inverse=True)[1]
+        x, b, cost = self.batch_least_squares(xs, pr, epoch_index, weights=selection.weights[selection.keep],
+                                              systems=epochs['Constellation'].to_numpy())
+        reference = x[epoch_index]
+        selection = self.select_measurements(epochs, xs, reference)
+        keep = selection.keep
+        registry.count_satellites(epochs['Constellation'].to_numpy()[~keep], 'gnss_satellites_excluded_total', reason='elevation')
+        epochs, xs, pr, reference = epochs.loc[keep].reset_index(drop=True), xs[keep], pr[keep], reference[keep]
+        sat_velocity, rate = sat_velocity[keep], rate[keep]
+        if epochs.empty:
+            return pd.DataFrame()
+        epoch_ids, epoch_index, num_sats = np.unique(epochs['Epoch'].to_numpy(), return_inverse=True, return_counts=True)
+        first_rows = np.searchsorted(epoch_index, np.arange(len(epoch_ids)))
+        registry.count_satellites(epochs['Constellation'])
+        registry.observe_fix_satellites(epochs['Constellation'], epoch_index)
+
+        # atmospheric delays at the first fix too, then a re-solve starting from it
+        solved = ~np.isnan(reference[:, 0])
+        reference = np.where(solved[:, None], reference, 0.0)
+        pr = pr - np.where(solved, self.atmospheric_delay(xs, reference, epochs), 0.0)
+        systems = epochs['Constellation'].to_numpy()
+        x, b, cost = self.batch_least_squares(xs, pr, epoch_index, x0=reference[first_rows],
+                                              weights=selection.weights[keep], systems=systems)
+        velocity, clock_drift = PseudorangeSolver().solve_velocity_batch(
+            xs, x, sat_velocity, rate, epoch_index, PseudorangeSolver.rate_weights(epochs['PseudorangeRateUncertaintyMetersPerSecond']))
+
+        trajectory = pd.DataFrame({
+            'Epoch': epoch_ids,
+            'UnixTime': epochs['UnixTime'].to_numpy()[first_rows],
+            'Pos.X': x[:, 0],
+            'Pos.Y': x[:, 1],
+            'Pos.Z': x[:, 2],
+            'Vel.X': velocity[:, 0],
+            'Vel.Y': velocity[:, 1],
+            'Vel.Z': velocity[:, 2],
+            'ClockDrift': clock_drift,
+            'NumSats': num_sats,
+            'Cost': cost,
+        })
+        # one receiver clock bias per constellation, all constellations solved jointly
+        for i, system in enumerate(np.unique(systems)):
+            trajectory[f'ClockBias.{system}'] = b[:, i]
+        return trajectory.dropna(subset=['Pos.X']).reset_index(drop=True)
     
+    @registry.timed('satellite_position')
     def calculate_satellite_position(self, ephemeris, transmit_time):
-        earth_gravity = 3.986005e14
-        Earth_angular_velocity = 7.2921151467e-5
-        relativistic_correction_factor = -4.442807633e-10
-        sv_position = pd.DataFrame()
-        sv_position['satPRN'] = ephemeris.index
-        sv_position.set_index('satPRN', inplace=True)
-        sv_position['GPS time'] = transmit_time - ephemeris['t_oe']
-        A = ephemeris['sqrtA'].pow(2)
-        n_0 = np.sqrt(earth_gravity / A.pow(3))
-        n = n_0 + ephemeris['deltaN']
-        M_k = ephemeris['M_0'] + n * sv_position['GPS time']
-        E_k = M_k
-        err = pd.Series(data=[1] * len(sv_position.index))
-        i = 0
-        while err.abs().min() > 1e-8 and i < 10:
-            new_vals = M_k + ephemeris['e'] * np.sin(E_k)
-            err = new_vals - E_k
-            E_k = new_vals
-            i += 1
-
-        sinE_k = np.sin(E_k)
-        cosE_k = np.cos(E_k)
-        delT_r = relativistic_correction_factor * ephemeris['e'] * ephemeris['sqrtA'] * sinE_k
-        delT_oc = transmit_time - ephemeris['t_oc']
-        sv_position['Sat.bias'] = ephemeris['SVclockBias'] + ephemeris['SVclockDrift'] * delT_oc + ephemeris['SVclockDriftRate'] * delT_oc.pow(2)
-
-        v_k = np.arctan2(np.sqrt(1 - ephemeris['e'].pow(2)) * sinE_k, (cosE_k - ephemeris['e']))
-        Phi_k = v_k + ephemeris['omega']
-        sin2Phi_k = np.sin(2 * Phi_k)
-        cos2Phi_k = np.cos(2 * Phi_k)
-
-        du_k = ephemeris['C_us'] * sin2Phi_k + ephemeris['C_uc'] * cos2Phi_k
-        dr_k = ephemeris['C_rs'] * sin2Phi_k + ephemeris['C_rc'] * cos2Phi_k
-        di_k = ephemeris['C_is'] * sin2Phi_k + ephemeris['C_ic'] * cos2Phi_k
-
-        u_k = Phi_k + du_k
-        r_k = A * (1 - ephemeris['e'] * np.cos(E_k)) + dr_k
-        i_k = ephemeris['i_0'] + di_k + ephemeris['IDOT'] * sv_position['GPS time']
-
-        x_k_prime = r_k * np.cos(u_k)
-        y_k_prime = r_k * np.sin(u_k)
-
-        Omega_k = ephemeris['Omega_0'] + (ephemeris['OmegaDot'] - Earth_angular_velocity) * sv_position['GPS time'] - Earth_angular_velocity * ephemeris['t_oe']
-
-        sv_position['Sat.X'] = x_k_prime * np.cos(Omega_k) - y_k_prime * np.cos(i_k) * np.sin(Omega_k)
-        sv_position['Sat.Y'] = x_k_prime * np.sin(Omega_k) + y_k_prime * np.cos(i_k) * np.cos(Omega_k)
-        sv_position['Sat.Z'] = y_k_prime * np.sin(i_k)
-        return sv_position
-    
+        if isinstance(transmit_time, pd.Series) and not transmit_time.index.equals(ephemeris.index):
+            transmit_time = transmit_time.reindex(ephemeris.index)
+        # transmit_time is the satellite clock reading; the orbit is evaluated at GPS time
+        params = orbit_parameters(ephemeris)
+        transmit_time = gps_transmit_time(params, transmit_time)
+        if 'record' in ephemeris:
+            orbit = self.orbit_cache.satellite_positions(params, transmit_time, ephemeris['record'].to_numpy())
+        else:
+            orbit = satellite_positions(params, transmit_time)
+        return pd.DataFrame(orbit, index=pd.Index(ephemeris.index, name='satPRN'),
+                            columns=['Sat.X', 'Sat.Y', 'Sat.Z', 'Sat.bias'])
+
+    @registry.timed('smoothing')
+    def smooth_pseudoranges(self, epochs, smoother=None):
+        # Carrier-smoothed Pseudorange_Measurement for rows ordered by epoch. Runs a fresh
+        # filter over the rows unless a device's running one is passed in.
+        smoother = smoother if smoother is not None else HatchFilter()
+        satellites = epochs['satPRN'].to_numpy() if 'satPRN' in epochs.columns else epochs.index.to_numpy()
+        pseudorange = epochs['Pseudorange_Measurement'].to_numpy(dtype=np.float64)
+        adr = epochs['AccumulatedDeltaRangeMeters'].to_numpy(dtype=np.float64)
+        adr_state = epochs['AccumulatedDeltaRangeState'].to_numpy(dtype=np.float64)
+        times = 1e-9 * epochs['GpsTimeNanos'].to_numpy(dtype=np.float64)
+        epoch_values = epochs['Epoch'].to_numpy()
+        bounds = np.r_[np.flatnonzero(np.r_[True, epoch_values[1:] != epoch_values[:-1]]), len(epochs)]
+        smoothed = np.empty(len(epochs))
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            smoothed[start:stop], _ = smoother.update(times[start], satellites[start:stop], pseudorange[start:stop],
+                                                      adr[start:stop], adr_state[start:stop])
+        return smoothed
+
+    @registry.timed('selection')
+    def select_measurements(self, measurements, xs=None, receiver_xyz=None):
+        # state/C/N0/uncertainty checks, plus the elevation mask once receiver_xyz is known
+        return self.selector.select(measurements, xs, receiver_xyz)
+
+    @registry.timed('atmosphere')
+    def atmospheric_delay(self, xs, receiver_xyz, measurements):
+        # slant ionosphere + troposphere delay in meters for measurement rows aligned with xs
+        return atmospheric_delay(self.manager.get_ionosphere(None), receiver_xyz, xs,
+                                 measurements['time_since_reference'].to_numpy(),
+                                 measurements['UnixTime'].dt.dayofyear.to_numpy(),
+                                 measurements['CarrierFrequencyHz'].to_numpy())
+
+    @registry.timed('satellite_velocity')
+    def calculate_satellite_velocity(self, ephemeris, transmit_time):
+        # ECEF velocity from the orbit model, plus the clock drift in s/s; with record ids the
+        # fitted orbit tables are differentiated instead of solving Kepler again
+        if isinstance(transmit_time, pd.Series) and not transmit_time.index.equals(ephemeris.index):
+            transmit_time = transmit_time.reindex(ephemeris.index)
+        params = orbit_parameters(ephemeris)
+        transmit_time = gps_transmit_time(params, transmit_time)
+        if 'record' in ephemeris:
+            state = self.orbit_cache.satellite_positions(params, transmit_time, ephemeris['record'].to_numpy(),
+                                                         velocity=True)
+        else:
+            state = satellite_positions(params, transmit_time, velocity=True)
+        return pd.DataFrame(state[:, 4:], index=pd.Index(ephemeris.index, name='satPRN'),
+                            columns=['Sat.VX', 'Sat.VY', 'Sat.VZ', 'Sat.drift'])
+
     def residuals(self, x, xs, measured_pseudorange):
         r = np.linalg.norm(xs - x[:3], axis=1)
         return measured_pseudorange - (r + x[3])
     
-    def least_squares(self, xs, measured_pseudorange, x0, b0):
-        x_initial = np.hstack((x0, b0))
-        result = least_squares(self.residuals, x_initial, args=(xs, measured_pseudorange))
-        x_final = result.x
-        return x_final[:3], x_final[3], result.cost
-
-    def create_kml_file(self, coords, output_file):
-        kml = simplekml.Kml()
-        for coord in coords:
-            lat, lon, alt = coord
-            kml.newpoint(name="", coords=[(lon, lat, alt)])
-        kml.save(output_file)
-
-    def detect_spoofing(self, sv_position):
-        # - Pseudorange measurements that deviate significantly from the median
-        # - Satellites with unusually low or high C/N0 values
-        pseudorange_median = sv_position['pseudorange'].median()
-        deviation_threshold = 1e7
-        cn0_threshold_low = 20
-        cn0_threshold_high = 55  
-        
-        spoofed_sats = sv_position[
-            (abs(sv_position['pseudorange'] - pseudorange_median) > deviation_threshold) |
-            (sv_position['cn0'] < cn0_threshold_low) |
-            (sv_position['cn0'] > cn0_threshold_high)
-        ]
-        
-        return spoofed_sats
+    def least_squares(self, xs, measured_pseudorange, x0, b0, weights=None):
+        solution = PseudorangeSolver().solve(xs, measured_pseudorange, weights, x0, b0)
+        return solution.position, solution.clock_bias, solution.cost
+
+    @registry.timed('batch_solve')
+    def batch_least_squares(self, xs, measured_pseudorange, epoch_index, x0=None, b0=0, weights=None, systems=None):
+        return PseudorangeSolver().solve_batch(xs, measured_pseudorange, epoch_index, weights, x0, b0, systems)
+
+    def create_kml_file(self, coords, output_file, times=None, min_distance=None, min_interval=None):
+        # one placemark per (lat, lon, alt) row, streamed to the file instead of built in memory
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        with KmlTrajectoryWriter(output_file, min_distance, min_interval, line=False, points=True) as writer:
+            writer.write(coords[:, 0], coords[:, 1], coords[:, 2], times)
+
+    @registry.timed('raim')
+    def detect_spoofing(self, solution):
+        # RAIM on the solved fix: chi-square residual test, then leave-k-out exclusion.
+        # Returns an IntegrityResult whose excluded are row indices into the solved satellites.
+        return self.integrity.check(solution.H, solution.residuals, solution.weights)
@@ -0,0 +1,107 @@
+import numpy as np
+from coordinates import ecef_to_geodetic, azimuth_elevation
+
+LIGHTSPEED = 2.99792458e8
+GPS_L1_HZ = 1575.42e6
+# below this the models are no longer meaningful; lower satellites get the delay at the mask
+MIN_ELEVATION = np.radians(3.0)
+
+# Niell (1996) mapping coefficients at 15, 30, 45, 60, 75 degrees latitude
+NIELL_LATITUDES = np.radians([15.0, 30.0, 45.0, 60.0, 75.0])
+NIELL_HYDROSTATIC_AVERAGE = np.array([
+    [1.2769934e-3, 2.9153695e-3, 62.610505e-3],
+    [1.2683230e-3, 2.9152299e-3, 62.837393e-3],
+    [1.2465397e-3, 2.9288445e-3, 63.721774e-3],
+    [1.2196049e-3, 2.9022565e-3, 63.824265e-3],
+    [1.2045996e-3, 2.9024912e-3, 64.258455e-3]])
+NIELL_HYDROSTATIC_AMPLITUDE = np.array([
+    [0.0, 0.0, 0.0],
+    [1.2709626e-5, 2.1414979e-5, 9.0128400e-5],
+    [2.6523662e-5, 3.0160779e-5, 4.3497037e-5],
+    [3.4000452e-5, 7.2562722e-5, 84.795348e-5],
+    [4.1202191e-5, 11.723375e-5, 170.37206e-5]])
+NIELL_WET = np.array([
+    [5.8021897e-4, 1.4275268e-3, 4.3472961e-2],
+    [5.6794847e-4, 1.5138625e-3, 4.6729510e-2],
+    [5.8118019e-4, 1.4572752e-3, 4.3908931e-2],
+    [5.9727542e-4, 1.5007428e-3, 4.4626982e-2],
+    [6.1641693e-4, 1.7599082e-3, 5.4736038e-2]])
+NIELL_HEIGHT = (2.53e-5, 5.49e-3, 1.14e-3)
+
+
+def klobuchar_delay(alpha, beta, lat, lon, azimuth, elevation, time_of_week):
+    # GPS broadcast ionosphere model (IS-GPS-200), L1 slant delay in meters
+    semicircle = np.pi
+    phi_u, lambda_u, E = lat / semicircle, lon / semicircle, elevation / semicircle
+    psi = 0.0137 / (E + 0.11) - 0.022
+    phi_i = np.clip(phi_u + psi * np.cos(azimuth), -0.416, 0.416)
+    lambda_i = lambda_u + psi * np.sin(azimuth) / np.cos(phi_i * semicircle)
+    phi_m = phi_i + 0.064 * np.cos((lambda_i - 1.617) * semicircle)
+    local_time = np.mod(43200 * lambda_i + time_of_week, 86400)
+
+    powers = phi_m[..., None] ** np.arange(4)
+    amplitude = np.maximum(powers @ np.asarray(alpha, dtype=np.float64), 0)
+    period = np.maximum(powers @ np.asarray(beta, dtype=np.float64), 72000)
+    x = 2 * np.pi * (local_time - 50400) / period
+    slant = 1 + 16 * (0.53 - E) ** 3
+    delay = np.where(np.abs(x) < 1.57, slant * (5e-9 + amplitude * (1 - x ** 2 / 2 + x ** 4 / 24)), slant * 5e-9)
+    return LIGHTSPEED * delay
+
+
+def saastamoinen_zenith(lat, height, humidity=0.5):
+    # Zenith hydrostatic and wet delays (m) for a standard atmosphere at the receiver height
+    height = np.clip(height, -500.0, 9000.0)
+    pressure = 1013.25 * (1 - 2.2557e-5 * height) ** 5.2568
+    temperature = 15.0 - 6.5e-3 * height + 273.15
+    vapour = 6.108 * humidity * np.exp((17.15 * temperature - 4684.0) / (temperature - 38.45))
+    hydrostatic = 0.0022768 * pressure / (1 - 0.00266 * np.cos(2 * lat) - 0.00028 * height / 1000)
+    wet = 0.002277 * (1255.0 / temperature + 0.05) * vapour
+    return hydrostatic, wet
+
+
+def continued_fraction(sin_elevation, a, b, c):
+    return (1 + a / (1 + b / (1 + c))) / (sin_elevation + a / (sin_elevation + b / (sin_elevation + c)))
+
+
+def niell_mapping(lat, height, elevation, day_of_year):
+    # Hydrostatic and wet mapping functions; the seasonal term flips for the southern hemisphere
+    abs_lat = np.abs(lat)
+    phase = np.where(lat < 0, day_of_year + 182.625, day_of_year)
+    season = np.cos(2 * np.pi * (phase - 28) / 365.25)
+    hydrostatic = [np.interp(abs_lat, NIELL_LATITUDES, NIELL_HYDROSTATIC_AVERAGE[:, k])
+                   - np.interp(abs_lat, NIELL_LATITUDES, NIELL_HYDROSTATIC_AMPLITUDE[:, k]) * season for k in range(3)]
+    wet = [np.interp(abs_lat, NIELL_LATITUDES, NIELL_WET[:, k]) for k in range(3)]
+
+    sin_elevation = np.sin(elevation)
+    height_correction = (1 / sin_elevation - continued_fraction(sin_elevation, *NIELL_HEIGHT)) * height / 1000
+    return continued_fraction(sin_elevation, *hydrostatic) + height_correction, continued_fraction(sin_elevation, *wet)
+
+
+def tropospheric_delay(lat, height, elevation, day_of_year):
+    hydrostatic, wet = saastamoinen_zenith(lat, height)
+    hydrostatic_mapping, wet_mapping = niell_mapping(lat, height, elevation, day_of_year)
+    return hydrostatic * hydrostatic_mapping + wet * wet_mapping
+
+
+def atmospheric_delay(ionosphere, receiver_xyz, xs, time_of_week, day_of_year, carrier_frequency=None):
+    """Ionospheric plus tropospheric slant delay in meters for every satellite row.
+
+    receiver_xyz is one ECEF position for the whole epoch or one per row (batch). The
+    ionosphere comes from the broadcast Klobuchar alpha/beta ({'alpha', 'beta'}, None to
+    skip it) and is scaled from L1 to each row's carrier frequency when that is known.
+    """
+    xs = np.atleast_2d(np.asarray(xs, dtype=np.float64))
+    receiver_xyz = np.broadcast_to(np.asarray(receiver_xyz, dtype=np.float64), xs.shape)
+    lat, lon, height = ecef_to_geodetic(receiver_xyz)
+    azimuth, elevation = azimuth_elevation(receiver_xyz, xs, lat, lon)
+    elevation = np.maximum(elevation, MIN_ELEVATION)
+
+    delay = tropospheric_delay(lat, height, elevation, day_of_year)
+    if ionosphere is not None:
+        ionospheric = klobuchar_delay(ionosphere['alpha'], ionosphere['beta'], lat, lon, azimuth, elevation, time_of_week)
+        if carrier_frequency is not None:
+            carrier_frequency = np.asarray(carrier_frequency, dtype=np.float64)
+            known = np.isfinite(carrier_frequency) & (carrier_frequency > 0)
+            ionospheric = ionospheric * np.where(known, (GPS_L1_HZ / np.where(known, carrier_frequency, GPS_L1_HZ)) ** 2, 1.0)
+        delay = delay + ionospheric
+    return delay
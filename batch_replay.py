@@ -0,0 +1,172 @@
+import argparse
+import glob
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from coordinates import ecef_to_lla
+from ephemeris_manager import EphemerisManager
+from raw_log_loader import load_log_records
+from trajectory_writers import KmlTrajectoryWriter, GeoJsonTrajectoryWriter
+from Parser import Parser
+from metrics import registry
+
+GPS_EPOCH = datetime(1980, 1, 6, 0, 0, 0)
+
+# per worker process: the parser on top of the memory-mapped ephemeris store
+worker_parser = None
+
+
+def find_logs(inputs):
+    # directories expand to the GnssLogger .txt logs inside them, anything else is a glob
+    # (** matches any number of subdirectories)
+    paths = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            paths.extend(sorted(glob.glob(os.path.join(pattern, '*.txt'))))
+        else:
+            paths.extend(sorted(glob.glob(pattern, recursive=True)))
+    return list(dict.fromkeys(os.path.abspath(path) for path in paths))
+
+
+def log_time_span(path):
+    # First and last GPS time of a log's Raw section. Parsing here also leaves the .npy
+    # sidecar next to the log, so the replay later memory-maps it instead of parsing again.
+    try:
+        raw = load_log_records(path, 'Raw')
+    except Exception as e:
+        print(f"Could not read {path}: {e}")
+        return path, None
+    if not len(raw):
+        return path, None
+    gps_nanos = raw['TimeNanos'] - (raw['FullBiasNanos'] - raw['BiasNanos'])
+    gps_nanos = gps_nanos[np.isfinite(gps_nanos)]
+    if not len(gps_nanos):
+        return path, None
+    return path, (GPS_EPOCH + timedelta(microseconds=float(gps_nanos.min()) / 1e3),
+                  GPS_EPOCH + timedelta(microseconds=float(gps_nanos.max()) / 1e3))
+
+
+def open_worker(ephemeris_directory, store_directory):
+    global worker_parser
+    manager = EphemerisManager(ephemeris_directory)
+    manager.open_store(store_directory)
+    worker_parser = Parser(ephemeris_directory, manager=manager)
+
+
+def replay_log(path, output_directory, min_satellites=5, min_distance=None, min_interval=None, geojson=False):
+    name = os.path.splitext(os.path.basename(path))[0]
+    summary = {'file': path, 'status': 'ok', 'epochs': 0, 'fixes': 0}
+    try:
+        measurements = worker_parser.formatDF(worker_parser.open_log(path))
+        if measurements.empty:
+            summary['status'] = 'no measurements'
+            return summary
+        summary['epochs'] = int(measurements['Epoch'].nunique())
+        trajectory = worker_parser.solve_epochs(measurements, min_satellites)
+    except Exception as e:
+        print(f"Replay of {path} failed: {e}")
+        summary['status'] = f'error: {e}'
+        return summary
+    if trajectory.empty:
+        summary['status'] = 'no fixes'
+        return summary
+
+    lat, lon, alt = ecef_to_lla(trajectory[['Pos.X', 'Pos.Y', 'Pos.Z']].to_numpy())
+    trajectory['Lat'], trajectory['Lon'], trajectory['Alt'] = np.atleast_1d(lat), np.atleast_1d(lon), np.atleast_1d(alt)
+    trajectory.to_csv(os.path.join(output_directory, f'{name}_xyz.csv'), index=False)
+    writers = [KmlTrajectoryWriter(os.path.join(output_directory, f'{name}.kml'), min_distance, min_interval, points=True, name=name)]
+    if geojson:
+        writers.append(GeoJsonTrajectoryWriter(os.path.join(output_directory, f'{name}.geojson'), min_distance, min_interval))
+    for writer in writers:
+        with writer:
+            writer.write(trajectory['Lat'], trajectory['Lon'], trajectory['Alt'], trajectory['UnixTime'])
+
+    summary.update({
+        'fixes': len(trajectory),
+        'start': trajectory['UnixTime'].iloc[0],
+        'stop': trajectory['UnixTime'].iloc[-1],
+        'mean_satellites': float(trajectory['NumSats'].mean()),
+        'median_cost': float(trajectory['Cost'].median()),
+    })
+    return summary
+
+
+def replay_worker(*args):
+    # replay_log plus the metrics the worker recorded for it, handed back to the parent
+    with registry.time('replay'):
+        summary = replay_log(*args)
+    return summary, registry.collect(reset=True)
+
+
+def replay(paths, output_directory, ephemeris_directory, rinex_directory=None, workers=None, min_satellites=5,
+           min_distance=None, min_interval=None, geojson=False, metrics=False):
+    """Replays GnssLogger logs on a process pool, one trajectory CSV and KML per log.
+
+    Ephemeris is loaded once for every day the logs cover and saved as a .npy store that
+    each worker memory-maps read-only, so the pool shares one copy of it through the page cache.
+    The KML (and GeoJSON) tracks are decimated by min_distance/min_interval; the CSV keeps
+    every fix. Returns the per-file summary, which is also written to summary.csv. With
+    metrics the workers' stage timings and counters are merged into metrics.prom.
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(workers) as pool:
+        spans = dict(pool.map(log_time_span, paths))
+    timestamps = [time for span in spans.values() if span is not None for time in span]
+    summaries = [{'file': path, 'status': 'unreadable', 'epochs': 0, 'fixes': 0} for path, span in spans.items() if span is None]
+    paths = [path for path, span in spans.items() if span is not None]
+
+    if paths:
+        manager = EphemerisManager(ephemeris_directory, rinex_directory=rinex_directory)
+        manager.load_days(timestamps)
+        with tempfile.TemporaryDirectory(prefix='ephemeris-store-', dir=output_directory) as store_directory:
+            manager.save_store(store_directory)
+            with ProcessPoolExecutor(workers, initializer=open_worker, initargs=(ephemeris_directory, store_directory)) as pool:
+                futures = [pool.submit(replay_worker, path, output_directory, min_satellites,
+                                       min_distance, min_interval, geojson) for path in paths]
+                for future in as_completed(futures):
+                    summary, worker_metrics = future.result()
+                    registry.merge(worker_metrics)
+                    print(f"{os.path.basename(summary['file'])}: {summary['status']}, {summary['fixes']}/{summary['epochs']} epochs solved")
+                    summaries.append(summary)
+
+    summary = pd.DataFrame(summaries).sort_values('file', ignore_index=True)
+    summary.to_csv(os.path.join(output_directory, 'summary.csv'), index=False)
+    if metrics:
+        with open(os.path.join(output_directory, 'metrics.prom'), 'w') as f:
+            f.write(registry.render())
+        print("stage                  calls    total s    mean ms")
+        for stage, calls, total, mean in registry.stage_summary():
+            print(f"{stage:<20} {calls:>7} {total:>10.3f} {mean:>10.3f}")
+    return summary
+
+
+def main():
+    arguments = argparse.ArgumentParser(description='Replay GnssLogger logs into per-file trajectories.')
+    arguments.add_argument('inputs', nargs='+', help='log files, directories of logs or glob patterns')
+    arguments.add_argument('-o', '--output', default='results', help='directory for the trajectories and summary.csv')
+    arguments.add_argument('--ephemeris', default=os.path.join(os.getcwd(), 'data', 'ephemeris'),
+                           help='ephemeris download and cache directory')
+    arguments.add_argument('--rinex', default=None, help='read nav files from this directory instead of downloading')
+    arguments.add_argument('-j', '--workers', type=int, default=None, help='worker processes (default: all cores)')
+    arguments.add_argument('--min-satellites', type=int, default=5)
+    arguments.add_argument('--min-distance', type=float, default=None, help='decimate tracks: meters between kept fixes')
+    arguments.add_argument('--min-interval', type=float, default=None, help='decimate tracks: seconds between kept fixes')
+    arguments.add_argument('--geojson', action='store_true', help='also write a GeoJSON track per log')
+    arguments.add_argument('--metrics', action='store_true', help='write per-stage timings and counters to metrics.prom')
+    args = arguments.parse_args()
+
+    paths = find_logs(args.inputs)
+    if not paths:
+        print("No logs found.")
+        return
+    summary = replay(paths, args.output, args.ephemeris, args.rinex, args.workers, args.min_satellites,
+                     args.min_distance, args.min_interval, args.geojson, args.metrics)
+    print(summary.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
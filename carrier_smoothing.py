@@ -0,0 +1,70 @@
+import numpy as np
+
+# android.location.GnssMeasurement accumulated delta range state bits
+ADR_STATE_VALID = 0x1
+ADR_STATE_RESET = 0x2
+ADR_STATE_CYCLE_SLIP = 0x4
+
+
+class HatchFilter():
+    """Carrier-smoothed pseudoranges (Hatch filter), one running state per satellite.
+
+    P_s(k) = P(k) / n + (n - 1) / n * (P_s(k - 1) + ADR(k) - ADR(k - 1)), with n growing to
+    window. A satellite starts over from its raw pseudorange when its ADR is not valid or
+    reports a reset or cycle slip, after a gap of more than max_gap seconds, or when code and
+    carrier disagree by more than max_divergence meters (a slip the receiver missed). The
+    window bounds the code-carrier ionospheric divergence.
+
+    State lives in fixed arrays indexed by a satellite slot, so an epoch costs O(satellites).
+    """
+    def __init__(self, window=100, max_gap=2.0, max_divergence=30.0, max_satellites=64):
+        self.window = window
+        self.max_gap = max_gap
+        self.max_divergence = max_divergence
+        self.slots = {}
+        self.smoothed = np.full(max_satellites, np.nan)
+        self.adr = np.full(max_satellites, np.nan)
+        self.counts = np.zeros(max_satellites, dtype=np.int64)
+        self.last_seen = np.full(max_satellites, -np.inf)
+
+    def slot_rows(self, satellites):
+        rows = []
+        for satellite in satellites:
+            row = self.slots.get(satellite)
+            if row is None:
+                if len(self.slots) < len(self.last_seen):
+                    row = len(self.slots)
+                else:
+                    # full: reuse the slot of the satellite seen longest ago
+                    row = int(np.argmin(self.last_seen))
+                    self.slots = {sv: slot for sv, slot in self.slots.items() if slot != row}
+                self.counts[row] = 0
+                self.slots[satellite] = row
+            rows.append(row)
+        return np.array(rows, dtype=np.int64)
+
+    @staticmethod
+    def adr_valid(adr, adr_state):
+        adr_state = np.nan_to_num(np.asarray(adr_state, dtype=np.float64)).astype(np.int64)
+        return (np.isfinite(adr) & ((adr_state & ADR_STATE_VALID) != 0)
+                & ((adr_state & (ADR_STATE_RESET | ADR_STATE_CYCLE_SLIP)) == 0))
+
+    def update(self, time, satellites, pseudorange, adr, adr_state):
+        # one epoch; returns the smoothed pseudoranges and how many epochs each one averages
+        rows = self.slot_rows(list(satellites))
+        pseudorange = np.asarray(pseudorange, dtype=np.float64)
+        adr = np.asarray(adr, dtype=np.float64)
+        valid = HatchFilter.adr_valid(adr, adr_state)
+
+        predicted = self.smoothed[rows] + (adr - self.adr[rows])
+        continuing = (valid & (self.counts[rows] > 0) & (time - self.last_seen[rows] <= self.max_gap)
+                      & (np.abs(pseudorange - predicted) <= self.max_divergence))
+        counts = np.where(continuing, np.minimum(self.counts[rows] + 1, self.window), 1)
+        smoothed = np.where(continuing, pseudorange / counts + (counts - 1) / counts * predicted, pseudorange)
+
+        # without a valid carrier there is nothing to continue from next epoch
+        self.counts[rows] = np.where(valid, counts, 0)
+        self.smoothed[rows] = smoothed
+        self.adr[rows] = adr
+        self.last_seen[rows] = time
+        return smoothed, counts
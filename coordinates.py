@@ -0,0 +1,101 @@
+import numpy as np
+
+# WGS-84
+SEMI_MAJOR_AXIS = 6378137.0
+FLATTENING = 1 / 298.257223563
+ECCENTRICITY_SQUARED = FLATTENING * (2 - FLATTENING)
+
+
+def ecef_to_geodetic(xyz):
+    """Closed-form ECEF -> geodetic latitude, longitude (radians) and height (m), Vermeille (2004).
+
+    xyz is (..., 3); the results have its leading shape. Exact to well under a millimeter
+    anywhere outside a few tens of kilometers of the Earth's center, with no iteration.
+    """
+    xyz = np.asarray(xyz, dtype=np.float64)
+    x, y, z = xyz[..., 0], xyz[..., 1], xyz[..., 2]
+    a2, e2 = SEMI_MAJOR_AXIS ** 2, ECCENTRICITY_SQUARED
+    e4 = e2 * e2
+    horizontal = np.hypot(x, y)
+    p = horizontal ** 2 / a2
+    q = (1 - e2) / a2 * z ** 2
+    r = (p + q - e4) / 6
+    s = e4 * p * q / (4 * r ** 3)
+    t = np.cbrt(1 + s + np.sqrt(s * (2 + s)))
+    u = r * (1 + t + 1 / t)
+    v = np.sqrt(u ** 2 + e4 * q)
+    w = e2 * (u + v - q) / (2 * v)
+    k = np.sqrt(u + v + w ** 2) - w
+    d = k * horizontal / (k + e2)
+    distance = np.hypot(d, z)
+    lat = 2 * np.arctan2(z, d + distance)
+    lon = np.arctan2(y, x)
+    height = (k + e2 - 1) / k * distance
+    return lat, lon, height
+
+
+def ecef_to_lla(xyz):
+    # Same contract as navpy.ecef2lla: degrees and meters, plain floats for a single position
+    lat, lon, height = ecef_to_geodetic(xyz)
+    lat, lon = np.degrees(lat), np.degrees(lon)
+    if np.ndim(lat) == 0:
+        return float(lat), float(lon), float(height)
+    return lat, lon, height
+
+
+def lla_to_ecef(lat, lon, height):
+    # degrees and meters -> (..., 3) ECEF
+    lat, lon = np.radians(lat), np.radians(lon)
+    height = np.asarray(height, dtype=np.float64)
+    sin_lat = np.sin(lat)
+    normal = SEMI_MAJOR_AXIS / np.sqrt(1 - ECCENTRICITY_SQUARED * sin_lat ** 2)
+    return np.stack([(normal + height) * np.cos(lat) * np.cos(lon),
+                     (normal + height) * np.cos(lat) * np.sin(lon),
+                     (normal * (1 - ECCENTRICITY_SQUARED) + height) * sin_lat], axis=-1)
+
+
+def enu_rotation(lat, lon):
+    # (..., 3, 3) rotation from ECEF to local east, north, up (rows), latitude/longitude in radians
+    sin_lat, cos_lat, sin_lon, cos_lon = np.sin(lat), np.cos(lat), np.sin(lon), np.cos(lon)
+    zero = np.zeros_like(sin_lat)
+    return np.stack([np.stack([-sin_lon, cos_lon, zero], axis=-1),
+                     np.stack([-sin_lat * cos_lon, -sin_lat * sin_lon, cos_lat], axis=-1),
+                     np.stack([cos_lat * cos_lon, cos_lat * sin_lon, sin_lat], axis=-1)], axis=-2)
+
+
+def ecef_to_enu(xyz, reference_xyz):
+    # East, north, up of each point relative to reference_xyz (one reference or one per point)
+    reference_xyz = np.asarray(reference_xyz, dtype=np.float64)
+    lat, lon, _ = ecef_to_geodetic(reference_xyz)
+    offset = np.asarray(xyz, dtype=np.float64) - reference_xyz
+    return np.einsum('...ij,...j->...i', enu_rotation(lat, lon), offset)
+
+
+def enu_to_ecef(enu, reference_xyz):
+    reference_xyz = np.asarray(reference_xyz, dtype=np.float64)
+    lat, lon, _ = ecef_to_geodetic(reference_xyz)
+    return reference_xyz + np.einsum('...ji,...j->...i', enu_rotation(lat, lon), np.asarray(enu, dtype=np.float64))
+
+
+def speed_and_heading(position_xyz, velocity_xyz):
+    # ground speed (m/s), heading (degrees clockwise from north) and vertical speed (m/s, up)
+    lat, lon, _ = ecef_to_geodetic(position_xyz)
+    enu = np.einsum('...ij,...j->...i', enu_rotation(lat, lon), np.asarray(velocity_xyz, dtype=np.float64))
+    return np.hypot(enu[..., 0], enu[..., 1]), np.degrees(np.arctan2(enu[..., 0], enu[..., 1])) % 360, enu[..., 2]
+
+
+def azimuth_elevation(receiver_xyz, xs, lat=None, lon=None):
+    """Azimuth and elevation (radians) of each satellite row of xs seen from receiver_xyz.
+
+    receiver_xyz is one position or one per row; pass its geodetic lat/lon (radians) when
+    they are already known to skip the conversion.
+    """
+    receiver_xyz = np.asarray(receiver_xyz, dtype=np.float64)
+    if lat is None or lon is None:
+        lat, lon, _ = ecef_to_geodetic(receiver_xyz)
+    line_of_sight = np.asarray(xs, dtype=np.float64) - receiver_xyz
+    sin_lat, cos_lat, sin_lon, cos_lon = np.sin(lat), np.cos(lat), np.sin(lon), np.cos(lon)
+    east = -sin_lon * line_of_sight[..., 0] + cos_lon * line_of_sight[..., 1]
+    north = -sin_lat * cos_lon * line_of_sight[..., 0] - sin_lat * sin_lon * line_of_sight[..., 1] + cos_lat * line_of_sight[..., 2]
+    up = cos_lat * cos_lon * line_of_sight[..., 0] + cos_lat * sin_lon * line_of_sight[..., 1] + sin_lat * line_of_sight[..., 2]
+    return np.arctan2(east, north), np.arctan2(up, np.hypot(east, north))
@@ -0,0 +1,117 @@
+import threading
+import time
+from measurement_stream import EpochBuffer
+from pseudorange_solver import PseudorangeSolver
+from kalman_tracker import KalmanTracker
+from spoofing_monitor import SpoofingMonitor
+from carrier_smoothing import HatchFilter
+
+# a receiver clock bias change larger than this (ns) is a clock reset, not drift
+CLOCK_RESET_NANOS = 1e7
+
+
+class DeviceSession():
+    """Everything the server keeps for one posting device.
+
+    lock serializes processing of that device's batches so epochs are handled in order;
+    readers take a snapshot() and never wait on a running solve.
+    """
+    def __init__(self, device_id):
+        self.device_id = device_id
+        self.lock = threading.Lock()
+        self.buffer = EpochBuffer()
+        # warm-starts from this device's previous fix
+        self.solver = PseudorangeSolver()
+        # position/velocity/clock track carried from epoch to epoch
+        self.tracker = KalmanTracker()
+        # rolling statistics across epochs for spoofing/jamming alerts
+        self.monitor = SpoofingMonitor()
+        # per-satellite carrier smoothing of the pseudoranges
+        self.smoother = HatchFilter()
+        # (FullBiasNanos, BiasNanos) every batch's receive times are formatted against
+        self.clock_reference = None
+        self.latest_measurement = None
+        self.latest_position = None
+        self.latest_velocity = None
+        self.latest_speed = None
+        self.latest_heading = None
+        self.latest_spoofed_sats = None
+        self.latest_alerts = None
+        self.all_positions = None
+        self.created = time.monotonic()
+        self.updated = None
+
+    def reference_clock(self, reference):
+        # Keep the first batch's clock reference so receive times, clock biases and the tracked
+        # clock drift stay continuous across batches; a reset of the receiver clock starts over
+        if self.clock_reference is None or abs(reference[0] - self.clock_reference[0]) > CLOCK_RESET_NANOS:
+            if self.clock_reference is not None:
+                self.tracker = KalmanTracker()
+                self.smoother = HatchFilter()
+                self.monitor.last_biases = None
+            self.clock_reference = reference
+        return self.clock_reference
+
+    def snapshot(self):
+        return {
+            "device_id": self.device_id,
+            "measurement": self.latest_measurement,
+            "position": self.latest_position,
+            "velocity": self.latest_velocity,
+            "speed": self.latest_speed,
+            "heading": self.latest_heading,
+            "all_positions": self.all_positions,
+            "spoofed_satellites": self.latest_spoofed_sats,
+            "alerts": self.latest_alerts
+        }
+
+
+class SessionStore():
+    """Sessions by device id.
+
+    Device ids come from the clients, so the store is bounded: sessions idle for longer than
+    idle_timeout seconds are dropped, and past max_sessions the longest idle one makes room.
+    on_evict(device_id) is called for each dropped session.
+    """
+    def __init__(self, max_sessions=1000, idle_timeout=3600.0, on_evict=None):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.on_evict = on_evict
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get_or_create(self, device_id):
+        with self.lock:
+            session = self.sessions.get(device_id)
+            if session is None:
+                self.evict()
+                session = self.sessions[device_id] = DeviceSession(device_id)
+            return session
+
+    def evict(self):
+        # called with self.lock held, before adding a session
+        now = time.monotonic()
+        idle = {device_id: now - (session.updated or session.created) for device_id, session in self.sessions.items()}
+        evicted = [device_id for device_id, seconds in idle.items() if seconds > self.idle_timeout]
+        for device_id in evicted:
+            del self.sessions[device_id]
+        while len(self.sessions) >= self.max_sessions:
+            device_id = max(self.sessions, key=idle.get)
+            del self.sessions[device_id]
+            evicted.append(device_id)
+        if self.on_evict is not None:
+            for device_id in evicted:
+                self.on_evict(device_id)
+
+    def get(self, device_id):
+        return self.sessions.get(device_id)
+
+    def touch(self, session):
+        session.updated = time.monotonic()
+
+    def latest(self):
+        # Most recently updated session, for clients that don't ask for a specific device
+        sessions = [session for session in list(self.sessions.values()) if session.updated is not None]
+        if not sessions:
+            return None
+        return max(sessions, key=lambda session: session.updated)
@@ -1,62 +1,418 @@
 import os
-from datetime import datetime, timezone
+import json
+import hashlib
+import tempfile
+import threading
+from time import monotonic
+from datetime import datetime, timedelta, timezone
 import georinex
 import pandas as pd
 import numpy as np
 from gnss_lib_py.utils.ephemeris_downloader import load_ephemeris
 from gnss_lib_py.utils.constants import CONSTELLATION_CHARS
 from astropy.time import Time
+from metrics import registry
+
+
+class EphemerisIndex():
+    """Per-satellite sorted view of the ephemeris table for fast (sv, time) lookups.
+
+    Records are sorted by (sv, time) into one contiguous float64 structured array, so the
+    latest record before a timestamp is a searchsorted inside that satellite's slice.
+    """
+    def __init__(self, data):
+        if data.empty:
+            data = pd.DataFrame({'sv': pd.Series(dtype=str), 'time': pd.Series(dtype='datetime64[ns, UTC]')})
+        data = data.sort_values(['sv', 'time'], kind='stable', ignore_index=True)
+        svs = data['sv'].to_numpy(dtype=str)
+        starts = np.flatnonzero(np.r_[True, svs[1:] != svs[:-1]]) if len(svs) else np.array([], dtype=int)
+        stops = np.r_[starts[1:], len(svs)].astype(int)
+        self.satellites = svs[starts]
+        self.bounds = {sv: (start, stop) for sv, start, stop in zip(self.satellites, starts, stops)}
+        self.times = EphemerisIndex.to_nanos(data['time'])
+        # stable id per broadcast record (satellite and reference time), the same across refreshes
+        self.record_ids = EphemerisIndex.record_ids(svs, self.times)
+
+        columns = [column for column in data.columns if column not in ('sv', 'time', 'source')]
+        self.records = np.empty(len(data), dtype=[(column, np.float64) for column in columns])
+        for column in columns:
+            self.records[column] = data[column].to_numpy(dtype=np.float64)
+        self.sources = data['source'].to_numpy(dtype=str) if 'source' in data else np.full(len(data), '')
+
+    def lookup(self, satellites, timestamps):
+        # Row of the latest record strictly before each timestamp, or -1 if there is none
+        satellites = np.asarray(satellites, dtype=str)
+        nanos = EphemerisIndex.to_nanos(timestamps)
+        rows = np.full(len(satellites), -1, dtype=np.int64)
+        if np.ndim(nanos) == 0:
+            # single epoch: one binary search per requested satellite
+            for i, sv in enumerate(satellites):
+                bounds = self.bounds.get(sv)
+                if bounds is not None:
+                    start, stop = bounds
+                    count = self.times[start:stop].searchsorted(nanos, side='left')
+                    rows[i] = start + count - 1 if count > 0 else -1
+            return rows
+
+        nanos = np.broadcast_to(nanos, satellites.shape)
+        if not len(satellites):
+            return rows
+        unique_svs, inverse = np.unique(satellites, return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        splits = np.searchsorted(inverse[order], np.arange(1, len(unique_svs)))
+        for sv, members in zip(unique_svs, np.split(order, splits)):
+            bounds = self.bounds.get(sv)
+            if bounds is None:
+                continue
+            start, stop = bounds
+            count = np.searchsorted(self.times[start:stop], nanos[members], side='left')
+            rows[members] = np.where(count > 0, start + count - 1, -1)
+        return rows
+
+    def save(self, directory):
+        # one .npy per array so open() can memory-map them read-only
+        os.makedirs(directory, exist_ok=True)
+        starts = np.array([self.bounds[sv][0] for sv in self.satellites], dtype=np.int64)
+        stops = np.array([self.bounds[sv][1] for sv in self.satellites], dtype=np.int64)
+        arrays = {'records': self.records, 'times': self.times, 'record_ids': self.record_ids, 'sources': self.sources,
+                  'satellites': self.satellites, 'starts': starts, 'stops': stops}
+        for name, array in arrays.items():
+            np.save(os.path.join(directory, name + '.npy'), array)
+
+    @classmethod
+    def open(cls, directory, mmap_mode='r'):
+        index = cls.__new__(cls)
+        arrays = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode)
+                  for name in ('records', 'times', 'record_ids', 'sources', 'satellites', 'starts', 'stops')}
+        index.satellites = np.asarray(arrays['satellites'])
+        index.bounds = {sv: (int(start), int(stop)) for sv, start, stop in zip(index.satellites, arrays['starts'], arrays['stops'])}
+        index.times = arrays['times']
+        index.record_ids = arrays['record_ids']
+        index.records = arrays['records']
+        index.sources = arrays['sources']
+        return index
+
+    @staticmethod
+    def record_ids(satellites, nanos):
+        codes = np.array([ord(sv[0]) * 1000 + int(sv[1:]) for sv in satellites], dtype=np.int64)
+        return codes * 2**34 + nanos // 10**9
+
+    @staticmethod
+    def to_nanos(timestamps):
+        if isinstance(timestamps, datetime):
+            # naive timestamps are taken as UTC, like everywhere else in the pipeline
+            return np.int64(pd.Timestamp(timestamps).as_unit('ns').value)
+        times = pd.to_datetime(pd.Series(np.atleast_1d(timestamps)), utc=True)
+        return times.dt.tz_convert(None).astype('datetime64[ns]').to_numpy().view(np.int64)
+
+
+class EphemerisCache():
+    """On-disk cache of parsed ephemeris tables, one .npz per (RINEX file, constellation).
+
+    Entries are keyed by the source path, mtime and size, so an updated nav file is parsed
+    again. A small JSON manifest per source records which constellations were already parsed.
+    When the cache grows past max_bytes, whole source files are evicted least recently used first.
+    """
+    def __init__(self, cache_directory, max_bytes=512 * 2**20):
+        self.cache_directory = cache_directory
+        self.max_bytes = max_bytes
+        os.makedirs(cache_directory, exist_ok=True)
+
+    def load(self, filename, constellations=None):
+        # -> (cached frames, constellations still to parse); None means "parse everything"
+        stem = self.stem(filename)
+        manifest = self.read_manifest(stem)
+        if constellations:
+            wanted = set(constellations)
+            missing = set() if manifest['complete'] else wanted - set(manifest['parsed'])
+        else:
+            if not manifest['complete']:
+                return [], None
+            wanted = set(manifest['present'])
+            missing = set()
+        frames = [self.read_table(stem, constellation) for constellation in sorted(wanted & set(manifest['present']))]
+        return [frame for frame in frames if frame is not None], missing
+
+    def store(self, filename, data, constellations=None):
+        stem = self.stem(filename)
+        manifest = self.read_manifest(stem)
+        if not data.empty:
+            for constellation, part in data.groupby(data['sv'].str[0]):
+                self.write_table(stem, constellation, part.dropna(axis=1, how='all'))
+                if constellation not in manifest['present']:
+                    manifest['present'].append(constellation)
+        if constellations:
+            manifest['parsed'] = sorted(set(manifest['parsed']) | set(constellations))
+        else:
+            manifest['complete'] = True
+        self.replace(stem + '.json', lambda f: f.write(json.dumps(manifest).encode()))
+        self.evict(keep=stem)
+
+    def stem(self, filename):
+        stat = os.stat(filename)
+        key = f"{os.path.abspath(filename)}:{stat.st_mtime_ns}:{stat.st_size}"
+        return f"{os.path.basename(filename)}-{hashlib.sha1(key.encode()).hexdigest()[:12]}"
+
+    def read_manifest(self, stem):
+        path = os.path.join(self.cache_directory, stem + '.json')
+        if not os.path.exists(path):
+            return {'complete': False, 'parsed': [], 'present': []}
+        with open(path) as f:
+            return json.load(f)
+
+    def read_table(self, stem, constellation):
+        path = os.path.join(self.cache_directory, f"{stem}-{constellation}.npz")
+        if not os.path.exists(path):
+            return None
+        os.utime(path)
+        with np.load(path) as arrays:
+            data = pd.DataFrame({name: arrays[name] for name in arrays.files})
+        data['time'] = data['time'].dt.tz_localize('UTC')
+        return data
+
+    def write_table(self, stem, constellation, data):
+        arrays = {}
+        for column in data.columns:
+            if column == 'time':
+                arrays[column] = data[column].dt.tz_convert(None).to_numpy(dtype='datetime64[ns]')
+            elif data[column].dtype == object:
+                arrays[column] = data[column].to_numpy(dtype=str)
+            else:
+                arrays[column] = data[column].to_numpy()
+        self.replace(f"{stem}-{constellation}.npz", lambda f: np.savez(f, **arrays))
+
+    def replace(self, name, write):
+        # write into a temporary file in the cache directory and move it into place, so a reader
+        # (another worker sharing the cache) sees the old entry or the new one, never half of it
+        fd, temporary = tempfile.mkstemp(dir=self.cache_directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(temporary, os.path.join(self.cache_directory, name))
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+    def evict(self, keep=None):
+        entries = {}
+        for name in os.listdir(self.cache_directory):
+            if name.endswith('.tmp'):
+                # still being written
+                continue
+            stem = name.rsplit('.', 1)[0]
+            if name.endswith('.npz'):
+                stem = stem.rsplit('-', 1)[0]
+            stat = os.stat(os.path.join(self.cache_directory, name))
+            size, last_used, names = entries.get(stem, (0, 0, []))
+            entries[stem] = (size + stat.st_size, max(last_used, stat.st_mtime), names + [name])
+        total = sum(size for size, _, _ in entries.values())
+        for stem, (size, _, names) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if total <= self.max_bytes:
+                break
+            if stem == keep:
+                continue
+            for name in names:
+                os.remove(os.path.join(self.cache_directory, name))
+            total -= size
 
 
 class EphemerisManager():
-    def __init__(self, data_directory=os.path.join(os.getcwd(), 'data', 'ephemeris')):
+    # Broadcast records are fitted for roughly two hours either side of their reference time
+    COVERAGE_MARGIN = timedelta(hours=2)
+
+    def __init__(self, data_directory=os.path.join(os.getcwd(), 'data', 'ephemeris'), max_cache_bytes=512 * 2**20,
+                 rinex_directory=None, refresh_interval=300, retention=timedelta(days=2)):
         self.data_directory = data_directory
         nasa_dir = os.path.join(data_directory, 'nasa')
         igs_dir = os.path.join(data_directory, 'igs')
         os.makedirs(nasa_dir, exist_ok=True)
         os.makedirs(igs_dir, exist_ok=True)
+        self.cache = EphemerisCache(os.path.join(data_directory, 'cache'), max_cache_bytes)
+        self.rinex_directory = rinex_directory
+        self.refresh_interval = refresh_interval
+        self.retention = retention
         self.data = None
+        self.index = None
         self.leapseconds = None
+        self.ionosphere = None
+        self.files = []
+        self.constellations = None
+        self.refresher = None
+        self.last_refresh = None
+        self.install_lock = threading.Lock()
+        # held while deciding whether to start a refresher, so concurrent lookups start at most one
+        self.refresh_lock = threading.Lock()
+        # set when the index comes from a saved store: never refreshed or reloaded
+        self.frozen = False
 
+    @registry.timed('ephemeris')
     def get_ephemeris(self, timestamp, satellites):
         systems = EphemerisManager.get_constellations(satellites)
         if not isinstance(self.data, pd.DataFrame):
             self.load_data(timestamp, systems)
-        data = self.data
+        else:
+            self.ensure_coverage(timestamp, systems)
+        index = self.index
         if satellites:
-            data = data.loc[data['sv'].isin(satellites)]
-        data = data.loc[data['time'] < timestamp]
-        data = data.sort_values('time').groupby(
-            'sv').last()
-        data = data.iloc[:, 1:]
+            svs = np.unique(np.asarray(satellites, dtype=str))
+        else:
+            svs = index.satellites
+        rows = index.lookup(svs, timestamp)
+        found = rows >= 0
+        registry.inc('gnss_ephemeris_lookups_total', int(found.sum()), result='found')
+        registry.inc('gnss_ephemeris_lookups_total', int((~found).sum()), result='missing')
+        data = pd.DataFrame(index.records[rows[found]], index=pd.Index(svs[found], name='sv'))
+        data['source'] = index.sources[rows[found]]
+        data['record'] = index.record_ids[rows[found]]
+        data['Leap Seconds'] = self.leapseconds
+        return data
+
+    @registry.timed('ephemeris')
+    def get_ephemeris_rows(self, timestamps, satellites):
+        # One ephemeris row per (timestamp, satellite) pair, positionally aligned with the inputs.
+        # Pairs without a record published before their timestamp come back as NaN rows.
+        satellites = np.asarray(satellites, dtype=str)
+        systems = set(np.unique(satellites.astype('U1')).tolist())
+        if not isinstance(self.data, pd.DataFrame):
+            self.load_data(pd.to_datetime(timestamps, utc=True).min(), systems)
+        else:
+            self.ensure_coverage(timestamps, systems)
+        index = self.index
+        rows = index.lookup(satellites, timestamps)
+        registry.inc('gnss_ephemeris_lookups_total', int((rows >= 0).sum()), result='found')
+        registry.inc('gnss_ephemeris_lookups_total', int((rows < 0).sum()), result='missing')
+        data = pd.DataFrame(index.records[np.maximum(rows, 0)])
+        data.loc[rows < 0] = np.nan
+        data['record'] = np.where(rows >= 0, index.record_ids[np.maximum(rows, 0)], -1)
         data['Leap Seconds'] = self.leapseconds
         return data
 
     def get_leapseconds(self, timestamp):
         return self.leapseconds
 
+    def get_ionosphere(self, timestamp):
+        return self.ionosphere
+
     def load_data(self, timestamp, constellations=None):
-        data_list = []
+        files = list(self.find_files(timestamp, constellations))
+        data = self.read_files(files, constellations)
+        self.files = files
+        self.constellations = set(constellations) if constellations else None
+        self.install(data)
+
+    def load_days(self, timestamps, constellations=None):
+        # Loads the nav files of every day the timestamps fall on, e.g. for a batch of logs
+        days = sorted({pd.Timestamp(timestamp).normalize() for timestamp in timestamps})
+        files = list(dict.fromkeys(file for day in days for file in self.find_files(day.to_pydatetime(), constellations)))
+        data = self.read_files(files, constellations)
+        self.files = files
+        self.constellations = set(constellations) if constellations else None
+        self.install(data)
+
+    def save_store(self, directory):
+        # The loaded index plus header values, for other processes to open with open_store
+        self.index.save(directory)
+        ionosphere = None
+        if self.ionosphere is not None:
+            ionosphere = {key: np.asarray(values).tolist() for key, values in self.ionosphere.items()}
+        with open(os.path.join(directory, 'store.json'), 'w') as f:
+            json.dump({'leapseconds': self.leapseconds, 'ionosphere': ionosphere}, f)
+
+    def open_store(self, directory):
+        # Memory-maps a store written by save_store; the pages are shared by every process that opens it
+        with open(os.path.join(directory, 'store.json')) as f:
+            header = json.load(f)
+        self.leapseconds = header['leapseconds']
+        if header['ionosphere'] is not None:
+            self.ionosphere = {key: np.array(values) for key, values in header['ionosphere'].items()}
+        with self.install_lock:
+            self.data = pd.DataFrame()
+            self.index = EphemerisIndex.open(directory)
+        self.frozen = True
+
+    def ensure_coverage(self, timestamps, constellations=None):
+        # Called on every lookup once data is loaded: never blocks, at most kicks off a background refresh
+        if self.frozen:
+            return
+        nanos = np.atleast_1d(EphemerisIndex.to_nanos(timestamps))
+        index = self.index
+        margin = pd.Timedelta(self.COVERAGE_MARGIN).value
+        new_constellations = self.constellations is not None and bool(set(constellations or ()) - self.constellations)
+        outside = not len(index.times) or nanos.max() > index.times.max() + margin or nanos.min() < index.times.min()
+        if not (new_constellations or outside):
+            return
+        with self.refresh_lock:
+            if self.refresher is not None and self.refresher.is_alive():
+                return
+            if not new_constellations and self.last_refresh is not None and monotonic() - self.last_refresh < self.refresh_interval:
+                return
+            self.last_refresh = monotonic()
+            timestamp = pd.Timestamp(nanos.max(), tz='UTC').to_pydatetime()
+            self.refresher = threading.Thread(target=self.refresh, args=(timestamp, constellations), daemon=True)
+            self.refresher.start()
+
+    def refresh(self, timestamp, constellations=None):
+        # Merges newly available nav files into the loaded set and swaps in a fresh index;
+        # lookups running meanwhile keep using the index they already hold
+        try:
+            if self.constellations is None or not constellations:
+                constellations = None
+            else:
+                constellations = self.constellations | set(constellations)
+            files = list(dict.fromkeys(self.files + list(self.find_files(timestamp, constellations))))
+            data = self.read_files(files, constellations)
+            if not data.empty:
+                data = data.loc[data['time'] >= pd.Timestamp(timestamp) - self.retention]
+                files = [file for file in files if file in set(data['source'])]
+            self.files = files
+            self.constellations = constellations
+            self.install(data)
+        except Exception as e:
+            print(f"Ephemeris refresh failed: {e}")
+
+    def find_files(self, timestamp, constellations=None):
+        if self.rinex_directory:
+            return EphemerisManager.list_nav_files(self.rinex_directory)
         constellations_converted = None
         if constellations:
             constellations_converted = [CONSTELLATION_CHARS[constellation] for constellation in constellations]
-        files = load_ephemeris(file_type="rinex_nav", gps_millis=Time(timestamp).gps * 1000, constellations=constellations_converted, download_directory="ephemeris_data")
-        for file in files:
-            data_list.append(self.read_ephemeris(file, constellations=constellations))
-        if data_list:
-            data = pd.concat(data_list, ignore_index=True)
-        else:
-            data = pd.DataFrame()
+        return load_ephemeris(file_type="rinex_nav", gps_millis=Time(timestamp).gps * 1000, constellations=constellations_converted, download_directory="ephemeris_data")
+
+    def read_files(self, files, constellations=None):
+        data_list = [self.read_ephemeris(file, constellations=constellations) for file in files]
+        data_list = [data for data in data_list if not data.empty]
+        if not data_list:
+            return pd.DataFrame()
+        return pd.concat(data_list, ignore_index=True)
+
+    def install(self, data):
+        if not data.empty:
+            # consecutive daily files repeat the records around midnight
+            data = data.drop_duplicates(subset=['sv', 'time'], keep='last')
+            data = data.sort_values('time', ignore_index=True)
+        index = EphemerisIndex(data)
+        with self.install_lock:
+            self.data = data
+            self.index = index
 
-        data.reset_index(drop=True, inplace=True)
-        data.sort_values('time', inplace=True, ignore_index=True)
-        self.data = data
-        
-        
     def read_ephemeris(self, decompressed_filename, constellations=None):
         if not self.leapseconds:
             self.leapseconds = EphemerisManager.load_leapseconds(
                 decompressed_filename)
+        if self.ionosphere is None:
+            self.ionosphere = EphemerisManager.load_ionosphere(decompressed_filename)
+        frames, missing = self.cache.load(decompressed_filename, constellations)
+        registry.inc('gnss_ephemeris_file_cache_total', result='miss' if missing is None or missing else 'hit')
+        if missing is None or missing:
+            data = EphemerisManager.parse_ephemeris(decompressed_filename, missing)
+            self.cache.store(decompressed_filename, data, missing)
+            frames.append(data)
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+    @staticmethod
+    def parse_ephemeris(decompressed_filename, constellations=None):
         if constellations:
             data = georinex.load(decompressed_filename,
                                  use=constellations).to_dataframe()
@@ -82,6 +438,44 @@ class EphemerisManager():
                 if 'END OF HEADER' in line:
                     return None
 
+    @staticmethod
+    def load_ionosphere(filename):
+        # Klobuchar alpha/beta from the header: 'GPSA'/'GPSB' IONOSPHERIC CORR lines in
+        # RINEX 3, ION ALPHA/ION BETA in RINEX 2
+        coefficients = {}
+        with open(filename) as f:
+            for line in f:
+                label = line[60:].strip()
+                if label == 'IONOSPHERIC CORR' and line[:4] in ('GPSA', 'GPSB'):
+                    coefficients['alpha' if line[:4] == 'GPSA' else 'beta'] = EphemerisManager.header_values(line, 5)
+                elif label in ('ION ALPHA', 'ION BETA'):
+                    coefficients['alpha' if label == 'ION ALPHA' else 'beta'] = EphemerisManager.header_values(line, 2)
+                elif label == 'END OF HEADER':
+                    break
+        if len(coefficients) < 2:
+            return None
+        return coefficients
+
+    @staticmethod
+    def header_values(line, start, count=4, width=12):
+        return np.array([float(line[start + i * width:start + (i + 1) * width].replace('D', 'E')) for i in range(count)])
+
+    @staticmethod
+    def list_nav_files(directory):
+        files = []
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not os.path.isfile(path) or name.endswith(('.npy', '.npz', '.json')):
+                continue
+            try:
+                with open(path, errors='ignore') as f:
+                    first_line = f.readline()
+            except OSError:
+                continue
+            if 'NAV' in first_line[:60].upper() and 'RINEX VERSION' in first_line:
+                files.append(path)
+        return files
+
     @staticmethod
     def get_constellations(satellites):
         if type(satellites) is list:
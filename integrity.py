@@ -0,0 +1,74 @@
+import itertools
+import numpy as np
+from scipy.stats import chi2
+
+
+class IntegrityResult():
+    def __init__(self, available, fault_detected, passed, statistic, threshold, excluded):
+        # available: enough redundancy to test at all; passed: the (post-exclusion) fix is consistent
+        self.available = available
+        self.fault_detected = fault_detected
+        self.passed = passed
+        self.statistic = statistic
+        self.threshold = threshold
+        self.excluded = excluded
+
+    def to_dict(self):
+        return {
+            "available": self.available,
+            "fault_detected": self.fault_detected,
+            "passed": self.passed,
+            "statistic": self.statistic,
+            "threshold": self.threshold,
+        }
+
+
+class IntegrityMonitor():
+    """Receiver autonomous integrity monitoring (RAIM) on a weighted least-squares fix.
+
+    The global test compares the weighted sum of squared residuals with the chi-square
+    threshold for false_alarm_rate. When it fails, every subset of up to max_exclusions
+    measurements is tried for removal without re-solving: with the hat matrix from one QR
+    factorization of the whitened geometry, dropping subset S lowers the sum of squares by
+    r_S^T (I - P)_SS^-1 r_S, a rank-|S| downdate, so each candidate is a k x k solve. The
+    smallest subset whose removal passes the test at the reduced degrees of freedom wins.
+    """
+    def __init__(self, false_alarm_rate=1e-5, max_exclusions=2):
+        self.false_alarm_rate = false_alarm_rate
+        self.max_exclusions = max_exclusions
+
+    def threshold(self, dof):
+        return float(chi2.isf(self.false_alarm_rate, dof))
+
+    def check(self, H, residuals, weights=None):
+        H = np.asarray(H, dtype=np.float64)
+        n, m = H.shape
+        sqrt_weights = np.ones(n) if weights is None else np.sqrt(np.asarray(weights, dtype=np.float64))
+        A = sqrt_weights[:, None] * H
+        r = sqrt_weights * np.asarray(residuals, dtype=np.float64)
+        dof = n - m
+        if dof < 1:
+            return IntegrityResult(False, False, True, None, None, [])
+
+        statistic = float(r @ r)
+        threshold = self.threshold(dof)
+        if statistic <= threshold:
+            return IntegrityResult(True, False, True, statistic, threshold, [])
+
+        Q, _ = np.linalg.qr(A)
+        residual_projector = np.eye(n) - Q @ Q.T
+        for k in range(1, min(self.max_exclusions, dof - 1) + 1):
+            subsets = np.array(list(itertools.combinations(range(n), k)))
+            block = residual_projector[subsets[:, :, None], subsets[:, None, :]]
+            # a (near) singular block means the remaining satellites cannot fix the state
+            usable = np.linalg.eigvalsh(block)[:, 0] > 1e-9
+            if not usable.any():
+                continue
+            subsets, block, r_subset = subsets[usable], block[usable], r[subsets[usable]]
+            reduction = np.einsum('ci,ci->c', r_subset, np.linalg.solve(block, r_subset[..., None])[..., 0])
+            remaining = statistic - reduction
+            best = int(np.argmin(remaining))
+            limit = self.threshold(dof - k)
+            if remaining[best] <= limit:
+                return IntegrityResult(True, True, True, float(remaining[best]), limit, subsets[best].tolist())
+        return IntegrityResult(True, True, False, statistic, threshold, [])
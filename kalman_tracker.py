@@ -0,0 +1,143 @@
+import numpy as np
+from orbit import sagnac_rotation
+from pseudorange_solver import LIGHTSPEED
+
+
+class KalmanTracker():
+    """Extended Kalman filter over one device's position, velocity and receiver clock.
+
+    State is [x, y, z, vx, vy, vz, clock drift, one clock bias per system], ECEF meters and
+    m/s. Each epoch is a constant-velocity prediction plus a single linearized update with
+    that epoch's pseudoranges and Doppler pseudorange rates, so the cost per epoch grows
+    linearly with the number of satellites. A constellation seen for the first time gets its
+    own bias state appended; a gap longer than max_gap drops the track so the caller
+    re-initializes it from a snapshot fix.
+    """
+    def __init__(self, accel_noise=2.0, drift_noise=1.0, bias_noise=0.5, max_gap=10.0, gate=5.0):
+        # white-noise spectral densities: accel in m/s^2, clock drift in m/s, bias random walk in m
+        self.accel_noise = accel_noise
+        self.drift_noise = drift_noise
+        self.bias_noise = bias_noise
+        self.max_gap = max_gap
+        # innovations beyond gate sigmas are dropped from the update
+        self.gate = gate
+        self.state = None
+        self.covariance = None
+        self.systems = []
+        self.time = None
+
+    @property
+    def position(self):
+        return self.state[:3].copy()
+
+    @property
+    def velocity(self):
+        return self.state[3:6].copy()
+
+    @property
+    def clock_drift(self):
+        return float(self.state[6])
+
+    @property
+    def clock_biases(self):
+        return dict(zip(self.systems, self.state[7:].tolist()))
+
+    def is_tracking(self, time):
+        return self.state is not None and 0 < time - self.time <= self.max_gap
+
+    def initialize(self, time, position, clock_biases, position_sigma=10.0, velocity_sigma=30.0):
+        self.systems = list(clock_biases)
+        self.state = np.concatenate((position, np.zeros(4), list(clock_biases.values()))).astype(np.float64)
+        self.covariance = np.diag(np.concatenate((np.full(3, position_sigma ** 2), np.full(3, velocity_sigma ** 2),
+                                                  [100.0 ** 2], np.full(len(self.systems), position_sigma ** 2))))
+        self.time = time
+
+    def add_system(self, system, bias, sigma=100.0):
+        self.systems.append(system)
+        self.state = np.append(self.state, bias)
+        size = len(self.state)
+        covariance = np.zeros((size, size))
+        covariance[:-1, :-1] = self.covariance
+        covariance[-1, -1] = sigma ** 2
+        self.covariance = covariance
+
+    def predict(self, time):
+        dt = time - self.time
+        size = len(self.state)
+        F = np.eye(size)
+        F[0:3, 3:6] = dt * np.eye(3)
+        F[7:, 6] = dt
+
+        Q = np.zeros((size, size))
+        q = self.accel_noise ** 2
+        Q[0:3, 0:3] = q * dt ** 3 / 3 * np.eye(3)
+        Q[0:3, 3:6] = Q[3:6, 0:3] = q * dt ** 2 / 2 * np.eye(3)
+        Q[3:6, 3:6] = q * dt * np.eye(3)
+        Q[6, 6] = self.drift_noise ** 2 * dt
+        Q[7:, 7:] = self.bias_noise ** 2 * dt * np.eye(size - 7)
+
+        self.state = F @ self.state
+        self.covariance = F @ self.covariance @ F.T + Q
+        self.time = time
+
+    def rate_residuals(self, xs, sat_velocity, pseudorange_rate):
+        # measured minus predicted pseudorange rate at the current state
+        line_of_sight = np.asarray(xs, dtype=np.float64) - self.state[:3]
+        unit = line_of_sight / np.linalg.norm(line_of_sight, axis=1)[:, None]
+        predicted = np.einsum('ij,ij->i', np.asarray(sat_velocity) - self.state[3:6], unit) + self.state[6]
+        return np.asarray(pseudorange_rate, dtype=np.float64) - predicted
+
+    def update(self, time, xs, pseudorange, pseudorange_sigma, systems,
+               sat_velocity=None, pseudorange_rate=None, pseudorange_rate_sigma=None):
+        # pseudorange must already carry the satellite clock correction and pseudorange_rate the
+        # satellite clock drift correction; rows whose rate or sigma is NaN only update position
+        xs = np.asarray(xs, dtype=np.float64)
+        pseudorange = np.asarray(pseudorange, dtype=np.float64)
+        systems = np.asarray(systems)
+        self.predict(time)
+        # satellites at transmission -> reception-time frame, transit time from the predicted position
+        xs = sagnac_rotation(xs, np.linalg.norm(xs - self.state[:3], axis=1) / LIGHTSPEED)
+
+        for system in dict.fromkeys(systems.tolist()):
+            if system not in self.systems:
+                rows = systems == system
+                ranges = np.linalg.norm(xs[rows] - self.state[:3], axis=1)
+                self.add_system(system, float(np.median(pseudorange[rows] - ranges)))
+        system_index = np.array([self.systems.index(system) for system in systems.tolist()], dtype=int)
+
+        line_of_sight = xs - self.state[:3]
+        ranges = np.linalg.norm(line_of_sight, axis=1)
+        unit = line_of_sight / ranges[:, None]
+        size = len(self.state)
+
+        H = np.zeros((len(xs), size))
+        H[:, :3] = -unit
+        H[np.arange(len(xs)), 7 + system_index] = 1.0
+        innovation = pseudorange - (ranges + self.state[7 + system_index])
+        variance = np.asarray(pseudorange_sigma, dtype=np.float64) ** 2
+
+        if pseudorange_rate is not None:
+            pseudorange_rate = np.asarray(pseudorange_rate, dtype=np.float64)
+            rate_variance = np.asarray(pseudorange_rate_sigma, dtype=np.float64) ** 2
+            H_rate = np.zeros((len(xs), size))
+            H_rate[:, 3:6] = -unit
+            H_rate[:, 6] = 1.0
+            rate_innovation = pseudorange_rate - (np.einsum('ij,ij->i', np.asarray(sat_velocity) - self.state[3:6], unit) + self.state[6])
+            H = np.concatenate((H, H_rate))
+            innovation = np.concatenate((innovation, rate_innovation))
+            variance = np.concatenate((variance, rate_variance))
+
+        PHt = self.covariance @ H.T
+        innovation_variance = np.einsum('ij,ji->i', H, PHt) + variance
+        keep = np.isfinite(innovation) & np.isfinite(variance) & (innovation ** 2 <= self.gate ** 2 * innovation_variance)
+        if not keep.any():
+            return 0
+        H, PHt, innovation, variance = H[keep], PHt[:, keep], innovation[keep], variance[keep]
+
+        S = H @ PHt + np.diag(variance)
+        gain = np.linalg.solve(S, PHt.T).T
+        self.state = self.state + gain @ innovation
+        # Joseph form keeps the covariance symmetric and positive definite
+        I_KH = np.eye(size) - gain @ H
+        self.covariance = I_KH @ self.covariance @ I_KH.T + gain @ (variance[:, None] * gain.T)
+        return int(keep.sum())
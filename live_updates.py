@@ -0,0 +1,141 @@
+import json
+import threading
+from collections import deque
+import numpy as np
+
+MISSING = object()
+
+
+def json_default(value):
+    # numpy scalars and arrays that slip into a device state
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class LiveUpdate():
+    def __init__(self, sequence, device_id, changes):
+        self.sequence = sequence
+        self.device_id = device_id
+        self.changes = changes
+        self.encoded = None
+
+    def encode(self):
+        # serialized once and shared by every subscriber that receives this update as is
+        if self.encoded is None:
+            self.encoded = json.dumps({"device_id": self.device_id, **self.changes}, default=json_default)
+        return self.encoded
+
+
+class Subscriber():
+    """One listener's queue of pending updates.
+
+    The queue holds at most max_pending updates. When a slow listener lets it fill up,
+    the queued updates are merged into one per device carrying the latest value of every
+    changed field. A lagging listener then skips intermediate states instead of holding
+    the server's memory, and still ends up with the current state.
+    """
+    def __init__(self, device_id=None, max_pending=32):
+        self.device_id = device_id
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.coalesced = 0
+
+    def push(self, update):
+        with self.condition:
+            if len(self.pending) >= self.max_pending:
+                self.coalesce()
+            self.pending.append(update)
+            self.condition.notify()
+
+    def coalesce(self):
+        merged = {}
+        for update in self.pending:
+            if update.device_id in merged:
+                merged[update.device_id].changes.update(update.changes)
+                merged[update.device_id].sequence = update.sequence
+            else:
+                merged[update.device_id] = LiveUpdate(update.sequence, update.device_id, dict(update.changes))
+        self.coalesced += len(self.pending) - len(merged)
+        self.pending = deque(sorted(merged.values(), key=lambda update: update.sequence))
+
+    def take(self, timeout=None):
+        # waits for updates; returns everything pending, [] on timeout or once closed
+        with self.condition:
+            if not self.pending and not self.closed:
+                self.condition.wait(timeout)
+            updates = list(self.pending)
+            self.pending.clear()
+            return updates
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+
+class LiveUpdates():
+    """Fan-out of per-device state changes to streaming subscribers.
+
+    publish() diffs a device's new state against the last one published and sends only the
+    changed fields, once, to every subscriber of that device (or of all devices). stream()
+    renders a subscriber as server-sent events: the current state first, then the deltas.
+    """
+    def __init__(self, max_pending=32, heartbeat=15.0):
+        self.max_pending = max_pending
+        self.heartbeat = heartbeat
+        self.states = {}
+        self.subscribers = set()
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def subscribe(self, device_id=None):
+        subscriber = Subscriber(device_id, self.max_pending)
+        with self.lock:
+            self.subscribers.add(subscriber)
+            # start from the current state so the deltas that follow apply to something
+            for state_device, state in self.states.items():
+                if device_id is None or state_device == device_id:
+                    subscriber.pending.append(LiveUpdate(self.sequence, state_device, dict(state)))
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+        subscriber.close()
+
+    def forget(self, device_id):
+        # drop a device's last published state; a later publish starts over with all its fields
+        with self.lock:
+            self.states.pop(device_id, None)
+
+    def publish(self, device_id, state):
+        with self.lock:
+            last = self.states.get(device_id, {})
+            changes = {key: value for key, value in state.items() if last.get(key, MISSING) != value}
+            if not changes:
+                return None
+            self.states[device_id] = dict(state)
+            self.sequence += 1
+            update = LiveUpdate(self.sequence, device_id, changes)
+            subscribers = [subscriber for subscriber in self.subscribers
+                           if subscriber.device_id is None or subscriber.device_id == device_id]
+        for subscriber in subscribers:
+            subscriber.push(update)
+        return update
+
+    def stream(self, subscriber):
+        # generator of server-sent event text; unsubscribes when the client goes away
+        try:
+            yield "retry: 2000\n\n"
+            while not subscriber.closed:
+                updates = subscriber.take(self.heartbeat)
+                if not updates:
+                    # comment line: keeps proxies from timing out an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                yield ''.join(f"id: {update.sequence}\nevent: update\ndata: {update.encode()}\n\n" for update in updates)
+        finally:
+            self.unsubscribe(subscriber)
@@ -1,11 +1,11 @@
 import datetime
 import sys
 import os
-import csv
 import numpy as np
 import pandas as pd
 
 from ephemeris_manager import EphemerisManager
+from raw_log_loader import load_log_records, load_raw_log
 
 parent_directory = os.path.split(os.getcwd())[0]
 ephemeris_data_directory = os.path.join(parent_directory, 'data')
@@ -15,54 +15,23 @@ sys.path.insert(0, parent_directory)
 # Get path to sample file in data directory, which is located in the parent directory of this notebook
 input_filepath = os.path.join(parent_directory,'Autonomous-Robotics-Ex0', 'data', 'gnss_log_2024_04_13_19_53_33.txt')
 
-with open(input_filepath) as csvfile:
-    reader = csv.reader(csvfile)
-    for row in reader:
-        if row[0][0] == '#':
-            if 'Fix' in row[0]:
-                android_fixes = [row[1:]]
-            elif 'Raw' in row[0]:
-                measurements = [row[1:]]
-        else:
-            if row[0] == 'Fix':
-                android_fixes.append(row[1:])
-            elif row[0] == 'Raw':
-                measurements.append(row[1:])
-
-# Print the first few rows of each dataframe
-# print(android_fixes[:5])
-# print(measurements[:5])
-
-# Convert lists to dataframes
-android_fixes = pd.DataFrame(android_fixes[1:], columns = android_fixes[0])
-measurements = pd.DataFrame(measurements[1:], columns = measurements[0])
+android_fixes = pd.DataFrame(load_log_records(input_filepath, 'Fix'))
+measurements = load_raw_log(input_filepath)
 
 # Format satellite IDs
-measurements.loc[measurements['Svid'].str.len() == 1, 'Svid'] = '0' + measurements['Svid']
-measurements.loc[measurements['ConstellationType'] == '1', 'Constellation'] = 'G'
-measurements.loc[measurements['ConstellationType'] == '3', 'Constellation'] = 'R'
+measurements['Svid'] = measurements['Svid'].map('{:02d}'.format)
+measurements.loc[measurements['ConstellationType'] == 1, 'Constellation'] = 'G'
+measurements.loc[measurements['ConstellationType'] == 3, 'Constellation'] = 'R'
 measurements['SvName'] = measurements['Constellation'] + measurements['Svid']
 
 # Remove all non-GPS measurements
 measurements = measurements.loc[measurements['Constellation'] == 'G']
 
-# Convert columns to numeric representation
-measurements['Cn0DbHz'] = pd.to_numeric(measurements['Cn0DbHz'])
-measurements['TimeNanos'] = pd.to_numeric(measurements['TimeNanos'])
-measurements['FullBiasNanos'] = pd.to_numeric(measurements['FullBiasNanos'])
-measurements['ReceivedSvTimeNanos']  = pd.to_numeric(measurements['ReceivedSvTimeNanos'])
-measurements['PseudorangeRateMetersPerSecond'] = pd.to_numeric(measurements['PseudorangeRateMetersPerSecond'])
-measurements['ReceivedSvTimeUncertaintyNanos'] = pd.to_numeric(measurements['ReceivedSvTimeUncertaintyNanos'])
-
 # A few measurement values are not provided by all phones
 # We'll check for them and initialize them with zeros if missing
-if 'BiasNanos' in measurements.columns:
-    measurements['BiasNanos'] = pd.to_numeric(measurements['BiasNanos'])
-else:
+if 'BiasNanos' not in measurements.columns:
     measurements['BiasNanos'] = 0
-if 'TimeOffsetNanos' in measurements.columns:
-    measurements['TimeOffsetNanos'] = pd.to_numeric(measurements['TimeOffsetNanos'])
-else:
+if 'TimeOffsetNanos' not in measurements.columns:
     measurements['TimeOffsetNanos'] = 0
 
 print(measurements.columns)
@@ -0,0 +1,82 @@
+import numpy as np
+from coordinates import azimuth_elevation
+from pseudorange_solver import PseudorangeSolver
+
+# android.location.GnssMeasurement state bits
+STATE_CODE_LOCK = 0x1
+STATE_TOW_DECODED = 0x8
+STATE_MSEC_AMBIGUOUS = 0x10
+STATE_GLO_TOD_DECODED = 0x80
+STATE_TOW_KNOWN = 0x4000
+STATE_GLO_TOD_KNOWN = 0x8000
+
+
+class MeasurementSelection():
+    def __init__(self, keep, weights, elevation, rejected):
+        # keep and weights are aligned with the measurement rows; rejected weights are 0
+        self.keep = keep
+        self.weights = weights
+        self.elevation = elevation
+        # reason -> number of rows it rejected (a row can fail several checks)
+        self.rejected = rejected
+
+
+class MeasurementSelector():
+    """Screens one or many epochs of measurements before they reach the solver.
+
+    Every check is a boolean mask over the measurement arrays:
+    - state: code lock and a resolved time of week (time of day for GLONASS), not millisecond ambiguous
+    - C/N0 at or above min_cn0 dB-Hz
+    - ReceivedSvTimeUncertaintyNanos at most max_time_uncertainty_nanos
+    - elevation at or above elevation_mask degrees, once a receiver position is known; a
+      satellite whose elevation cannot be computed from that position is rejected
+    Kept measurements are weighted by the C/N0 / reported uncertainty model scaled by
+    sin(elevation)^2, so low satellites count less even above the mask.
+    """
+    def __init__(self, elevation_mask=10.0, min_cn0=20.0, max_time_uncertainty_nanos=300.0):
+        self.elevation_mask = elevation_mask
+        self.min_cn0 = min_cn0
+        self.max_time_uncertainty_nanos = max_time_uncertainty_nanos
+
+    @staticmethod
+    def valid_state(state, constellation):
+        state = np.asarray(state)
+        glonass = np.asarray(constellation) == 'R'
+        time_known = np.where(glonass, state & (STATE_GLO_TOD_DECODED | STATE_GLO_TOD_KNOWN),
+                              state & (STATE_TOW_DECODED | STATE_TOW_KNOWN)) != 0
+        return ((state & STATE_CODE_LOCK) != 0) & time_known & ((state & STATE_MSEC_AMBIGUOUS) == 0)
+
+    def select(self, measurements, xs=None, receiver_xyz=None):
+        # measurements: formatDF rows; receiver_xyz is one position or one per row (NaN rows
+        # have no fix yet and skip the elevation mask)
+        n = len(measurements)
+        cn0 = measurements['Cn0DbHz'].to_numpy(dtype=np.float64)
+        uncertainty = measurements['ReceivedSvTimeUncertaintyNanos'].to_numpy(dtype=np.float64)
+        checks = {
+            'cn0': cn0 >= self.min_cn0,
+            'time uncertainty': ~(uncertainty > self.max_time_uncertainty_nanos),
+        }
+        if 'State' in measurements:
+            state = measurements['State'].to_numpy(dtype=np.float64)
+            known = np.isfinite(state)
+            checks['state'] = ~known | self.valid_state(np.where(known, state, 0).astype(np.int64),
+                                                         measurements['Constellation'].to_numpy())
+
+        elevation = np.full(n, np.nan)
+        if xs is not None and receiver_xyz is not None:
+            receiver_xyz = np.broadcast_to(np.asarray(receiver_xyz, dtype=np.float64), (n, 3))
+            _, elevation = azimuth_elevation(receiver_xyz, xs)
+            positioned = np.isfinite(receiver_xyz).all(axis=1)
+            computed = np.isfinite(elevation)
+            checks['elevation'] = ~computed | (elevation >= np.radians(self.elevation_mask))
+            # a fix but no elevation: the satellite position itself is not finite
+            checks['satellite position'] = computed | ~positioned
+
+        keep = np.logical_and.reduce(list(checks.values())) if checks else np.ones(n, dtype=bool)
+        weights = PseudorangeSolver.measurement_weights(cn0, uncertainty)
+        # sigma grows as 1/sin(elevation); no position yet leaves the weight as it is
+        sin_elevation = np.sin(np.maximum(elevation, np.radians(max(self.elevation_mask, 5.0))))
+        weights = weights * np.where(np.isfinite(elevation), sin_elevation ** 2, 1.0)
+        weights = np.where(keep, weights, 0.0)
+        rejected = {reason: int(n - passed.sum()) for reason, passed in checks.items() if not passed.all()}
+        return MeasurementSelection(keep, weights, elevation, rejected)
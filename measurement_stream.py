@@ -0,0 +1,166 @@
+from collections import deque
+import numpy as np
+import pandas as pd
+
+# Keys the Android app posts per measurement, with the dtype they are kept in.
+# Integer nanosecond counters stay int64 so they keep full precision; state is a float so
+# a measurement without one reads as NaN (unknown) instead of 0 (no lock).
+MEASUREMENT_FIELDS = {
+    'svid': np.int64,
+    'constellationType': np.int64,
+    'codeType': str,
+    'timeNanos': np.int64,
+    'biasNanos': np.float64,
+    'fullBiasNanos': np.int64,
+    'timeOffsetNanos': np.float64,
+    'receivedSvTimeNanos': np.int64,
+    'receivedSvTimeUncertaintyNanos': np.float64,
+    'state': np.float64,
+    'cn0DbHz': np.float64,
+    'pseudorangeRateMetersPerSecond': np.float64,
+    'pseudorangeRateUncertaintyMetersPerSecond': np.float64,
+    'accumulatedDeltaRangeState': np.int64,
+    'accumulatedDeltaRangeMeters': np.float64,
+    'accumulatedDeltaRangeUncertaintyMeters': np.float64,
+    'carrierFrequencyHz': np.float64,
+    'multipathIndicator': np.int64,
+}
+
+# Without these a measurement cannot be turned into a pseudorange at all
+REQUIRED_FIELDS = ['svid', 'constellationType', 'timeNanos', 'fullBiasNanos', 'receivedSvTimeNanos']
+
+# Binary batch (Content-Type BINARY_CONTENT_TYPE), little-endian with no padding:
+# a batch header, one header per epoch with the receiver clock fields, then every
+# epoch's satellite records back to back in epoch order
+BINARY_CONTENT_TYPE = 'application/vnd.gnss-measurements'
+BINARY_MAGIC = b'GNSM'
+BINARY_VERSION = 1
+BATCH_HEADER = np.dtype([('magic', 'S4'), ('version', '<u2'), ('epochs', '<u2')])
+EPOCH_HEADER = np.dtype([
+    ('timeNanos', '<i8'),
+    ('fullBiasNanos', '<i8'),
+    ('biasNanos', '<f8'),
+    ('count', '<u4'),
+])
+SATELLITE_RECORD = np.dtype([
+    ('svid', 'u1'),
+    ('constellationType', 'u1'),
+    ('codeType', 'S2'),
+    ('state', '<u4'),
+    ('accumulatedDeltaRangeState', '<u2'),
+    ('multipathIndicator', 'u1'),
+    ('receivedSvTimeNanos', '<i8'),
+    ('timeOffsetNanos', '<f8'),
+    ('receivedSvTimeUncertaintyNanos', '<f4'),
+    ('cn0DbHz', '<f4'),
+    ('pseudorangeRateMetersPerSecond', '<f8'),
+    ('pseudorangeRateUncertaintyMetersPerSecond', '<f4'),
+    ('accumulatedDeltaRangeMeters', '<f8'),
+    ('accumulatedDeltaRangeUncertaintyMeters', '<f4'),
+    ('carrierFrequencyHz', '<f8'),
+])
+
+
+def measurements_to_frame(measurements):
+    # JSON list of measurement dicts -> typed DataFrame, one column array per field
+    measurements = [m for m in measurements if isinstance(m, dict) and all(m.get(key) is not None for key in REQUIRED_FIELDS)]
+    columns = {}
+    for key, dtype in MEASUREMENT_FIELDS.items():
+        if dtype is str:
+            columns[key] = np.array([str(m.get(key) or '') for m in measurements], dtype=str)
+            continue
+        default = 0 if dtype is np.int64 else np.nan
+        values = (m.get(key) for m in measurements)
+        columns[key] = np.fromiter((default if value is None else value for value in values), dtype=dtype, count=len(measurements))
+    return pd.DataFrame(columns)
+
+
+def binary_to_frame(payload):
+    """Binary batch -> the same typed DataFrame as measurements_to_frame.
+
+    The headers and records are read in place with np.frombuffer; the only copies are the
+    DataFrame's own columns. Raises ValueError when the payload does not match the layout.
+    """
+    if len(payload) < BATCH_HEADER.itemsize:
+        raise ValueError("Truncated batch header")
+    header = np.frombuffer(payload, dtype=BATCH_HEADER, count=1)[0]
+    if header['magic'] != BINARY_MAGIC or header['version'] != BINARY_VERSION:
+        raise ValueError("Not a version %d measurement batch" % BINARY_VERSION)
+    epochs_size = int(header['epochs']) * EPOCH_HEADER.itemsize
+    if len(payload) < BATCH_HEADER.itemsize + epochs_size:
+        raise ValueError("Truncated epoch headers")
+    epochs = np.frombuffer(payload, dtype=EPOCH_HEADER, count=int(header['epochs']), offset=BATCH_HEADER.itemsize)
+    count = int(epochs['count'].sum())
+    if len(payload) != BATCH_HEADER.itemsize + epochs_size + count * SATELLITE_RECORD.itemsize:
+        raise ValueError("Batch size does not match its %d records" % count)
+    records = np.frombuffer(payload, dtype=SATELLITE_RECORD, count=count, offset=BATCH_HEADER.itemsize + epochs_size)
+
+    columns = {}
+    for key, dtype in MEASUREMENT_FIELDS.items():
+        if key in EPOCH_HEADER.names:
+            columns[key] = np.repeat(epochs[key], epochs['count']).astype(dtype)
+        elif dtype is str:
+            columns[key] = np.char.decode(records[key], 'ascii')
+        else:
+            columns[key] = records[key].astype(dtype)
+    return pd.DataFrame(columns)
+
+
+def frame_to_binary(measurements):
+    # Inverse of binary_to_frame, for clients and replays; rows of one epoch share its clock fields
+    epoch_nanos = measurements['timeNanos'].to_numpy() - measurements['fullBiasNanos'].to_numpy()
+    order = np.argsort(epoch_nanos, kind='stable')
+    starts = np.r_[0, np.flatnonzero(np.diff(epoch_nanos[order])) + 1]
+    records = np.zeros(len(measurements), dtype=SATELLITE_RECORD)
+    for key in SATELLITE_RECORD.names:
+        values = measurements[key].to_numpy()[order]
+        records[key] = np.char.encode(values.astype(str), 'ascii') if key == 'codeType' else values
+    epochs = np.zeros(len(starts), dtype=EPOCH_HEADER)
+    for key in ('timeNanos', 'fullBiasNanos', 'biasNanos'):
+        epochs[key] = measurements[key].to_numpy()[order][starts]
+    epochs['count'] = np.diff(np.r_[starts, len(measurements)])
+    header = np.array([(BINARY_MAGIC, BINARY_VERSION, len(epochs))], dtype=BATCH_HEADER)
+    return header.tobytes() + epochs.tobytes() + records.tobytes()
+
+
+def frame_record(measurements, row=-1):
+    # one row as a plain dict for JSON responses, missing values as None
+    record = measurements.iloc[[row]].to_dict('records')[0]
+    return {key: None if isinstance(value, float) and np.isnan(value) else value for key, value in record.items()}
+
+
+class EpochBuffer():
+    """Rolling window of the most recent epochs received from one device.
+
+    Epochs are keyed by receiver GPS time (timeNanos - fullBiasNanos), which keeps
+    increasing across app restarts. add() returns only the measurements of epochs newer
+    than anything seen before, so retransmitted or overlapping batches are not re-solved.
+    """
+    def __init__(self, max_epochs=30):
+        self.epochs = deque(maxlen=max_epochs)
+        self.last_epoch_nanos = None
+
+    def add(self, measurements):
+        if measurements.empty:
+            return measurements
+        epoch_nanos = measurements['timeNanos'].to_numpy() - measurements['fullBiasNanos'].to_numpy()
+        if self.last_epoch_nanos is not None:
+            is_new = epoch_nanos > self.last_epoch_nanos
+            measurements = measurements.loc[is_new]
+            epoch_nanos = epoch_nanos[is_new]
+        if measurements.empty:
+            return measurements.reset_index(drop=True)
+
+        order = np.argsort(epoch_nanos, kind='stable')
+        measurements = measurements.iloc[order].reset_index(drop=True)
+        epoch_nanos = epoch_nanos[order]
+        boundaries = np.flatnonzero(np.diff(epoch_nanos)) + 1
+        for start, stop in zip(np.r_[0, boundaries], np.r_[boundaries, len(epoch_nanos)]):
+            self.epochs.append((epoch_nanos[start], measurements.iloc[start:stop]))
+        self.last_epoch_nanos = epoch_nanos[-1]
+        return measurements
+
+    def recent(self):
+        if not self.epochs:
+            return pd.DataFrame()
+        return pd.concat([epoch for _, epoch in self.epochs], ignore_index=True)
@@ -0,0 +1,169 @@
+import functools
+import threading
+from bisect import bisect_left
+from time import perf_counter
+import numpy as np
+
+# Upper bounds (seconds) of the latency buckets: 50 us .. 10 s
+LATENCY_BUCKETS = (5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 12, 16, 20, 30, 40, 60)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'gnss_stage_seconds': ('histogram', "Time spent in each stage of the fix pipeline.", LATENCY_BUCKETS),
+    'gnss_solve_seconds': ('histogram', "Time of the position solve, by the constellations solved together.", LATENCY_BUCKETS),
+    'gnss_solver_iterations': ('histogram', "Gauss-Newton iterations per position solve.", COUNT_BUCKETS),
+    'gnss_fix_satellites': ('histogram', "Satellites used per fix, by constellation.", COUNT_BUCKETS),
+    'gnss_fixes_total': ('counter', "Processed batches, by outcome.", None),
+    'gnss_satellites_used_total': ('counter', "Satellite measurements used in fixes, by constellation.", None),
+    'gnss_satellites_excluded_total': ('counter', "Satellite measurements left out of fixes, by constellation and reason.", None),
+    'gnss_ephemeris_lookups_total': ('counter', "Ephemeris lookups, by whether a record was found.", None),
+    'gnss_orbit_cache_total': ('counter', "Orbit cache lookups, by whether the record's fitted table was cached.", None),
+    'gnss_ephemeris_file_cache_total': ('counter', "Nav file loads, by whether the parsed tables came from the disk cache.", None),
+}
+
+
+class Histogram():
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # one count per bucket plus the overflow (+Inf) bucket, not cumulative
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value, count=1):
+        self.counts[bisect_left(self.buckets, value)] += count
+        self.sum += value * count
+        self.count += count
+
+
+class MetricsRegistry():
+    """Counters and fixed-bucket histograms for the fix pipeline, labelled Prometheus style.
+
+    Recording is a dict lookup and a bisect under a lock, cheap enough to leave on in the
+    server and in batch runs. render() gives the Prometheus text format for /metrics;
+    collect() and merge() move the values between processes, e.g. from batch workers.
+    """
+    def __init__(self, metrics=METRICS):
+        self.metrics = metrics
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def observe(self, name, value, count=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.values.get(key)
+            if histogram is None:
+                histogram = self.values[key] = Histogram(self.metrics[name][2])
+            histogram.observe(value, count)
+
+    def time(self, stage, name='gnss_stage_seconds', **labels):
+        # with registry.time('formatDF'): ... observes the block's duration
+        return StageTimer(self, name, dict(labels, stage=stage) if stage is not None else labels)
+
+    def timed(self, stage):
+        # decorator form of time()
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.time(stage):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count_satellites(self, constellations, name='gnss_satellites_used_total', **labels):
+        # one increment per constellation for an array of per-measurement constellation letters
+        values, counts = np.unique(np.asarray(constellations, dtype=str), return_counts=True)
+        for value, count in zip(values, counts):
+            self.inc(name, int(count), constellation=value, **labels)
+
+    def observe_fix_satellites(self, constellations, epoch_index=None):
+        # satellites per fix and constellation; epoch_index maps measurements to fixes in batch solves
+        constellations = np.asarray(constellations, dtype=str)
+        epoch_index = np.zeros(len(constellations), dtype=np.int64) if epoch_index is None else np.asarray(epoch_index)
+        for constellation in np.unique(constellations):
+            per_fix = np.bincount(epoch_index[constellations == constellation])
+            values, counts = np.unique(per_fix[per_fix > 0], return_counts=True)
+            for value, count in zip(values, counts):
+                self.observe('gnss_fix_satellites', int(value), int(count), constellation=constellation)
+
+    def collect(self, reset=False):
+        # picklable copy of every value: counters as numbers, histograms as (counts, sum, count)
+        with self.lock:
+            values = {key: (list(value.counts), value.sum, value.count) if isinstance(value, Histogram) else value
+                      for key, value in self.values.items()}
+            if reset:
+                self.values = {}
+        return values
+
+    def merge(self, values):
+        with self.lock:
+            for key, value in values.items():
+                if not isinstance(value, tuple):
+                    self.values[key] = self.values.get(key, 0) + value
+                    continue
+                histogram = self.values.get(key)
+                if histogram is None:
+                    histogram = self.values[key] = Histogram(self.metrics[key[0]][2])
+                histogram.counts = [a + b for a, b in zip(histogram.counts, value[0])]
+                histogram.sum += value[1]
+                histogram.count += value[2]
+
+    def render(self):
+        values = self.collect()
+        lines = []
+        for name, (kind, help_text, buckets) in self.metrics.items():
+            series = sorted((key[1], value) for key, value in values.items() if key[0] == name)
+            if not series:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in series:
+                if kind != 'histogram':
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {total}")
+                lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def stage_summary(self):
+        # rows of (stage, calls, total seconds, mean milliseconds), slowest total first
+        rows = [(dict(key[1])['stage'], value[2], value[1], 1e3 * value[1] / value[2])
+                for key, value in self.collect().items() if key[0] == 'gnss_stage_seconds' and value[2]]
+        return sorted(rows, key=lambda row: -row[2])
+
+
+class StageTimer():
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, perf_counter() - self.start, **self.labels)
+        return False
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+# Process-wide registry the pipeline records into
+registry = MetricsRegistry()
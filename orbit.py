@@ -0,0 +1,114 @@
+import numpy as np
+
+EARTH_GRAVITY = 3.986005e14
+EARTH_ROTATION = 7.2921151467e-5
+RELATIVISTIC_CORRECTION = -4.442807633e-10
+HALF_WEEK = 302400
+
+# Broadcast ephemeris fields the orbit needs, as named in the parsed ephemeris tables
+ORBIT_FIELDS = ('t_oe', 't_oc', 'sqrtA', 'deltaN', 'M_0', 'e', 'omega', 'C_us', 'C_uc', 'C_rs', 'C_rc',
+                'C_is', 'C_ic', 'i_0', 'IDOT', 'Omega_0', 'OmegaDot', 'SVclockBias', 'SVclockDrift', 'SVclockDriftRate')
+
+
+def orbit_parameters(ephemeris):
+    # DataFrame, structured array or dict of columns -> dict of contiguous float64 arrays
+    return {field: np.ascontiguousarray(ephemeris[field], dtype=np.float64) for field in ORBIT_FIELDS}
+
+
+def week_seconds(seconds):
+    # time differences across a week rollover wrap into [-half week, half week)
+    return (seconds + HALF_WEEK) % (2 * HALF_WEEK) - HALF_WEEK
+
+
+def gps_transmit_time(ephemeris, satellite_time):
+    # Satellite clock reading -> GPS time of transmission, using the clock polynomial
+    # (the relativistic term and drift rate move it by well under a millimeter of orbit)
+    p = ephemeris if isinstance(ephemeris, dict) else orbit_parameters(ephemeris)
+    satellite_time = np.asarray(satellite_time, dtype=np.float64)
+    return satellite_time - (p['SVclockBias'] + p['SVclockDrift'] * week_seconds(satellite_time - p['t_oc']))
+
+
+def sagnac_rotation(xs, transit_time):
+    # ECEF positions at transmission -> the ECEF frame at reception: the Earth turns by
+    # omega * transit time while the signal is in flight. Works on any (..., 3) array.
+    theta = EARTH_ROTATION * np.asarray(transit_time)
+    cos_theta, sin_theta = np.cos(theta), np.sin(theta)
+    rotated = np.empty_like(xs)
+    rotated[..., 0] = cos_theta * xs[..., 0] + sin_theta * xs[..., 1]
+    rotated[..., 1] = cos_theta * xs[..., 1] - sin_theta * xs[..., 0]
+    rotated[..., 2] = xs[..., 2]
+    return rotated
+
+
+def solve_kepler(mean_anomaly, eccentricity, tolerance=1e-12, max_iterations=20):
+    # Newton iterations on E - e sin E = M until the largest correction is below tolerance
+    E = mean_anomaly.copy()
+    for _ in range(max_iterations):
+        step = (E - eccentricity * np.sin(E) - mean_anomaly) / (1 - eccentricity * np.cos(E))
+        E -= step
+        if not (np.abs(step) >= tolerance).any():
+            break
+    return E
+
+
+def satellite_positions(ephemeris, transmit_time, tolerance=1e-12, velocity=False):
+    """ECEF position and clock offset for each (ephemeris record, transmit time) row.
+
+    ephemeris holds one record per row (any of the forms orbit_parameters accepts) and
+    transmit_time the matching GPS time of week in seconds, so a single call can cover
+    many satellites over many epochs. Returns an (N, 4) array of x, y, z in meters and
+    the satellite clock offset in seconds, relativistic term included. With velocity the
+    array is (N, 8) and adds the analytic time derivatives: ECEF velocity in m/s and the
+    clock drift in s/s.
+    """
+    p = ephemeris if isinstance(ephemeris, dict) else orbit_parameters(ephemeris)
+    t = np.broadcast_to(np.asarray(transmit_time, dtype=np.float64), p['t_oe'].shape)
+    out = np.empty((len(t), 8 if velocity else 4))
+
+    tk = week_seconds(t - p['t_oe'])
+    A = p['sqrtA'] ** 2
+    n = np.sqrt(EARTH_GRAVITY / A ** 3) + p['deltaN']
+    e = p['e']
+    E = solve_kepler(p['M_0'] + n * tk, e, tolerance)
+    sinE, cosE = np.sin(E), np.cos(E)
+
+    dt_oc = week_seconds(t - p['t_oc'])
+    out[:, 3] = (p['SVclockBias'] + p['SVclockDrift'] * dt_oc + p['SVclockDriftRate'] * dt_oc ** 2
+                 + RELATIVISTIC_CORRECTION * e * p['sqrtA'] * sinE)
+
+    v = np.arctan2(np.sqrt(1 - e ** 2) * sinE, cosE - e)
+    phi = v + p['omega']
+    sin2phi, cos2phi = np.sin(2 * phi), np.cos(2 * phi)
+    u = phi + p['C_us'] * sin2phi + p['C_uc'] * cos2phi
+    r = A * (1 - e * cosE) + p['C_rs'] * sin2phi + p['C_rc'] * cos2phi
+    i = p['i_0'] + p['C_is'] * sin2phi + p['C_ic'] * cos2phi + p['IDOT'] * tk
+
+    x_orbit = r * np.cos(u)
+    y_orbit = r * np.sin(u)
+    Omega = p['Omega_0'] + (p['OmegaDot'] - EARTH_ROTATION) * tk - EARTH_ROTATION * p['t_oe']
+    sinOmega, cosOmega = np.sin(Omega), np.cos(Omega)
+    cos_i = np.cos(i)
+    sin_i = np.sin(i)
+    out[:, 0] = x_orbit * cosOmega - y_orbit * cos_i * sinOmega
+    out[:, 1] = x_orbit * sinOmega + y_orbit * cos_i * cosOmega
+    out[:, 2] = y_orbit * sin_i
+    if not velocity:
+        return out
+
+    # derivatives of the same model, chain rule through E, the argument of latitude and Omega
+    E_dot = n / (1 - e * cosE)
+    phi_dot = np.sqrt(1 - e ** 2) * E_dot / (1 - e * cosE)
+    u_dot = phi_dot * (1 + 2 * (p['C_us'] * cos2phi - p['C_uc'] * sin2phi))
+    r_dot = A * e * sinE * E_dot + 2 * phi_dot * (p['C_rs'] * cos2phi - p['C_rc'] * sin2phi)
+    i_dot = p['IDOT'] + 2 * phi_dot * (p['C_is'] * cos2phi - p['C_ic'] * sin2phi)
+    Omega_dot = p['OmegaDot'] - EARTH_ROTATION
+    x_orbit_dot = r_dot * np.cos(u) - y_orbit * u_dot
+    y_orbit_dot = r_dot * np.sin(u) + x_orbit * u_dot
+    out[:, 4] = (x_orbit_dot * cosOmega - y_orbit_dot * cos_i * sinOmega + y_orbit * sin_i * sinOmega * i_dot
+                 - out[:, 1] * Omega_dot)
+    out[:, 5] = (x_orbit_dot * sinOmega + y_orbit_dot * cos_i * cosOmega - y_orbit * sin_i * cosOmega * i_dot
+                 + out[:, 0] * Omega_dot)
+    out[:, 6] = y_orbit_dot * sin_i + y_orbit * cos_i * i_dot
+    out[:, 7] = (p['SVclockDrift'] + 2 * p['SVclockDriftRate'] * dt_oc
+                 + RELATIVISTIC_CORRECTION * e * p['sqrtA'] * cosE * E_dot)
+    return out
@@ -0,0 +1,108 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from orbit import ORBIT_FIELDS, orbit_parameters, satellite_positions, week_seconds
+from metrics import registry
+
+
+class OrbitCache():
+    """Polynomial interpolation of broadcast orbits, one fitted table per ephemeris record.
+
+    The first time a record is seen its orbit and clock are sampled at Chebyshev nodes over
+    window seconds either side of t_oe, in segment_seconds pieces, and fitted exactly. After
+    that a lookup is a short Horner evaluation per row instead of the full Kepler solution,
+    and velocity and clock drift come from the derivative of the same polynomials.
+    Tables are keyed by the record ids the ephemeris index hands out (satellite plus
+    reference time), so every device and epoch using the same broadcast issue shares one;
+    the least recently used are dropped beyond max_records. Times outside a record's window
+    fall back to the direct orbit.
+    """
+    def __init__(self, max_records=1024, window=7200.0, segment_seconds=600.0, degree=8):
+        self.max_records = max_records
+        self.window = window
+        self.segment_seconds = segment_seconds
+        self.degree = degree
+        self.num_segments = int(np.ceil(2 * window / segment_seconds))
+        self.nodes = np.cos(np.pi * (np.arange(degree + 1) + 0.5) / (degree + 1))
+        self.vandermonde = np.polynomial.polynomial.polyvander(self.nodes, degree)
+        self.tables = OrderedDict()
+        self.lock = threading.Lock()
+
+    def satellite_positions(self, ephemeris, transmit_time, records, velocity=False):
+        # same contract as orbit.satellite_positions: (N, 4) x, y, z, clock offset, or (N, 8)
+        # adding velocity and clock drift, with records giving each row's ephemeris record id
+        # (negative for none)
+        p = ephemeris if isinstance(ephemeris, dict) else orbit_parameters(ephemeris)
+        t = np.broadcast_to(np.asarray(transmit_time, dtype=np.float64), p['t_oe'].shape)
+        out = np.empty((len(t), 8 if velocity else 4))
+        if not len(t):
+            return out
+
+        offset = week_seconds(t - p['t_oe']) + self.window
+        records = np.asarray(records)
+        inside = (offset >= 0) & (offset < 2 * self.window) & (records >= 0)
+        if not inside.all():
+            outside = {field: values[~inside] for field, values in p.items()}
+            out[~inside] = satellite_positions(outside, t[~inside], velocity=velocity)
+            if not inside.any():
+                return out
+            p = {field: values[inside] for field, values in p.items()}
+            offset = offset[inside]
+            records = records[inside]
+
+        inverse, keys = pd.factorize(records)
+        first = np.empty(len(keys), dtype=np.int64)
+        first[inverse[::-1]] = np.arange(len(inverse) - 1, -1, -1)
+        # (degree + 1, records * segments, 4) so each Horner step gathers contiguous rows
+        coefficients = np.concatenate(self.coefficients(keys, p, first), axis=1)
+
+        segment = (offset * (1 / self.segment_seconds)).astype(np.int64)
+        np.minimum(segment, self.num_segments - 1, out=segment)
+        rows = inverse * self.num_segments + segment
+        tau = ((offset - segment * self.segment_seconds) * (2 / self.segment_seconds) - 1)[:, None]
+        result = coefficients[self.degree].take(rows, axis=0)
+        derivative = np.zeros_like(result)
+        for k in range(self.degree - 1, -1, -1):
+            if velocity:
+                derivative *= tau
+                derivative += result
+            result *= tau
+            result += coefficients[k].take(rows, axis=0)
+        if velocity:
+            # d/dt = d/dtau * dtau/dt
+            derivative *= 2 / self.segment_seconds
+            result = np.hstack([result, derivative])
+        out[inside] = result
+        return out
+
+    def coefficients(self, keys, p, first):
+        keys = list(keys)
+        with self.lock:
+            tables = [self.tables.get(key) for key in keys]
+            for key, table in zip(keys, tables):
+                if table is not None:
+                    self.tables.move_to_end(key)
+
+        missing = [i for i, table in enumerate(tables) if table is None]
+        registry.inc('gnss_orbit_cache_total', len(keys) - len(missing), result='hit')
+        registry.inc('gnss_orbit_cache_total', len(missing), result='miss')
+        if missing:
+            for i in missing:
+                tables[i] = self.fit([p[field][first[i]] for field in ORBIT_FIELDS])
+            with self.lock:
+                for i in missing:
+                    self.tables[keys[i]] = tables[i]
+                while len(self.tables) > self.max_records:
+                    self.tables.popitem(last=False)
+        return tables
+
+    def fit(self, record):
+        # (degree + 1, segments, 4) polynomial coefficients of x, y, z and clock offset in the
+        # segment's normalized time, interpolated at Chebyshev nodes to keep the fit well conditioned
+        starts = np.arange(self.num_segments) * self.segment_seconds
+        offsets = starts[:, None] + (self.nodes + 1) / 2 * self.segment_seconds
+        params = {field: np.full(offsets.size, value) for field, value in zip(ORBIT_FIELDS, record)}
+        samples = satellite_positions(params, params['t_oe'] + offsets.ravel() - self.window)
+        samples = samples.reshape(self.num_segments, self.degree + 1, 4)
+        return np.linalg.solve(self.vandermonde, samples).transpose(1, 0, 2).copy()
@@ -2,6 +2,7 @@ import pygame
 import requests
 import time
 import json
+import threading
 
 # Initialize pygame
 pygame.init()
@@ -22,17 +23,41 @@ title_color = (255, 255, 255)
 header_color = (100, 200, 255)
 text_color = (200, 200, 200)
 
-# Function to fetch data from the server
-def fetch_data():
-    try:
-        response = requests.get('http://127.0.0.1:2121/latest_data')
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return None
-    except Exception as e:
-        print(f"Error fetching data: {e}")
-        return None
+STREAM_URL = 'http://127.0.0.1:2121/stream'
+
+# State of each device as pushed by the server: a full state when connecting, then only changed fields
+devices = {}
+latest_device = None
+devices_lock = threading.Lock()
+
+def read_events(response):
+    # server-sent events: "data:" lines up to a blank line; comments and other fields are skipped
+    data = []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if line == "":
+            if data:
+                yield json.loads("\n".join(data))
+            data = []
+        elif line.startswith("data:"):
+            data.append(line[5:].lstrip())
+
+def listen():
+    global latest_device
+    while True:
+        try:
+            with requests.get(STREAM_URL, stream=True, timeout=(5, 60)) as response:
+                for update in read_events(response):
+                    with devices_lock:
+                        devices.setdefault(update["device_id"], {}).update(update)
+                        latest_device = update["device_id"]
+        except Exception as e:
+            print(f"Error reading stream: {e}")
+        # reconnect; the server starts every new stream with the full state
+        time.sleep(2)
+
+threading.Thread(target=listen, daemon=True).start()
 
 # Function to render text with word wrap
 def render_textrect(string, font, rect, text_color, bg_color, justification=0):
@@ -78,6 +103,8 @@ running = True
 last_measurement = None
 last_position = None
 
+clock = pygame.time.Clock()
+
 # Scroll variables
 scroll_y = 0
 scroll_speed = 20
@@ -92,8 +119,9 @@ while running:
             elif event.button == 5:  # Scroll down
                 scroll_y += scroll_speed
 
-    # Fetch the latest data
-    data = fetch_data()
+    # Show the device that was updated last
+    with devices_lock:
+        data = dict(devices.get(latest_device, {}))
     if data:
         last_measurement = data.get("measurement")
         last_position = data.get("position")
@@ -138,7 +166,7 @@ while running:
     # Update the display
     pygame.display.flip()
 
-    # Wait before fetching data again
-    time.sleep(10)
+    # Updates arrive in the background; redraw at a steady rate
+    clock.tick(30)
 
 pygame.quit()
@@ -0,0 +1,273 @@
+import numpy as np
+from coordinates import ecef_to_geodetic, enu_rotation
+from orbit import sagnac_rotation
+
+LIGHTSPEED = 2.99792458e8
+
+
+class PseudorangeSolution():
+    def __init__(self, position, clock_biases, covariance, dop, residuals, cost, iterations, H=None, weights=None):
+        self.position = position
+        # receiver clock bias in meters per system label; clock_bias is the first one
+        self.clock_biases = clock_biases
+        self.clock_bias = next(iter(clock_biases.values()))
+        self.covariance = covariance
+        self.dop = dop
+        self.residuals = residuals
+        self.cost = cost
+        self.iterations = iterations
+        # final design matrix and weights, for integrity checks on the same geometry
+        self.H = H
+        self.weights = weights
+
+
+class VelocitySolution():
+    def __init__(self, velocity, clock_drift, covariance, residuals):
+        # ECEF velocity and receiver clock drift, both in m/s
+        self.velocity = velocity
+        self.clock_drift = clock_drift
+        self.covariance = covariance
+        self.residuals = residuals
+
+
+class PseudorangeSolver():
+    """Weighted Gauss-Newton pseudorange solver with an analytic line-of-sight Jacobian.
+
+    A solver remembers its last solution; when one is available the next solve starts from
+    it and runs a fixed number of iterations (warm_iterations) without convergence checks.
+    If the last of those steps is still large the solve carries on as a cold one would.
+
+    Satellite positions are given at transmission; with earth_rotation each iteration turns
+    them into the reception-time frame using the transit time implied by the current
+    position, so the Sagnac correction converges together with the fix.
+    """
+    def __init__(self, max_iterations=10, tolerance=1e-4, warm_iterations=3, warm_step_limit=1.0, earth_rotation=True):
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+        self.warm_iterations = warm_iterations
+        self.warm_step_limit = warm_step_limit
+        self.earth_rotation = earth_rotation
+        self.previous = None
+
+    @staticmethod
+    def measurement_weights(cn0=None, uncertainty_nanos=None, floor_meters=0.5):
+        # 1/sigma^2 per measurement: the receiver's own time uncertainty when it reports one,
+        # otherwise a C/N0 model (sigma grows as the signal gets weaker)
+        sigma = None
+        if uncertainty_nanos is not None:
+            sigma = LIGHTSPEED * 1e-9 * np.asarray(uncertainty_nanos, dtype=np.float64)
+        if cn0 is not None:
+            cn0_sigma = np.sqrt(0.3 ** 2 + 2000.0 * 10 ** (-np.asarray(cn0, dtype=np.float64) / 10))
+            sigma = cn0_sigma if sigma is None else np.where(np.isfinite(sigma) & (sigma > 0), sigma, cn0_sigma)
+        if sigma is None:
+            return None
+        sigma = np.maximum(np.nan_to_num(sigma, nan=30.0), floor_meters)
+        return 1 / sigma ** 2
+
+    @staticmethod
+    def rate_weights(uncertainty=None, count=None, default_sigma=0.5, floor=0.05):
+        # 1/sigma^2 per pseudorange rate from the reported uncertainty (m/s)
+        if uncertainty is None:
+            return np.full(count, 1 / default_sigma ** 2)
+        sigma = np.nan_to_num(np.asarray(uncertainty, dtype=np.float64), nan=default_sigma)
+        return 1 / np.maximum(sigma, floor) ** 2
+
+    @staticmethod
+    def solve_velocity(H, sat_velocity, pseudorange_rate, weights=None):
+        """Receiver velocity and clock drift from Doppler, on the geometry of a position fix.
+
+        H is the fix's design matrix, whose first three columns are the negated unit lines of
+        sight, so the rate model rate - v_sat . u = H[:, :3] . v + drift is linear and needs
+        one 4x4 solve. pseudorange_rate must already include the satellite clock drift.
+        Rows with a NaN rate are left out; returns None with fewer than four usable rows.
+        """
+        H = np.asarray(H, dtype=np.float64)
+        unit = -H[:, :3]
+        y = np.asarray(pseudorange_rate, dtype=np.float64) - np.einsum('ij,ij->i', np.asarray(sat_velocity, dtype=np.float64), unit)
+        weights = np.ones(len(y)) if weights is None else np.asarray(weights, dtype=np.float64)
+        usable = np.isfinite(y) & (weights > 0)
+        if usable.sum() < 4:
+            return None
+        G = np.column_stack((H[usable, :3], np.ones(usable.sum())))
+        covariance = np.linalg.inv(G.T @ (weights[usable, None] * G))
+        state = covariance @ (G.T @ (weights[usable] * y[usable]))
+        residuals = np.full(len(y), np.nan)
+        residuals[usable] = y[usable] - G @ state
+        return VelocitySolution(state[:3], float(state[3]), covariance, residuals)
+
+    def solve_velocity_batch(self, xs, positions, sat_velocity, pseudorange_rate, epoch_index, weights=None):
+        # Batch counterpart of solve_velocity: rows sorted by epoch_index, positions one per epoch.
+        # Returns (epochs, 3) velocities and (epochs,) clock drifts, NaN where fewer than 4 rates.
+        epoch_index = np.asarray(epoch_index)
+        num_epochs = epoch_index.max() + 1 if len(epoch_index) else 0
+        receiver = np.asarray(positions, dtype=np.float64)[epoch_index]
+        xs = np.asarray(xs, dtype=np.float64)
+        if self.earth_rotation:
+            xs = sagnac_rotation(xs, np.linalg.norm(xs - receiver, axis=1) / LIGHTSPEED)
+        line_of_sight = xs - receiver
+        unit = line_of_sight / np.linalg.norm(line_of_sight, axis=1)[:, None]
+        y = np.asarray(pseudorange_rate, dtype=np.float64) - np.einsum('ij,ij->i', np.asarray(sat_velocity, dtype=np.float64), unit)
+        weights = np.ones(len(y)) if weights is None else np.asarray(weights, dtype=np.float64)
+        weights = np.where(np.isfinite(y) & np.isfinite(unit[:, 0]), weights, 0.0)
+        y = np.where(weights > 0, y, 0.0)
+        G = np.column_stack((-np.nan_to_num(unit), np.ones(len(y))))
+
+        normal = np.zeros((num_epochs, 4, 4))
+        gradient = np.zeros((num_epochs, 4))
+        np.add.at(normal, epoch_index, weights[:, None, None] * G[:, :, None] * G[:, None, :])
+        np.add.at(gradient, epoch_index, (weights * y)[:, None] * G)
+        solvable = np.bincount(epoch_index, weights=weights > 0, minlength=num_epochs) >= 4
+        normal[~solvable] = np.eye(4)
+        state = np.linalg.solve(normal, gradient[..., None])[..., 0]
+        state[~solvable] = np.nan
+        return state[:, :3], state[:, 3]
+
+    @staticmethod
+    def linearize(state, xs, measured_pseudorange, system_index, earth_rotation=True):
+        # State is [x, y, z, one clock bias per system]; each row sees its own system's bias
+        if earth_rotation:
+            xs = sagnac_rotation(xs, np.linalg.norm(xs - state[:3], axis=1) / LIGHTSPEED)
+        line_of_sight = xs - state[:3]
+        ranges = np.linalg.norm(line_of_sight, axis=1)
+        H = np.zeros((len(xs), len(state)))
+        H[:, :3] = -line_of_sight / ranges[:, None]
+        H[np.arange(len(xs)), 3 + system_index] = 1.0
+        return H, measured_pseudorange - (ranges + state[3 + system_index])
+
+    def solve(self, xs, measured_pseudorange, weights=None, x0=None, b0=None, iterations=None, systems=None):
+        # systems labels each row with its constellation; each label gets its own clock bias state
+        # (inter-system bias), so all constellations share one position solve
+        xs = np.asarray(xs, dtype=np.float64)
+        measured_pseudorange = np.asarray(measured_pseudorange, dtype=np.float64)
+        weights = np.ones(len(xs)) if weights is None else np.asarray(weights, dtype=np.float64)
+        if systems is None:
+            labels, system_index = [None], np.zeros(len(xs), dtype=int)
+        else:
+            labels, system_index = np.unique(np.asarray(systems), return_inverse=True)
+            labels = labels.tolist()
+        if len(xs) < 3 + len(labels):
+            raise np.linalg.LinAlgError(f"{len(xs)} satellites cannot fix position and {len(labels)} clock biases")
+
+        state = np.zeros(3 + len(labels))
+        warm = x0 is None and self.previous is not None
+        if warm:
+            position, biases = self.previous
+            state[:3] = position
+            fallback = np.median(list(biases.values()))
+            state[3:] = [biases.get(label, fallback) for label in labels]
+        elif x0 is not None:
+            state[:3] = x0
+        if b0 is not None:
+            state[3:] = b0
+
+        if iterations is None and warm:
+            iterations = self.warm_iterations
+        fixed = iterations is not None
+
+        count = 0
+        step = np.full(len(state), np.inf)
+        while count < (iterations if fixed else self.max_iterations):
+            H, residuals = PseudorangeSolver.linearize(state, xs, measured_pseudorange, system_index, self.earth_rotation)
+            normal = H.T @ (weights[:, None] * H)
+            step = np.linalg.solve(normal, H.T @ (weights * residuals))
+            state += step
+            count += 1
+            if not fixed and np.abs(step).max() < self.tolerance:
+                break
+            if fixed and count == iterations and warm and not np.abs(step).max() <= self.warm_step_limit:
+                # warm start was too far off (first fix after a gap, a jump, ...): keep iterating
+                fixed = False
+
+        if not np.all(np.isfinite(state)):
+            # a NaN input row poisons the whole state; never keep it as the next warm start
+            raise np.linalg.LinAlgError("solve did not produce a finite state")
+        H, residuals = PseudorangeSolver.linearize(state, xs, measured_pseudorange, system_index, self.earth_rotation)
+        covariance = np.linalg.inv(H.T @ (weights[:, None] * H))
+        biases = dict(zip(labels, state[3:].tolist()))
+        self.previous = (state[:3].copy(), biases)
+        return PseudorangeSolution(state[:3].copy(), biases, covariance, PseudorangeSolver.dop(H, state[:3], labels),
+                                   residuals, 0.5 * np.sum(weights * residuals ** 2), count, H, weights)
+
+    @staticmethod
+    def dop(H, position, labels=None):
+        # H has one clock column per system: GDOP covers all of them, TDOP is the first
+        # system's and, with labels, TDOP_<label> gives each system's own
+        Q = np.linalg.inv(H.T @ H)
+        lat, lon, _ = ecef_to_geodetic(position)
+        R = enu_rotation(lat, lon)
+        Q_enu = R @ Q[:3, :3] @ R.T
+        dop = {
+            'GDOP': float(np.sqrt(np.trace(Q))),
+            'PDOP': float(np.sqrt(np.trace(Q[:3, :3]))),
+            'HDOP': float(np.sqrt(Q_enu[0, 0] + Q_enu[1, 1])),
+            'VDOP': float(np.sqrt(Q_enu[2, 2])),
+            'TDOP': float(np.sqrt(Q[3, 3])),
+        }
+        for i, label in enumerate(labels or ()):
+            if label is not None:
+                dop[f'TDOP_{label}'] = float(np.sqrt(Q[3 + i, 3 + i]))
+        return dop
+
+    def solve_batch(self, xs, measured_pseudorange, epoch_index, weights=None, x0=None, b0=0, systems=None):
+        # All epochs at once. Rows are padded into (epochs, max_sats) blocks so every
+        # iteration is a handful of array ops plus one batched normal-equation solve.
+        # Returns biases as (epochs,) for a single system, (epochs, systems) when systems is given.
+        epoch_index = np.asarray(epoch_index)
+        num_epochs = epoch_index.max() + 1 if len(epoch_index) else 0
+        counts = np.bincount(epoch_index, minlength=num_epochs)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        order = np.argsort(epoch_index, kind='stable')
+        slot = np.arange(len(order)) - starts[epoch_index[order]]
+        weights = np.ones(len(epoch_index)) if weights is None else np.asarray(weights, dtype=np.float64)
+        if systems is None:
+            num_systems, system_index = 1, np.zeros(len(epoch_index), dtype=int)
+        else:
+            labels, system_index = np.unique(np.asarray(systems), return_inverse=True)
+            num_systems = len(labels)
+
+        sat_xyz = np.zeros((num_epochs, counts.max(initial=0), 3))
+        pseudorange = np.zeros((num_epochs, counts.max(initial=0)))
+        mask = np.zeros((num_epochs, counts.max(initial=0)))
+        clock_columns = np.zeros((num_epochs, counts.max(initial=0), num_systems))
+        sat_xyz[epoch_index[order], slot] = xs[order]
+        pseudorange[epoch_index[order], slot] = measured_pseudorange[order]
+        mask[epoch_index[order], slot] = weights[order]
+        clock_columns[epoch_index[order], slot, system_index[order]] = 1.0
+
+        # a system with no satellites in an epoch keeps its bias pinned instead of making the system singular
+        present = clock_columns.any(axis=1)
+        solvable = counts >= 3 + present.sum(axis=1)
+        state = np.zeros((num_epochs, 3 + num_systems))
+        if x0 is not None:
+            state[:, :3] = x0
+        state[:, 3:] = b0
+        pin = np.zeros((num_epochs, 3 + num_systems, 3 + num_systems))
+        pin[:, np.arange(3, 3 + num_systems), np.arange(3, 3 + num_systems)] = ~present
+
+        for _ in range(self.max_iterations):
+            line_of_sight = self.line_of_sight(sat_xyz, state)
+            ranges = np.linalg.norm(line_of_sight, axis=2)
+            ranges[mask == 0] = 1.0
+            residuals = pseudorange - (ranges + np.einsum('eks,es->ek', clock_columns, state[:, 3:]))
+            H = np.concatenate((-line_of_sight / ranges[..., None], clock_columns), axis=2)
+            normal = np.einsum('eki,ek,ekj->eij', H, mask, H) + pin
+            normal[~solvable] = np.eye(3 + num_systems)
+            gradient = np.einsum('eki,ek->ei', H, mask * residuals)
+            step = np.linalg.solve(normal, gradient[..., None])[..., 0]
+            state[solvable] += step[solvable]
+            if np.abs(step[solvable]).max(initial=0) < self.tolerance:
+                break
+
+        line_of_sight = self.line_of_sight(sat_xyz, state)
+        residuals = pseudorange - (np.linalg.norm(line_of_sight, axis=2) + np.einsum('eks,es->ek', clock_columns, state[:, 3:]))
+        cost = 0.5 * np.sum(mask * residuals ** 2, axis=1)
+        state[~solvable] = np.nan
+        cost[~solvable] = np.nan
+        biases = state[:, 3] if systems is None else state[:, 3:]
+        return state[:, :3], biases, cost
+
+    def line_of_sight(self, sat_xyz, state):
+        # (epochs, sats, 3) receiver-to-satellite vectors, Sagnac-rotated per row when enabled
+        if self.earth_rotation:
+            sat_xyz = sagnac_rotation(sat_xyz, np.linalg.norm(sat_xyz - state[:, None, :3], axis=2) / LIGHTSPEED)
+        return sat_xyz - state[:, None, :3]
@@ -0,0 +1,116 @@
+import io
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+# Column types for the GnssLogger "Raw" section. Anything not listed is read as float64.
+RAW_INT_COLUMNS = ['utcTimeMillis', 'TimeNanos', 'LeapSecond', 'FullBiasNanos', 'HardwareClockDiscontinuityCount', 'Svid',
+                   'State', 'ReceivedSvTimeNanos', 'ReceivedSvTimeUncertaintyNanos', 'AccumulatedDeltaRangeState',
+                   'MultipathIndicator', 'ConstellationType', 'ChipsetElapsedRealtimeNanos']
+RAW_FLOAT32_COLUMNS = ['Cn0DbHz', 'BasebandCn0DbHz']
+RAW_STRING_COLUMNS = ['CodeType']
+
+CHUNK_LINES = 100000
+
+
+def sidecar_path(filepath, section='Raw'):
+    return f"{filepath}.{section.lower()}.npy"
+
+
+def load_raw_log(filepath, use_sidecar=True):
+    records = load_log_records(filepath, 'Raw', use_sidecar)
+    return pd.DataFrame({name: records[name] for name in records.dtype.names})
+
+
+def load_log_records(filepath, section='Raw', use_sidecar=True):
+    """Return one section of a GnssLogger text log as a structured NumPy array.
+
+    The first read writes a .npy sidecar next to the log; later reads memory-map it
+    as long as it is newer than the log itself. Where the sidecar cannot be written the
+    parsed array is returned as is.
+    """
+    cache_file = sidecar_path(filepath, section)
+    if use_sidecar and os.path.exists(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(filepath):
+        return np.load(cache_file, mmap_mode='r')
+
+    records = parse_log_section(filepath, section)
+    if not use_sidecar:
+        return records
+    try:
+        write_sidecar(cache_file, records)
+    except OSError:
+        # read-only log directory: keep the parsed records in memory
+        return records
+    return np.load(cache_file, mmap_mode='r')
+
+
+def write_sidecar(cache_file, records):
+    # written next to the final name and moved into place, so a reader (or a replay worker
+    # racing on the same log) never maps a half-written file
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(cache_file)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, records)
+        os.replace(temporary, cache_file)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def parse_log_section(filepath, section='Raw'):
+    prefix = section + ','
+    header_prefix = '# ' + prefix
+    header = None
+    chunks = []
+    lines = []
+    with open(filepath) as f:
+        for line in f:
+            if line.startswith(prefix):
+                lines.append(line[len(prefix):])
+                if len(lines) >= CHUNK_LINES:
+                    chunks.append(_parse_chunk(lines, header, filepath, section))
+                    lines = []
+            elif header is None and line.startswith(header_prefix):
+                header = line[len(header_prefix):].strip().split(',')
+    if lines or not chunks:
+        chunks.append(_parse_chunk(lines, header, filepath, section))
+
+    return _to_records(pd.concat(chunks, ignore_index=True))
+
+
+def _parse_chunk(lines, header, filepath, section):
+    if header is None:
+        raise ValueError(f"No '{section}' header found in {filepath}")
+    dtypes = {}
+    for column in header:
+        if column in RAW_INT_COLUMNS:
+            dtypes[column] = 'Int64'
+        elif column in RAW_FLOAT32_COLUMNS:
+            dtypes[column] = np.float32
+        elif column in RAW_STRING_COLUMNS:
+            dtypes[column] = str
+    return pd.read_csv(io.StringIO(''.join(lines)), names=header, dtype=dtypes, keep_default_na=True)
+
+
+def _to_records(chunk):
+    columns = {}
+    for name in chunk.columns:
+        values = chunk[name]
+        if isinstance(values.dtype, pd.Int64Dtype):
+            # Integers stay exact int64 unless the phone left the field empty somewhere
+            if values.isna().any():
+                columns[name] = values.to_numpy(dtype=np.float64, na_value=np.nan)
+            else:
+                columns[name] = values.to_numpy(dtype=np.int64)
+        elif values.dtype == object:
+            values = values.fillna('').astype(str)
+            width = int(values.str.len().max()) if len(values) else 1
+            columns[name] = values.to_numpy(dtype=f"U{max(width, 1)}")
+        else:
+            columns[name] = values.to_numpy()
+
+    records = np.empty(len(chunk), dtype=[(name, column.dtype) for name, column in columns.items()])
+    for name, column in columns.items():
+        records[name] = column
+    return records
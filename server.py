@@ -1,10 +1,15 @@
-from flask import Flask, request, jsonify
-import csv
+from flask import Flask, Response, request, jsonify, stream_with_context
+import argparse
 import os
 from datetime import datetime
 from Parser import Parser
 from ephemeris_manager import EphemerisManager
-import navpy
+from measurement_stream import BINARY_CONTENT_TYPE, binary_to_frame, frame_record, measurements_to_frame
+from device_session import SessionStore
+from live_updates import LiveUpdates
+from coordinates import ecef_to_lla, speed_and_heading
+from pseudorange_solver import PseudorangeSolver
+from metrics import registry
 import numpy as np
 import warnings
 
@@ -16,124 +21,247 @@ data_directory = os.path.join(os.getcwd(), 'data')
 if not os.path.exists(data_directory):
     os.makedirs(data_directory)
 
-data_file = os.path.join(data_directory, 'gnss_data.csv')
-fields = ['svid', 'codeType', 'timeNanos', 'biasNanos', 'constellationType', 'svid', 
-          'accumulatedDeltaRangeState', 'receivedSvTimeNanos', 'pseudorangeRateUncertaintyMetersPerSecond', 
-          'accumulatedDeltaRangeMeters', 'accumulatedDeltaRangeUncertaintyMeters', 'carrierFrequencyHz', 
-          'receivedSvTimeUncertaintyNanos', 'cn0DbHz', 'fullBiasNanos', 'multipathIndicator', 'timeOffsetNanos', 'state', 'pseudorangeRateMetersPerSecond']
-
-# Global variables to store the latest data
-latest_measurement = None
-latest_position = None
-latest_spoofed_sats = None
-all_positions = None
-
-# very much not ideal, (e.g. race conditions), but reading every time anew takes too long
+# each processed batch is pushed, as the fields that changed, to /stream subscribers
+live_updates = LiveUpdates()
+# Per-device state; the ephemeris store is shared by all devices and only swapped, never mutated, by refreshes
+sessions = SessionStore(on_evict=live_updates.forget)
 ephemerisManager = None
+parser = None
+# below this ground speed (m/s) no heading is reported
+MIN_HEADING_SPEED = 0.5
+
+def device_id():
+    # clients should send X-Device-Id; the address fallback puts every device behind one NAT in one session
+    return request.headers.get('X-Device-Id') or request.args.get('device_id') or request.remote_addr
 
 @app.route('/latest_data', methods=['GET'])
 def latest_data():
-    return jsonify({
-        "measurement": latest_measurement,
-        "position": latest_position,
-        "all_positions": all_positions,
-        "spoofed_satellites": latest_spoofed_sats
-    })
+    requested = request.args.get('device_id')
+    session = sessions.get(requested) if requested else sessions.latest()
+    if session is None:
+        return jsonify({
+            "measurement": None,
+            "position": None,
+            "velocity": None,
+            "speed": None,
+            "heading": None,
+            "all_positions": None,
+            "spoofed_satellites": None,
+            "alerts": None
+        })
+    return jsonify(session.snapshot())
+
+@app.route('/stream', methods=['GET'])
+def stream():
+    # Server-sent events: the current state of the device (or of every device without
+    # device_id), then only the fields that change, as soon as each batch is processed
+    subscriber = live_updates.subscribe(request.args.get('device_id'))
+    return Response(stream_with_context(live_updates.stream(subscriber)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus text format: per-stage latency histograms, solver and satellite counts, cache hit counters
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/gnssdata', methods=['POST'])
 def receive_gnss_data():
-    global latest_measurement, latest_position, latest_spoofed_sats, all_positions
-    measurements = request.get_json()
-    print("Received GNSS measurements:", measurements)
-    
-    if not measurements:
+    if request.mimetype == BINARY_CONTENT_TYPE:
+        # compact batches are read straight into column arrays, no per-measurement objects
+        try:
+            with registry.time('decode'):
+                measurements = binary_to_frame(request.get_data())
+        except ValueError as e:
+            print(f"Error: {e}")
+            registry.inc('gnss_fixes_total', status='invalid')
+            return jsonify({"status": "failure", "error": str(e)}), 400
+        print(f"Received {len(measurements)} GNSS measurements (binary)")
+        latest_measurement = frame_record(measurements) if not measurements.empty else None
+    else:
+        received = request.get_json()
+        print("Received GNSS measurements:", received)
+        try:
+            if not isinstance(received, list):
+                raise ValueError("Expected a list of measurements")
+            with registry.time('decode'):
+                measurements = measurements_to_frame(received)
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Error: {e}")
+            registry.inc('gnss_fixes_total', status='invalid')
+            return jsonify({"status": "failure", "error": str(e)}), 400
+        latest_measurement = received[-1] if received else None
+
+    if measurements is None or measurements.empty:
         return jsonify({"status": "failure", "error": "No measurements received"}), 400
-    
-    latest_measurement = measurements[-1] if measurements else None
-
-    with open(data_file, 'w', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fields)
-        writer.writeheader()
-        for measurement in measurements:
-            filtered_measurement = {key: measurement.get(key, None) for key in fields}
-            writer.writerow(filtered_measurement)
-    
-    parser = Parser(data_directory)
-    parser.manager = ephemerisManager
-
-    measurements = parser.open_file(data_file)
-    measurements = parser.formatDF(measurements)
-    
+
+    session = sessions.get_or_create(device_id())
+    # Solved in the request's own thread: batches of one device wait for each other, which keeps
+    # its epochs in order, while other devices' requests run alongside
+    with session.lock:
+        response, status = process_measurements(session, measurements, latest_measurement)
+    return jsonify(response), status
+
+def process_measurements(session, measurements, latest_measurement):
+    # runs with session.lock held by the posting request
+    session.latest_measurement = latest_measurement
+    sessions.touch(session)
+    measurements = session.buffer.add(measurements)
+    if measurements.empty:
+        registry.inc('gnss_fixes_total', status='duplicate')
+        return {"status": "duplicate", "error": "No new epochs in batch"}, 200
+    with registry.time('fix'):
+        result = solve_measurements(session, measurements)
+    registry.inc('gnss_fixes_total', status=result[0]['status'])
+    # still under the device lock, so subscribers see its updates in order
+    live_updates.publish(session.device_id, session.snapshot())
+    return result
+
+def enough_satellites(epoch):
+    # three position states plus one clock bias per constellation
+    return len(epoch) >= 3 + epoch['Constellation'].nunique()
+
+def solve_measurements(session, measurements):
+    measurements = parser.formatDF(measurements, session.reference_clock(parser.clock_reference(measurements)))
+
     if measurements.empty:
         print("Error: No valid measurements after formatting")
-        return jsonify({"status": "failure", "error": "No valid measurements after formatting"}), 400
-    
-    results = {}
-    positions = []
-    constellations = measurements['constellationType'].unique()
-
-    for constellation in constellations:
-        one_epoch, ephemeris = parser.generate_epoch(measurements[measurements['constellationType'] == constellation])
-        
-        if one_epoch.empty or ephemeris.empty:
-            print(f"Error: No valid epoch or ephemeris data for constellation {constellation}")
-            continue
-        
-        sv_position = parser.calculate_satellite_position(ephemeris, one_epoch['transmit_time_seconds'])
-        
-        if sv_position.empty:
-            print(f"Error: No valid satellite position data for constellation {constellation}")
-            continue
-        
-        sv_position["pseudorange"] = one_epoch["Pseudorange_Measurement"] + parser.LIGHTSPEED * sv_position['Sat.bias']
-        sv_position["cn0"] = one_epoch["Cn0DbHz"]
-        sv_position = sv_position.drop('Sat.bias', axis=1)
-
-        spoofed_sats = parser.detect_spoofing(sv_position)
-        non_spoofed_svs = sv_position #.drop(spoofed_sats)
-
-        if len(non_spoofed_svs) < 4:
-            print(f"Error: Not enough satellites to calculate position for constellation {constellation} after excluding spoofed satellites")
-            continue
-
-        xs = non_spoofed_svs[['Sat.X', 'Sat.Y', 'Sat.Z']].to_numpy()
-        pr = non_spoofed_svs['pseudorange'].to_numpy()
-        x0 = np.array([0, 0, 0])
-        b0 = 0
-        try:
-            x, b, _ = parser.least_squares(xs, pr, x0, b0)
-            lla = navpy.ecef2lla(x)
-            results[constellation] = {
-                "position": lla,
-                "spoofed_satellites": spoofed_sats.index.tolist()
-            }
-            positions.append(lla)
-            if all_positions is None:
-                all_positions = {}
-            all_positions[constellation] = lla
-            print('!!!', constellation, lla)
-        except np.linalg.LinAlgError:
-            print(f"Singular matrix encountered for constellation {constellation}. Skipping this calculation.")
-            continue
-        except Exception as e:
-            print(f"An error occurred for constellation {constellation}: {e}")
-            continue
-
-    if not positions:
-        return jsonify({"status": "failure", "error": "No valid position calculations"}), 400
-
-    avg_position = np.mean(positions, axis=0)
-    best_constellation = min(results.keys(), key=lambda k: np.linalg.norm(np.array(results[k]["position"]) - avg_position))
-
-    latest_position = results[best_constellation]["position"]
-    latest_spoofed_sats = results[best_constellation]["spoofed_satellites"]
-
-    return jsonify({
+        return {"status": "failure", "error": "No valid measurements after formatting"}, 400
+
+    # every epoch with enough satellites, each with the ephemeris valid at its own time
+    epochs, ephemeris = parser.generate_epochs(measurements)
+
+    if epochs.empty or ephemeris.empty:
+        print("Error: No valid epoch or ephemeris data")
+        return {"status": "failure", "error": "No valid epoch or ephemeris data"}, 400
+
+    # The buffer has already marked all of them as seen, so each one is solved here, in order;
+    # the response is the last fix (or the last failure when none of them solved)
+    result = None
+    for rows in epochs.groupby('Epoch', sort=True).indices.values():
+        one_epoch = epochs.iloc[rows].set_index('satPRN')
+        epoch_result = solve_epoch(session, one_epoch, ephemeris.iloc[rows].set_axis(one_epoch.index))
+        if result is None or epoch_result[1] == 200 or result[1] != 200:
+            result = epoch_result
+    return result
+
+def solve_epoch(session, one_epoch, ephemeris):
+    # One satellite-position pass and one joint solve for every constellation, each with its
+    # own receiver clock bias state; then the device's tracker and monitor advance one epoch
+    one_epoch = one_epoch.assign(Pseudorange_Measurement=parser.smooth_pseudoranges(one_epoch, session.smoother))
+    sv_position = parser.calculate_satellite_position(ephemeris, one_epoch['transmit_time_seconds'])
+    sv_velocity = parser.calculate_satellite_velocity(ephemeris, one_epoch['transmit_time_seconds'])
+
+    if sv_position.empty:
+        print("Error: No valid satellite position data")
+        return {"status": "failure", "error": "No valid satellite position data"}, 400
+
+    sv_position["pseudorange"] = one_epoch["Pseudorange_Measurement"] + parser.LIGHTSPEED * sv_position['Sat.bias']
+    sv_position = sv_position.drop('Sat.bias', axis=1)
+    # satellites without usable orbit elements (e.g. GLONASS records) come out as NaN
+    finite = np.isfinite(sv_position[['Sat.X', 'Sat.Y', 'Sat.Z', 'pseudorange']].to_numpy()).all(axis=1)
+    sv_position = sv_position.loc[finite]
+    epoch = one_epoch.loc[sv_position.index]
+    xs = sv_position[['Sat.X', 'Sat.Y', 'Sat.Z']].to_numpy()
+
+    try:
+        # the elevation mask and atmospheric delays are evaluated at the device's last fix,
+        # or at a first uncorrected one from the measurements that pass the signal checks
+        if session.solver.previous is None:
+            selection = parser.select_measurements(epoch, xs)
+            if enough_satellites(epoch.loc[selection.keep]):
+                session.solver.solve(xs[selection.keep], sv_position['pseudorange'].to_numpy()[selection.keep],
+                                     selection.weights[selection.keep], systems=epoch['Constellation'].to_numpy()[selection.keep])
+        if session.solver.previous is None:
+            print("Error: Not enough satellites to calculate position")
+            return {"status": "failure", "error": "Not enough satellites"}, 400
+        selection = parser.select_measurements(epoch, xs, session.solver.previous[0])
+        if selection.rejected:
+            print("Rejected measurements:", selection.rejected)
+        if not enough_satellites(epoch.loc[selection.keep]):
+            print("Error: Not enough satellites to calculate position")
+            return {"status": "failure", "error": "Not enough satellites"}, 400
+        registry.count_satellites(epoch['Constellation'].to_numpy()[~selection.keep], 'gnss_satellites_excluded_total', reason='selection')
+        sv_position, epoch, xs = sv_position.loc[selection.keep], epoch.loc[selection.keep], xs[selection.keep]
+        weights = selection.weights[selection.keep]
+        systems = epoch['Constellation'].to_numpy()
+        pr = sv_position['pseudorange'].to_numpy()
+
+        pr = pr - parser.atmospheric_delay(xs, session.solver.previous[0], epoch)
+        with registry.time(None, 'gnss_solve_seconds', constellations=''.join(np.unique(systems))):
+            solution = session.solver.solve(xs, pr, weights, systems=systems)
+        registry.observe('gnss_solver_iterations', solution.iterations)
+
+        # RAIM: satellites whose removal makes the residuals consistent are dropped and the fix redone
+        integrity = parser.detect_spoofing(solution)
+        spoofed_sats = sv_position.index[integrity.excluded].tolist()
+        if spoofed_sats:
+            keep = ~sv_position.index.isin(spoofed_sats)
+            registry.count_satellites(systems[~keep], 'gnss_satellites_excluded_total', reason='raim')
+            sv_position, epoch = sv_position.loc[keep], epoch.loc[keep]
+            xs, pr, weights, systems = xs[keep], pr[keep], weights[keep], systems[keep]
+            solution = session.solver.solve(xs, pr, weights, systems=systems)
+            registry.observe('gnss_solver_iterations', solution.iterations)
+        registry.count_satellites(systems)
+        registry.observe_fix_satellites(systems)
+        lla = ecef_to_lla(solution.position)
+        print('!!!', sorted(solution.clock_biases), lla)
+    except np.linalg.LinAlgError:
+        print("Singular matrix encountered. Skipping this calculation.")
+        return {"status": "failure", "error": "No valid position calculations"}, 400
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return {"status": "failure", "error": "No valid position calculations"}, 400
+
+    # The snapshot fix starts (or restarts after a gap) the device's track; from then on each
+    # epoch is a Kalman update with its pseudoranges and Doppler rates
+    tracker = session.tracker
+    epoch_time = 1e-9 * one_epoch['GpsTimeNanos'].iloc[0]
+    sat_velocity = sv_velocity.loc[sv_position.index]
+    sat_velocity_xyz = sat_velocity[['Sat.VX', 'Sat.VY', 'Sat.VZ']].to_numpy()
+    pseudorange_rate = (epoch['PseudorangeRateMetersPerSecond'] + parser.LIGHTSPEED * sat_velocity['Sat.drift']).to_numpy()
+    rate_weights = PseudorangeSolver.rate_weights(epoch['PseudorangeRateUncertaintyMetersPerSecond'])
+    # Doppler velocity on the fix's own geometry: one extra 4x4 solve
+    with registry.time('velocity'):
+        velocity_solution = PseudorangeSolver.solve_velocity(solution.H, sat_velocity_xyz, pseudorange_rate, rate_weights)
+    with registry.time('tracker'):
+        if not tracker.is_tracking(epoch_time):
+            tracker.initialize(epoch_time, solution.position, solution.clock_biases)
+            doppler_error = np.full(len(xs), np.nan)
+        else:
+            tracker.update(epoch_time, xs, pr, 1 / np.sqrt(weights), systems, sat_velocity_xyz, pseudorange_rate, 1 / np.sqrt(rate_weights))
+            doppler_error = tracker.rate_residuals(xs, sat_velocity_xyz, pseudorange_rate)
+
+    # Rolling per-satellite/per-device statistics catch what a single epoch's residuals cannot
+    # (coherent spoofing moves every pseudorange together)
+    with registry.time('monitor'):
+        alerts = session.monitor.update(epoch_time, sv_position.index.tolist(), epoch['Cn0DbHz'].to_numpy(),
+                                        solution.residuals, doppler_error, solution.clock_biases, tracker.clock_drift)
+    tracked_lla = ecef_to_lla(tracker.position)
+
+    session.all_positions = {"joint": lla, "tracked": tracked_lla}
+    session.latest_position = tracked_lla
+    session.latest_velocity = tracker.velocity.tolist()
+    session.latest_speed, session.latest_heading = None, None
+    if velocity_solution is not None:
+        speed, heading, _ = speed_and_heading(solution.position, velocity_solution.velocity)
+        session.latest_speed = float(speed)
+        # the direction of a near-zero velocity is noise
+        session.latest_heading = float(heading) if speed >= MIN_HEADING_SPEED else None
+    session.latest_spoofed_sats = spoofed_sats
+    session.latest_alerts = alerts
+
+    return {
         "status": "success",
-        "position": latest_position,
-        "spoofed_satellites": latest_spoofed_sats,
-        "best_constellation": best_constellation
-    }), 200
+        "position": session.latest_position,
+        "velocity": session.latest_velocity,
+        "speed": session.latest_speed,
+        "heading": session.latest_heading,
+        "spoofed_satellites": session.latest_spoofed_sats,
+        "dop": solution.dop,
+        "integrity": integrity.to_dict(),
+        "alerts": alerts,
+        "constellations": sorted(solution.clock_biases)
+    }, 200
 
 @app.route('/gnssnavdata', methods=['POST'])
 def receive_gnss_navdata():
@@ -142,9 +270,20 @@ def receive_gnss_navdata():
     # Process the navigation message as needed
     return jsonify({"status": "success"}), 200
 
-if __name__ == '__main__':
+def setup(rinex_directory=None):
+    # With rinex_directory the nav files are read from there, and files dropped into it later are
+    # picked up by the background refresh, instead of being downloaded
+    global ephemerisManager, parser
+    ephemerisManager = EphemerisManager(data_directory, rinex_directory=rinex_directory)
     # pre-heat
-    ephemerisManager = EphemerisManager(data_directory)
     ephemerisManager.load_data(datetime.now())
+    parser = Parser(data_directory, ephemerisManager)
+
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description='Position fixes from raw GNSS measurements posted by phones.')
+    arguments.add_argument('--rinex', default=None, help='read nav files from this directory instead of downloading')
+    args = arguments.parse_args()
+    setup(args.rinex)
 
-    app.run(host='0.0.0.0', port=2121)
+    app.run(host='0.0.0.0', port=2121, threaded=True)
@@ -0,0 +1,156 @@
+import numpy as np
+
+
+class RollingWindows():
+    """A block of fixed-size ring buffers with running sums for O(1) mean/std updates.
+
+    Shape is (rows, size, channels): one ring per row (a satellite slot, or a single row for
+    device-wide series) holding several channels. NaN samples take a slot in the ring but are
+    left out of the statistics.
+    """
+    def __init__(self, rows, size, channels):
+        self.size = size
+        self.values = np.zeros((rows, size, channels))
+        self.valid = np.zeros((rows, size, channels), dtype=bool)
+        self.sums = np.zeros((rows, channels))
+        self.squares = np.zeros((rows, channels))
+        self.counts = np.zeros((rows, channels), dtype=np.int64)
+        self.heads = np.zeros(rows, dtype=np.int64)
+
+    def push(self, rows, samples):
+        # samples is (len(rows), channels); each row overwrites its oldest entry
+        rows = np.asarray(rows, dtype=np.int64)
+        samples = np.asarray(samples, dtype=np.float64)
+        heads = self.heads[rows]
+        old_values, old_valid = self.values[rows, heads], self.valid[rows, heads]
+        self.sums[rows] -= np.where(old_valid, old_values, 0.0)
+        self.squares[rows] -= np.where(old_valid, old_values ** 2, 0.0)
+        self.counts[rows] -= old_valid
+
+        valid = np.isfinite(samples)
+        samples = np.where(valid, samples, 0.0)
+        self.values[rows, heads] = samples
+        self.valid[rows, heads] = valid
+        self.sums[rows] += samples
+        self.squares[rows] += samples ** 2
+        self.counts[rows] += valid
+        self.heads[rows] = (heads + 1) % self.size
+
+    def reset(self, rows):
+        self.values[rows] = 0.0
+        self.valid[rows] = False
+        self.sums[rows] = 0.0
+        self.squares[rows] = 0.0
+        self.counts[rows] = 0
+        self.heads[rows] = 0
+
+    def mean_std(self, rows):
+        counts = np.maximum(self.counts[rows], 1)
+        mean = self.sums[rows] / counts
+        variance = np.maximum(self.squares[rows] / counts - mean ** 2, 0.0)
+        return mean, np.sqrt(variance), self.counts[rows]
+
+
+class SpoofingMonitor():
+    """Streaming spoofing/jamming detector for one device.
+
+    Per satellite it keeps rolling windows of C/N0, post-fit pseudorange residual and Doppler
+    inconsistency (measured pseudorange rate minus the rate predicted from the tracked
+    velocity); per device, the epoch's mean C/N0 and the receiver clock bias jump not
+    explained by the tracked clock drift. Each epoch is scored against the statistics
+    gathered before it and then pushed in, so an update costs O(satellites) and memory is
+    fixed by max_satellites and window.
+
+    - a satellite is flagged when one of its channels leaves z_threshold sigmas of its history
+    - spoofing: a C/N0 rise common to all satellites (their mean z-score, scaled by the square
+      root of their number), a clock bias jump, or Doppler inconsistent on at least
+      coherent_fraction of the satellites
+    - jamming: the mean C/N0 across satellites drops out of its history
+    """
+    CHANNELS = ('cn0', 'residual', 'doppler')
+    # floors on the rolling std so quiet histories don't turn noise into alarms
+    STD_FLOORS = np.array([1.5, 2.0, 0.5])
+
+    def __init__(self, window=30, max_satellites=64, z_threshold=4.0, min_samples=10, coherent_fraction=0.5,
+                 clock_jump_floor=20.0):
+        self.z_threshold = z_threshold
+        self.min_samples = min_samples
+        self.coherent_fraction = coherent_fraction
+        self.clock_jump_floor = clock_jump_floor
+        self.satellites = RollingWindows(max_satellites, window, len(self.CHANNELS))
+        # device-wide: mean C/N0 and unexplained clock bias jump
+        self.device = RollingWindows(1, window, 2)
+        self.slots = {}
+        self.last_seen = np.full(max_satellites, -np.inf)
+        self.last_time = None
+        self.last_biases = None
+
+    def slot_rows(self, satellites, time):
+        rows = []
+        for satellite in satellites:
+            row = self.slots.get(satellite)
+            if row is None:
+                if len(self.slots) < len(self.last_seen):
+                    row = len(self.slots)
+                else:
+                    # full: reuse the slot of the satellite seen longest ago
+                    row = int(np.argmin(self.last_seen))
+                    self.slots = {sv: slot for sv, slot in self.slots.items() if slot != row}
+                    self.satellites.reset(row)
+                self.slots[satellite] = row
+            rows.append(row)
+        rows = np.array(rows, dtype=np.int64)
+        self.last_seen[rows] = time
+        return rows
+
+    def zscores(self, windows, rows, samples, floors):
+        mean, std, counts = windows.mean_std(rows)
+        z = (samples - mean) / np.maximum(std, floors)
+        return np.where((counts >= self.min_samples) & np.isfinite(samples), z, 0.0)
+
+    def update(self, time, satellites, cn0, residuals, doppler_error, clock_biases, clock_drift=np.nan):
+        satellites = list(satellites)
+        rows = self.slot_rows(satellites, time)
+        samples = np.column_stack([cn0, residuals, doppler_error]).astype(np.float64)
+        z = self.zscores(self.satellites, rows, samples, self.STD_FLOORS)
+
+        flagged = {}
+        for satellite, satellite_z in zip(satellites, z):
+            reasons = [channel for channel, value in zip(self.CHANNELS, satellite_z) if abs(value) > self.z_threshold]
+            if reasons:
+                flagged[satellite] = reasons
+
+        # receiver clock bias change beyond what the clock drift accounts for, averaged over systems
+        clock_jump = np.nan
+        if self.last_biases is not None:
+            common = [system for system in clock_biases if system in self.last_biases]
+            if common:
+                change = np.mean([clock_biases[system] - self.last_biases[system] for system in common])
+                expected = np.nan_to_num(clock_drift) * (time - self.last_time)
+                clock_jump = change - expected
+        device_samples = np.array([[np.nanmean(cn0) if len(cn0) else np.nan, clock_jump]])
+        device_z = self.zscores(self.device, [0], device_samples, np.array([1.0, 5.0]))[0]
+
+        count = len(satellites)
+        coherent = max(3, int(np.ceil(self.coherent_fraction * count)))
+        reasons = []
+        # a shift common to all satellites: their z-scores average down the per-satellite noise
+        scored = z[:, 0] != 0
+        if scored.sum() >= 3 and z[scored, 0].mean() * np.sqrt(scored.sum()) > self.z_threshold:
+            reasons.append('coherent C/N0 rise')
+        if np.sum(np.abs(z[:, 2]) > self.z_threshold) >= coherent:
+            reasons.append('Doppler inconsistent with tracked motion')
+        if abs(device_z[1]) > self.z_threshold and abs(clock_jump) > self.clock_jump_floor:
+            reasons.append('receiver clock jump')
+        jamming = device_z[0] < -self.z_threshold
+
+        self.satellites.push(rows, samples)
+        self.device.push([0], device_samples)
+        self.last_time = time
+        self.last_biases = dict(clock_biases)
+        return {
+            "spoofing": bool(reasons),
+            "jamming": bool(jamming),
+            "reasons": reasons + (['C/N0 drop across satellites'] if jamming else []),
+            "satellites": flagged,
+        }
@@ -0,0 +1,39 @@
+import os
+import sys
+import pytest
+
+# the modules live flat at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import simulation
+from ephemeris_manager import EphemerisManager
+from Parser import Parser
+
+
+@pytest.fixture(scope='session')
+def rinex_directory(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('rinex')
+    simulation.write_nav(str(directory / 'synthetic.rnx'))
+    return str(directory)
+
+
+@pytest.fixture(scope='session')
+def nav(rinex_directory):
+    return simulation.load_nav(os.path.join(rinex_directory, 'synthetic.rnx'))
+
+
+@pytest.fixture(scope='session')
+def ephemeris_directory(tmp_path_factory):
+    # shared so the parsed-nav disk cache is only filled once per run
+    return str(tmp_path_factory.mktemp('ephemeris'))
+
+
+@pytest.fixture
+def manager(ephemeris_directory, rinex_directory):
+    return EphemerisManager(ephemeris_directory, rinex_directory=rinex_directory)
+
+
+@pytest.fixture
+def parser(ephemeris_directory, manager):
+    return Parser(ephemeris_directory, manager=manager)
@@ -0,0 +1,242 @@
+"""Deterministic GNSS scenario for the tests: a synthetic broadcast nav file and the Android
+measurements a phone moving through it would post.
+
+The satellite orbits here are evaluated independently of orbit.py, straight from the
+IS-GPS-200 equations on the georinex table, so the tests check the engine rather than
+reproduce it.
+"""
+import numpy as np
+import georinex
+
+LIGHTSPEED = 2.99792458e8
+MU = 3.986005e14
+EARTH_ROTATION = 7.2921151467e-5
+GPS_WEEK = 2309
+# Saturday 2024-04-13 16:30 GPS time, inside the validity of the 16:00 records
+TOW0 = 577800
+KLOBUCHAR = {'alpha': np.array([1.1176e-08, 7.4506e-09, -5.9605e-08, -5.9605e-08]),
+             'beta': np.array([90112.0, 0.0, -196610.0, -65536.0])}
+START_LLA = (32.1, 34.8, 30.0)
+
+
+def nav_header(text, label):
+    return text.ljust(60) + label.ljust(20) + "\n"
+
+
+def write_nav(path, hours=(16,), gps=range(1, 25), galileo=range(1, 13), seed=0):
+    # RINEX 3 mixed nav file with one record per satellite and hour, orbits spread at random
+    rng = np.random.default_rng(seed)
+    lines = [
+        nav_header("     3.04           N: GNSS NAV DATA    M: MIXED", "RINEX VERSION / TYPE"),
+        nav_header("tests               tests               20240413 000000 UTC", "PGM / RUN BY / DATE"),
+        nav_header("GPSA   1.1176D-08  7.4506D-09 -5.9605D-08 -5.9605D-08", "IONOSPHERIC CORR"),
+        nav_header("GPSB   9.0112D+04  0.0000D+00 -1.9661D+05 -6.5536D+04", "IONOSPHERIC CORR"),
+        nav_header("    18", "LEAP SECONDS"),
+        nav_header("", "END OF HEADER"),
+    ]
+    satellites = [('G', prn) for prn in gps] + [('E', prn) for prn in galileo]
+    orbits = {satellite: (rng.uniform(-np.pi, np.pi), rng.uniform(0, 2 * np.pi), rng.uniform(-1e-4, 1e-4))
+              for satellite in satellites}
+    for hour in hours:
+        toe = 6 * 86400 + hour * 3600
+        for system, prn in satellites:
+            node, anomaly, clock = orbits[(system, prn)]
+            anomaly = (anomaly + 1.4585e-4 * (hour - 16) * 3600 + np.pi) % (2 * np.pi) - np.pi
+            values = [
+                [clock, 1e-11, 0.0],
+                [50.0 + hour, 20.0, 4.5e-9, anomaly],
+                [1e-6, 0.01, 8e-6, 5153.6 if system == 'G' else 5440.6],
+                [toe, 1e-7, node, -5e-8],
+                [0.96, 200.0, 0.5, -8e-9],
+                [1e-10, 1.0, 2310.0, 0.0],
+                [2.0, 0.0, -1e-8, 50.0 + hour],
+                [toe - 30, 4.0],
+            ]
+            lines.append(f"{system}{prn:02d} 2024 04 13 {hour:02d} 00 00" + "".join("%19.12E" % v for v in values[0]) + "\n")
+            lines.extend("    " + "".join("%19.12E" % v for v in row) + "\n" for row in values[1:])
+    with open(path, 'w') as f:
+        f.write("".join(lines))
+    return path
+
+
+def load_nav(path):
+    return georinex.load(path).to_dataframe().dropna(how='all').reset_index()
+
+
+def satellite_state(record, t):
+    # ECEF position at GPS time t (seconds of week) and satellite clock offset (s)
+    a = record.sqrtA ** 2
+    tk = t - record.Toe
+    mean_anomaly = record.M0 + (np.sqrt(MU / a ** 3) + record.DeltaN) * tk
+    eccentric = mean_anomaly
+    for _ in range(30):
+        eccentric = mean_anomaly + record.Eccentricity * np.sin(eccentric)
+    true_anomaly = np.arctan2(np.sqrt(1 - record.Eccentricity ** 2) * np.sin(eccentric), np.cos(eccentric) - record.Eccentricity)
+    phi = true_anomaly + record.omega
+    u = phi + record.Cus * np.sin(2 * phi) + record.Cuc * np.cos(2 * phi)
+    r = a * (1 - record.Eccentricity * np.cos(eccentric)) + record.Crs * np.sin(2 * phi) + record.Crc * np.cos(2 * phi)
+    inclination = record.Io + record.Cis * np.sin(2 * phi) + record.Cic * np.cos(2 * phi) + record.IDOT * tk
+    x, y = r * np.cos(u), r * np.sin(u)
+    node = record.Omega0 + (record.OmegaDot - EARTH_ROTATION) * tk - EARTH_ROTATION * record.Toe
+    position = np.array([x * np.cos(node) - y * np.cos(inclination) * np.sin(node),
+                         x * np.sin(node) + y * np.cos(inclination) * np.cos(node),
+                         y * np.sin(inclination)])
+    toc = 6 * 86400 + record.time.hour * 3600
+    clock = (record.SVclockBias + record.SVclockDrift * (t - toc)
+             - 4.442807633e-10 * record.Eccentricity * record.sqrtA * np.sin(eccentric))
+    return position, clock
+
+
+def geodetic_to_ecef(lat, lon, height):
+    a, e2 = 6378137.0, 6.69437999014e-3
+    lat, lon = np.radians(lat), np.radians(lon)
+    normal = a / np.sqrt(1 - e2 * np.sin(lat) ** 2)
+    return np.array([(normal + height) * np.cos(lat) * np.cos(lon),
+                     (normal + height) * np.cos(lat) * np.sin(lon),
+                     (normal * (1 - e2) + height) * np.sin(lat)])
+
+
+def east_north_up(lat, lon):
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.array([[-np.sin(lon), np.cos(lon), 0.0],
+                     [-np.sin(lat) * np.cos(lon), -np.sin(lat) * np.sin(lon), np.cos(lat)],
+                     [np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)]])
+
+
+def random_sky(receiver, count, seed=0, distance=2.0e7):
+    # count satellite positions distance meters from receiver, all above its horizon
+    rng = np.random.default_rng(seed)
+    up = receiver / np.linalg.norm(receiver)
+    directions = rng.standard_normal((count, 3))
+    directions -= np.minimum(directions @ up - 0.3, 0)[:, None] * up
+    directions /= np.linalg.norm(directions, axis=1)[:, None]
+    return receiver + distance * directions
+
+
+def receiver_state(t, velocity_enu):
+    # constant ENU velocity from START_LLA, t seconds after TOW0
+    velocity = east_north_up(*START_LLA[:2]).T @ np.asarray(velocity_enu, dtype=np.float64)
+    return geodetic_to_ecef(*START_LLA) + velocity * t, velocity
+
+
+def signal_path(record, receiver, t):
+    # transmit time, Sagnac-rotated satellite position and satellite clock for reception at GPS time t
+    transmit = t - 0.075
+    for _ in range(5):
+        position, clock = satellite_state(record, transmit)
+        flight = np.linalg.norm(position - receiver) / LIGHTSPEED
+        angle = EARTH_ROTATION * flight
+        rotated = np.array([position[0] * np.cos(angle) + position[1] * np.sin(angle),
+                            -position[0] * np.sin(angle) + position[1] * np.cos(angle), position[2]])
+        transmit = t - np.linalg.norm(rotated - receiver) / LIGHTSPEED
+    return transmit, rotated, clock
+
+
+def simulate(nav, epochs=10, clock_bias=3e-7, clock_drift=0.0, inter_system_bias=2e-8, noise=0.0,
+             velocity_enu=(0.9, 1.1, 0.0), adr=False, atmosphere=False, elevation_mask=10.0, seed=0):
+    """Measurements posted once per second from TOW0, plus the truth they were made from.
+
+    The receiver clock reads GPS time plus clock_bias + clock_drift * t seconds and TimeNanos
+    carries that reading against one FullBiasNanos, as a phone does between clock resets.
+    noise is the pseudorange noise sigma in meters. With adr the accumulated delta range
+    follows the noise-free pseudorange and is flagged valid; otherwise it is flagged as the
+    logs in data/ are (not valid). Galileo sees inter_system_bias seconds of extra delay.
+    Returns (measurement dicts, truth) where truth holds per-epoch position, velocity and
+    clock bias in meters.
+    """
+    rng = np.random.default_rng(seed)
+    full_bias = 10 ** 12 - (GPS_WEEK * 604800 + TOW0) * 10 ** 9
+    records = [record for record in nav.itertuples() if 0 <= TOW0 - record.Toe < 7200 - epochs]
+    measurements = []
+    truth = {'position': [], 'velocity': [], 'clock_bias': []}
+    first_range = {}
+    for k in range(epochs):
+        t = TOW0 + k
+        receiver, receiver_velocity = receiver_state(k, velocity_enu)
+        bias_nanos = int(round((clock_bias + clock_drift * k) * 1e9))
+        truth['position'].append(receiver)
+        truth['velocity'].append(receiver_velocity)
+        truth['clock_bias'].append(LIGHTSPEED * 1e-9 * bias_nanos)
+        up = receiver / np.linalg.norm(receiver)
+        for record in records:
+            transmit, satellite, clock = signal_path(record, receiver, t)
+            line_of_sight = satellite - receiver
+            distance = np.linalg.norm(line_of_sight)
+            if line_of_sight @ up / distance < np.sin(np.radians(elevation_mask)):
+                continue
+            delay = inter_system_bias if record.sv[0] == 'E' else 0.0
+            if atmosphere:
+                from atmosphere import atmospheric_delay
+                delay += atmospheric_delay(KLOBUCHAR, receiver, satellite[None], float(t), 104)[0] / LIGHTSPEED
+            clean = transmit + clock - delay
+            received_sv_nanos = int(round((clean - noise * rng.standard_normal() / LIGHTSPEED) * 1e9))
+
+            # range rate from the motion over one second around t, plus both clock drifts
+            later, earlier = receiver_state(k + 0.5, velocity_enu)[0], receiver_state(k - 0.5, velocity_enu)[0]
+            rate = (np.linalg.norm(signal_path(record, later, t + 0.5)[1] - later)
+                    - np.linalg.norm(signal_path(record, earlier, t - 0.5)[1] - earlier))
+            rate += LIGHTSPEED * (clock_drift - record.SVclockDrift)
+
+            satellite_id = (record.sv[0], int(record.sv[1:]))
+            clean_range = LIGHTSPEED * ((t + 1e-9 * bias_nanos) - clean)
+            first_range.setdefault(satellite_id, clean_range)
+            measurements.append({
+                'svid': satellite_id[1],
+                'constellationType': 1 if satellite_id[0] == 'G' else 6,
+                'codeType': 'C',
+                'timeNanos': 10 ** 12 + k * 10 ** 9 + bias_nanos,
+                'biasNanos': 0.0,
+                'fullBiasNanos': full_bias,
+                'timeOffsetNanos': 0.0,
+                'receivedSvTimeNanos': received_sv_nanos,
+                'receivedSvTimeUncertaintyNanos': 10,
+                'state': 16431,
+                'cn0DbHz': float(rng.uniform(30, 45)),
+                'pseudorangeRateMetersPerSecond': float(rate),
+                'pseudorangeRateUncertaintyMetersPerSecond': 0.1,
+                'accumulatedDeltaRangeState': 1 if adr else 16,
+                'accumulatedDeltaRangeMeters': clean_range - first_range[satellite_id] + 100.0 if adr else 0.0,
+                'accumulatedDeltaRangeUncertaintyMeters': 0.01,
+                'carrierFrequencyHz': 1575420030.0,
+                'multipathIndicator': 0,
+            })
+    return measurements, {key: np.array(values) for key, values in truth.items()}
+
+
+def epochs_of(measurements):
+    # the measurement dicts grouped into one list per epoch, in order
+    epochs = {}
+    for measurement in measurements:
+        epochs.setdefault(measurement['timeNanos'], []).append(measurement)
+    return list(epochs.values())
+
+
+RAW_COLUMNS = ("utcTimeMillis,TimeNanos,LeapSecond,TimeUncertaintyNanos,FullBiasNanos,BiasNanos,BiasUncertaintyNanos,"
+               "DriftNanosPerSecond,DriftUncertaintyNanosPerSecond,HardwareClockDiscontinuityCount,Svid,TimeOffsetNanos,"
+               "State,ReceivedSvTimeNanos,ReceivedSvTimeUncertaintyNanos,Cn0DbHz,PseudorangeRateMetersPerSecond,"
+               "PseudorangeRateUncertaintyMetersPerSecond,AccumulatedDeltaRangeState,AccumulatedDeltaRangeMeters,"
+               "AccumulatedDeltaRangeUncertaintyMeters,CarrierFrequencyHz,CarrierCycles,CarrierPhase,"
+               "CarrierPhaseUncertainty,MultipathIndicator,SnrInDb,ConstellationType,AgcDb,BasebandCn0DbHz,"
+               "FullInterSignalBiasNanos,FullInterSignalBiasUncertaintyNanos,SatelliteInterSignalBiasNanos,"
+               "SatelliteInterSignalBiasUncertaintyNanos,CodeType,ChipsetElapsedRealtimeNanos").split(',')
+
+
+def write_log(measurements, path):
+    # GnssLogger text log with the measurements in its Raw section
+    with open(path, 'w') as f:
+        f.write('# \n# Header Description:\n# \n# Raw,' + ','.join(RAW_COLUMNS) + '\n# \n# Fix,Provider,LatitudeDegrees\n# \n')
+        for m in measurements:
+            row = dict.fromkeys(RAW_COLUMNS, '')
+            row.update(utcTimeMillis=0, TimeNanos=m['timeNanos'], FullBiasNanos=m['fullBiasNanos'], BiasNanos=m['biasNanos'],
+                       Svid=m['svid'], TimeOffsetNanos=m['timeOffsetNanos'], State=m['state'],
+                       ReceivedSvTimeNanos=m['receivedSvTimeNanos'], ReceivedSvTimeUncertaintyNanos=m['receivedSvTimeUncertaintyNanos'],
+                       Cn0DbHz=m['cn0DbHz'], PseudorangeRateMetersPerSecond=m['pseudorangeRateMetersPerSecond'],
+                       PseudorangeRateUncertaintyMetersPerSecond=m['pseudorangeRateUncertaintyMetersPerSecond'],
+                       AccumulatedDeltaRangeState=m['accumulatedDeltaRangeState'],
+                       AccumulatedDeltaRangeMeters=m['accumulatedDeltaRangeMeters'],
+                       AccumulatedDeltaRangeUncertaintyMeters=m['accumulatedDeltaRangeUncertaintyMeters'],
+                       CarrierFrequencyHz=m['carrierFrequencyHz'], MultipathIndicator=m['multipathIndicator'],
+                       ConstellationType=m['constellationType'], CodeType=m['codeType'])
+            f.write('Raw,' + ','.join(str(row[c]) for c in RAW_COLUMNS) + '\n')
+            f.write('Fix,gps,32.1\n')
+    return path
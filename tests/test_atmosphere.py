@@ -0,0 +1,43 @@
+import numpy as np
+import simulation
+from atmosphere import GPS_L1_HZ, LIGHTSPEED, atmospheric_delay, klobuchar_delay, niell_mapping, saastamoinen_zenith
+
+ALPHA, BETA = simulation.KLOBUCHAR['alpha'], simulation.KLOBUCHAR['beta']
+
+
+def test_klobuchar_night_floor_and_daytime_peak():
+    lat, lon = np.radians(32.1), np.radians(34.8)
+    local_noon = 14 * 3600 - 34.8 / 180 * 43200
+    zenith = np.pi / 2
+    night = klobuchar_delay(ALPHA, BETA, lat, lon, 0.0, zenith, local_noon + 43200)
+    noon = klobuchar_delay(ALPHA, BETA, lat, lon, 0.0, zenith, local_noon)
+    low = klobuchar_delay(ALPHA, BETA, lat, lon, 0.0, np.radians(10.0), local_noon)
+
+    # constant 5 ns at night, times the (near 1 at zenith) obliquity factor
+    assert abs(night - LIGHTSPEED * 5e-9) < 0.01
+    assert noon > night
+    assert 2.0 < low / noon < 3.0
+
+
+def test_troposphere_at_sea_level():
+    hydrostatic, wet = saastamoinen_zenith(np.radians(45.0), 0.0)
+    assert abs(hydrostatic - 2.31) < 0.01
+    assert 0.05 < wet < 0.3
+
+    hydrostatic_mapping, wet_mapping = niell_mapping(np.radians(45.0), 0.0, np.radians([90.0, 30.0, 5.0]), 100)
+    assert np.allclose(hydrostatic_mapping[:2], [1.0, 2.0], atol=0.01)
+    assert 9.5 < hydrostatic_mapping[2] < 10.5
+    assert np.allclose(wet_mapping[:2], [1.0, 2.0], atol=0.01)
+
+
+def test_ionosphere_scales_with_the_carrier():
+    receiver = simulation.geodetic_to_ecef(*simulation.START_LLA)
+    xs = receiver + 2.0e7 * np.array([[0.6, 0.0, 0.8], [0.0, 0.6, 0.8]])
+    ionosphere = {'alpha': ALPHA, 'beta': BETA}
+    l1 = atmospheric_delay(ionosphere, receiver, xs, 50000.0, 100)
+    l5 = atmospheric_delay(ionosphere, receiver, xs, 50000.0, 100, carrier_frequency=[1176.45e6, np.nan])
+    troposphere = atmospheric_delay(None, receiver, xs, 50000.0, 100)
+
+    assert np.isclose(l5[0] - troposphere[0], (l1[0] - troposphere[0]) * (GPS_L1_HZ / 1176.45e6) ** 2)
+    # unknown carrier: taken as L1
+    assert l5[1] == l1[1]
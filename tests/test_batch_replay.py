@@ -0,0 +1,31 @@
+import os
+import simulation
+from batch_replay import find_logs, replay
+
+
+def test_find_logs_expands_recursive_patterns(tmp_path):
+    for relative in ('field/day1/a.txt', 'field/day2/run/b.txt', 'field/c.txt', 'field/notes.md'):
+        path = tmp_path / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text('')
+
+    found = find_logs([str(tmp_path / 'field' / '**' / '*.txt')])
+    assert sorted(os.path.relpath(path, tmp_path) for path in found) == [
+        os.path.join('field', 'c.txt'), os.path.join('field', 'day1', 'a.txt'), os.path.join('field', 'day2', 'run', 'b.txt')]
+    # a directory still means the logs directly inside it
+    assert find_logs([str(tmp_path / 'field')]) == [str(tmp_path / 'field' / 'c.txt')]
+
+
+def test_replay_solves_every_log(nav, rinex_directory, ephemeris_directory, tmp_path):
+    paths = []
+    for name, velocity in (('walk', (1.0, 0.5, 0.0)), ('drive', (12.0, -5.0, 0.0))):
+        measurements, _ = simulation.simulate(nav, epochs=8, velocity_enu=velocity, atmosphere=True)
+        paths.append(simulation.write_log(measurements, str(tmp_path / f'{name}.txt')))
+    (tmp_path / 'broken.txt').write_text('not a log\n')
+    output = tmp_path / 'out'
+
+    summary = replay(find_logs([str(tmp_path)]), str(output), ephemeris_directory, rinex_directory, workers=2)
+
+    results = dict(zip(summary['file'].map(os.path.basename), summary['fixes']))
+    assert results == {'broken.txt': 0, 'drive.txt': 8, 'walk.txt': 8}
+    assert sorted(os.listdir(output)) == ['drive.kml', 'drive_xyz.csv', 'summary.csv', 'walk.kml', 'walk_xyz.csv']
@@ -0,0 +1,31 @@
+import numpy as np
+import simulation
+import server
+from device_session import DeviceSession
+from measurement_stream import measurements_to_frame
+
+
+def test_hatch_filter_smooths_code_noise(nav, parser):
+    measurements, _ = simulation.simulate(nav, epochs=40, noise=3.0, adr=True)
+    epochs, _ = parser.generate_epochs(parser.formatDF(measurements_to_frame(measurements)))
+    smoothed = parser.smooth_pseudoranges(epochs)
+
+    # the carrier follows the noise-free range, so code minus carrier is the code noise
+    late = epochs['Epoch'].to_numpy() >= 30
+    raw_noise = (epochs['Pseudorange_Measurement'] - epochs['AccumulatedDeltaRangeMeters']).groupby(epochs['satPRN'])
+    smoothed_noise = (smoothed - epochs['AccumulatedDeltaRangeMeters']).groupby(epochs['satPRN'])
+    assert raw_noise.std().mean() > 2.5
+    assert smoothed_noise.apply(lambda error: error[late[error.index]].std()).mean() < 1.0
+
+
+def test_live_smoothing_continues_across_posts(nav, parser, monkeypatch):
+    monkeypatch.setattr(server, 'parser', parser)
+    measurements, _ = simulation.simulate(nav, epochs=20, noise=3.0, adr=True)
+    session = DeviceSession('smoothing')
+    for epoch in simulation.epochs_of(measurements):
+        response, status = server.process_measurements(session, measurements_to_frame(epoch), epoch[-1])
+        assert status == 200, response
+
+    counts = session.smoother.counts[list(session.smoother.slots.values())]
+    # every satellite in view the whole run has been averaging since the first post
+    assert np.median(counts) == 20
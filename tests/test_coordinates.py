@@ -0,0 +1,36 @@
+import numpy as np
+from coordinates import (azimuth_elevation, ecef_to_enu, ecef_to_geodetic, ecef_to_lla, enu_to_ecef,
+                         lla_to_ecef, speed_and_heading)
+
+
+def test_geodetic_round_trip():
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(-89.9, 89.9, 1000)
+    lon = rng.uniform(-180, 180, 1000)
+    height = rng.uniform(-400, 30000, 1000)
+    back_lat, back_lon, back_height = ecef_to_lla(lla_to_ecef(lat, lon, height))
+
+    assert np.abs(back_lat - lat).max() < 1e-9
+    assert np.abs(back_lon - lon).max() < 1e-9
+    assert np.abs(back_height - height).max() < 1e-4
+    # poles and the equator, where the closed form has its special cases
+    assert np.allclose(np.degrees(ecef_to_geodetic([0.0, 0.0, 6356752.314245])[0]), 90.0)
+    assert ecef_to_lla([6378137.0, 0.0, 0.0]) == (0.0, 0.0, 0.0)
+
+
+def test_enu_frame():
+    reference = lla_to_ecef(32.1, 34.8, 30.0)
+    north_point = lla_to_ecef(32.1001, 34.8, 30.0)
+    enu = ecef_to_enu(north_point, reference)
+    assert abs(enu[0]) < 1e-6 and 11.0 < enu[1] < 11.2 and abs(enu[2]) < 1e-3
+    assert np.allclose(enu_to_ecef(enu, reference), north_point)
+
+    azimuth, elevation = azimuth_elevation(reference, reference + 1000 * (north_point - reference))
+    assert abs(azimuth) < 1e-6 and abs(elevation) < 1e-3
+
+
+def test_speed_and_heading():
+    reference = lla_to_ecef(32.1, 34.8, 30.0)
+    east_south = enu_to_ecef([3.0, -3.0, 1.0], reference) - reference
+    speed, heading, vertical = speed_and_heading(reference, east_south)
+    assert np.isclose(speed, np.sqrt(18)) and np.isclose(heading, 135.0) and np.isclose(vertical, 1.0)
@@ -0,0 +1,22 @@
+import time
+from device_session import SessionStore
+
+
+def test_store_evicts_idle_sessions_and_stays_bounded():
+    evicted = []
+    store = SessionStore(max_sessions=3, idle_timeout=60.0, on_evict=evicted.append)
+    sessions = [store.get_or_create(f'device-{i}') for i in range(3)]
+    for session in sessions[1:]:
+        store.touch(session)
+    assert store.get_or_create('device-1') is sessions[1]
+
+    # full: the session idle the longest makes room
+    sessions[0].created -= 30
+    store.get_or_create('device-3')
+    assert sorted(store.sessions) == ['device-1', 'device-2', 'device-3']
+
+    # anything idle past the timeout goes on the next insert
+    store.sessions['device-1'].updated = time.monotonic() - 120
+    store.get_or_create('device-4')
+    assert sorted(store.sessions) == ['device-2', 'device-3', 'device-4']
+    assert evicted == ['device-0', 'device-1']
@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import pytest
+import simulation
+from ephemeris_manager import EphemerisCache, EphemerisIndex
+
+SIMULATED_TIME = datetime(1980, 1, 6) + timedelta(weeks=simulation.GPS_WEEK, seconds=simulation.TOW0)
+
+
+def test_concurrent_lookups_start_one_refresh(manager, monkeypatch):
+    manager.load_data(SIMULATED_TIME)
+    refreshes = []
+
+    def slow_refresh(timestamp, constellations=None):
+        refreshes.append(timestamp)
+        time.sleep(0.1)
+
+    monkeypatch.setattr(manager, 'refresh', slow_refresh)
+    later = SIMULATED_TIME + timedelta(days=2)
+    start = threading.Barrier(16)
+
+    def lookup():
+        start.wait()
+        manager.ensure_coverage(later)
+
+    threads = [threading.Thread(target=lookup) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    manager.refresher.join()
+
+    assert len(refreshes) == 1
+
+
+def test_cache_entries_are_replaced_whole(tmp_path):
+    source = tmp_path / 'brdc.rnx'
+    source.write_text('nav')
+    cache = EphemerisCache(str(tmp_path / 'cache'))
+    data = pd.DataFrame({'sv': ['G01', 'G02'], 'time': pd.to_datetime(['2024-04-13 16:00', '2024-04-13 16:00'], utc=True),
+                         'sqrtA': [5153.6, 5153.7]})
+    cache.store(str(source), data)
+
+    def interrupted(f):
+        f.write(b'PK')
+        raise OSError(28, 'No space left on device')
+
+    stem = cache.stem(str(source))
+    with pytest.raises(OSError):
+        cache.replace(f'{stem}-G.npz', interrupted)
+
+    frames, missing = cache.load(str(source))
+    assert missing == set()
+    pd.testing.assert_frame_equal(frames[0], data)
+    assert not [name for name in os.listdir(cache.cache_directory) if name.endswith('.tmp')]
+
+
+def test_index_finds_latest_record_before_each_time(tmp_path):
+    hours = pd.to_datetime(['2024-04-13 12:00', '2024-04-13 14:00', '2024-04-13 16:00'], utc=True)
+    data = pd.DataFrame({'sv': ['G01'] * 3 + ['E05'] * 3, 'time': list(hours) * 2, 'sqrtA': np.arange(6.0)})
+    index = EphemerisIndex(data.sample(frac=1, random_state=0))
+    times = pd.to_datetime(['2024-04-13 11:00', '2024-04-13 13:30', '2024-04-13 14:00', '2024-04-13 18:00'], utc=True)
+
+    for sv in ('G01', 'E05'):
+        rows = index.lookup([sv] * 4, times)
+        expected = [None, 12, 12, 16]
+        assert [None if row < 0 else index.times[row] // 3600_000_000_000 % 24 for row in rows] == expected
+        # one epoch for every satellite agrees with the per-row lookup
+        assert index.lookup([sv], times[1].to_pydatetime())[0] == rows[1]
+    assert index.lookup(['R01'], times[1].to_pydatetime())[0] == -1
+
+    index.save(str(tmp_path / 'store'))
+    reopened = EphemerisIndex.open(str(tmp_path / 'store'))
+    assert (reopened.lookup(['G01', 'E05'], times[[3, 3]]) == index.lookup(['G01', 'E05'], times[[3, 3]])).all()
+    assert reopened.records['sqrtA'].tolist() == index.records['sqrtA'].tolist()
@@ -0,0 +1,48 @@
+import numpy as np
+import simulation
+from integrity import IntegrityMonitor
+from pseudorange_solver import PseudorangeSolver
+
+RECEIVER = np.array([4433469.9, 3122697.1, 3366427.4])
+
+
+def pseudoranges(xs, faults=(), seed=0):
+    # one-meter noise on every pseudorange plus a 40 m bias on each faulty one
+    rng = np.random.default_rng(seed)
+    ranges = np.linalg.norm(xs - RECEIVER, axis=1) + 90.0 + rng.standard_normal(len(xs))
+    ranges[list(faults)] += 40.0
+    return ranges
+
+
+def solve(xs, ranges):
+    return PseudorangeSolver(earth_rotation=False).solve(xs, ranges, np.ones(len(xs)))
+
+
+def test_consistent_fix_passes():
+    xs = simulation.random_sky(RECEIVER, 10)
+    solution = solve(xs, pseudoranges(xs))
+    result = IntegrityMonitor().check(solution.H, solution.residuals, solution.weights)
+    assert result.available and result.passed and not result.fault_detected
+    assert result.excluded == []
+
+
+def test_faulty_satellites_are_excluded():
+    xs = simulation.random_sky(RECEIVER, 12)
+    for faults in ([4], [2, 9]):
+        ranges = pseudoranges(xs, faults)
+        solution = solve(xs, ranges)
+        result = IntegrityMonitor().check(solution.H, solution.residuals, solution.weights)
+        assert result.fault_detected and result.passed
+        assert result.excluded == faults
+
+        # the downdated statistic is what a re-solve without them gives
+        keep = ~np.isin(np.arange(len(xs)), faults)
+        clean = solve(xs[keep], ranges[keep])
+        assert np.isclose(result.statistic, np.sum(clean.residuals ** 2))
+
+
+def test_no_redundancy_no_test():
+    xs = simulation.random_sky(RECEIVER, 4)
+    solution = solve(xs, pseudoranges(xs))
+    result = IntegrityMonitor().check(solution.H, solution.residuals)
+    assert not result.available and result.passed
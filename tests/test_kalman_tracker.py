@@ -0,0 +1,42 @@
+import numpy as np
+import simulation
+import server
+from device_session import DeviceSession
+from measurement_stream import measurements_to_frame
+from pseudorange_solver import LIGHTSPEED
+
+
+def post_epochs(session, measurements):
+    # one batch per epoch, the way a phone posts them
+    for epoch in simulation.epochs_of(measurements):
+        response, status = server.process_measurements(session, measurements_to_frame(epoch), epoch[-1])
+        assert status == 200, response
+        yield response
+
+
+def test_tracker_follows_drifting_clock(nav, parser, monkeypatch):
+    monkeypatch.setattr(server, 'parser', parser)
+    measurements, truth = simulation.simulate(nav, epochs=40, clock_drift=50 / LIGHTSPEED, noise=0.5, atmosphere=True)
+    session = DeviceSession('tracker')
+
+    errors = [np.linalg.norm(session.tracker.position - position)
+              for _, position in zip(post_epochs(session, measurements), truth['position'])]
+
+    assert max(errors) < 1.5
+    assert np.mean(errors[10:]) < 0.5
+    assert abs(session.tracker.clock_drift - 50.0) < 0.1
+    assert np.linalg.norm(session.tracker.velocity - truth['velocity'][-1]) < 0.05
+
+
+def test_session_keeps_one_clock_reference(nav, parser, monkeypatch):
+    monkeypatch.setattr(server, 'parser', parser)
+    measurements, _ = simulation.simulate(nav, epochs=3)
+    session = DeviceSession('reference')
+    list(post_epochs(session, measurements))
+    reference = session.clock_reference
+
+    # the receiver's bias estimate moves by less than a reset: the reference stays
+    assert session.reference_clock((reference[0] + 5000, 0.0)) == reference
+    # a clock reset starts a new reference and a new track
+    assert session.reference_clock((reference[0] + 10**9, 0.0))[0] == reference[0] + 10**9
+    assert session.tracker.state is None
@@ -0,0 +1,52 @@
+import json
+import numpy as np
+from live_updates import LiveUpdates
+
+
+def events(text):
+    return [json.loads(line[len('data: '):]) for line in text.splitlines() if line.startswith('data: ')]
+
+
+def test_subscribers_get_the_state_then_only_changes():
+    live = LiveUpdates()
+    live.publish('phone', {'position': [32.1, 34.8, 30.0], 'speed': 1.0})
+    everything, phone, other = live.subscribe(), live.subscribe('phone'), live.subscribe('other')
+
+    assert live.publish('phone', {'position': [32.1, 34.8, 30.0], 'speed': 1.0}) is None
+    live.publish('phone', {'position': [32.2, 34.8, 30.0], 'speed': np.float64(1.0)})
+    live.publish('other', {'position': None, 'speed': None})
+
+    assert [update.changes for update in phone.take(0)] == [{'position': [32.1, 34.8, 30.0], 'speed': 1.0},
+                                                            {'position': [32.2, 34.8, 30.0]}]
+    assert [update.device_id for update in everything.take(0)] == ['phone', 'phone', 'other']
+    assert [update.changes for update in other.take(0)] == [{'position': None, 'speed': None}]
+
+
+def test_slow_subscriber_gets_merged_updates():
+    live = LiveUpdates(max_pending=4)
+    subscriber = live.subscribe()
+    for k in range(10):
+        live.publish('phone', {'position': [k, 0, 0], 'speed': float(k % 2)})
+        live.publish('tablet', {'position': [0, k, 0]})
+
+    updates = subscriber.take(0)
+    assert len(updates) <= 4
+    latest = {}
+    for update in updates:
+        latest.setdefault(update.device_id, {}).update(update.changes)
+    assert latest == {'phone': {'position': [9, 0, 0], 'speed': 1.0}, 'tablet': {'position': [0, 9, 0]}}
+
+
+def test_stream_renders_server_sent_events():
+    live = LiveUpdates(heartbeat=0.01)
+    live.publish('phone', {'speed': np.float32(2.5), 'heading': np.array([90.0])})
+    subscriber = live.subscribe('phone')
+    stream = live.stream(subscriber)
+
+    assert next(stream) == "retry: 2000\n\n"
+    first = next(stream)
+    assert first.startswith("id: 1\nevent: update\n")
+    assert events(first) == [{'device_id': 'phone', 'speed': 2.5, 'heading': [90.0]}]
+    assert next(stream) == ": keepalive\n\n"
+    stream.close()
+    assert subscriber.closed and subscriber not in live.subscribers
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+from measurement_selection import MeasurementSelector
+
+RECEIVER = np.array([4433469.9, 3122697.1, 3366427.4])
+
+
+def rows(count):
+    return pd.DataFrame({'Cn0DbHz': np.full(count, 40.0), 'ReceivedSvTimeUncertaintyNanos': np.full(count, 10.0),
+                         'State': np.full(count, 16431), 'Constellation': ['G'] * count})
+
+
+def test_elevation_mask_rejects_low_and_unknown_satellites():
+    up = RECEIVER / np.linalg.norm(RECEIVER)
+    east = np.cross([0.0, 0.0, 1.0], up)
+    east /= np.linalg.norm(east)
+    overhead = RECEIVER + 2.0e7 * up
+    horizon = RECEIVER + 2.0e7 * (east + 0.05 * up)
+    xs = np.array([overhead, horizon, [np.nan] * 3])
+
+    selection = MeasurementSelector(elevation_mask=10.0).select(rows(3), xs, RECEIVER)
+
+    assert selection.keep.tolist() == [True, False, False]
+    assert selection.weights[1:].tolist() == [0.0, 0.0]
+    assert selection.rejected == {'elevation': 1, 'satellite position': 1}
+
+
+def test_rows_without_a_fix_skip_the_mask():
+    receivers = np.array([RECEIVER, [np.nan] * 3])
+    xs = np.array([RECEIVER + 2.0e7 * RECEIVER / np.linalg.norm(RECEIVER)] * 2)
+    selection = MeasurementSelector().select(rows(2), xs, receivers)
+    assert selection.keep.all()
+    assert selection.rejected == {}
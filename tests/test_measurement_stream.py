@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+import simulation
+from measurement_stream import (BATCH_HEADER, EPOCH_HEADER, SATELLITE_RECORD, EpochBuffer, binary_to_frame,
+                                frame_to_binary, measurements_to_frame)
+
+
+def test_frame_keeps_nanosecond_counters_exact(nav):
+    measurements, _ = simulation.simulate(nav, epochs=1)
+    incomplete = dict(measurements[0], receivedSvTimeNanos=None)
+    frame = measurements_to_frame(measurements + [incomplete, 'not a measurement'])
+
+    assert len(frame) == len(measurements)
+    assert frame['fullBiasNanos'].dtype == np.int64
+    assert frame['receivedSvTimeNanos'].tolist() == [m['receivedSvTimeNanos'] for m in measurements]
+    assert frame['fullBiasNanos'].iloc[0] == measurements[0]['fullBiasNanos']
+
+
+def test_buffer_passes_each_epoch_once_in_order(nav):
+    measurements, _ = simulation.simulate(nav, epochs=4)
+    epochs = simulation.epochs_of(measurements)
+    buffer = EpochBuffer(max_epochs=3)
+
+    # epochs 1 and 0 arrive out of order in one batch, then a resend overlapping epoch 1
+    first = buffer.add(measurements_to_frame(epochs[1] + epochs[0]))
+    second = buffer.add(measurements_to_frame(epochs[1] + epochs[2]))
+    assert buffer.add(measurements_to_frame(epochs[2])).empty
+
+    assert first['timeNanos'].is_monotonic_increasing
+    assert len(first) == len(epochs[0]) + len(epochs[1])
+    assert second['timeNanos'].unique().tolist() == [epochs[2][0]['timeNanos']]
+    buffer.add(measurements_to_frame(epochs[3]))
+    assert buffer.recent()['timeNanos'].nunique() == 3
+
+
+def test_binary_batch_round_trip(nav):
+    measurements, _ = simulation.simulate(nav, epochs=3, adr=True)
+    frame = measurements_to_frame(measurements)
+    payload = frame_to_binary(frame)
+    decoded = binary_to_frame(payload)
+
+    assert len(payload) == BATCH_HEADER.itemsize + 3 * EPOCH_HEADER.itemsize + len(frame) * SATELLITE_RECORD.itemsize
+    assert decoded['receivedSvTimeNanos'].tolist() == frame['receivedSvTimeNanos'].tolist()
+    assert decoded['fullBiasNanos'].tolist() == frame['fullBiasNanos'].tolist()
+    assert decoded['codeType'].tolist() == frame['codeType'].tolist()
+    # single precision fields only lose what the phone never had
+    assert np.allclose(decoded['cn0DbHz'], frame['cn0DbHz'], rtol=1e-6)
+    assert (decoded.dtypes == frame.dtypes).all()
+
+
+def test_malformed_binary_batches_are_rejected(nav):
+    measurements, _ = simulation.simulate(nav, epochs=1)
+    payload = frame_to_binary(measurements_to_frame(measurements))
+    for broken in (payload[:4], b'XXXX' + payload[4:], payload[:-1], payload + b'\0'):
+        with pytest.raises(ValueError):
+            binary_to_frame(broken)
@@ -0,0 +1,38 @@
+from metrics import MetricsRegistry
+
+
+def test_render_counters_and_cumulative_histograms():
+    registry = MetricsRegistry()
+    registry.inc('gnss_fixes_total', status='success')
+    registry.inc('gnss_fixes_total', 2, status='success')
+    registry.count_satellites(['G', 'G', 'E'])
+    for value in (1, 3, 3, 100):
+        registry.observe('gnss_solver_iterations', value)
+
+    text = registry.render()
+    assert 'gnss_fixes_total{status="success"} 3\n' in text
+    assert 'gnss_satellites_used_total{constellation="E"} 1\n' in text
+    assert 'gnss_satellites_used_total{constellation="G"} 2\n' in text
+    assert '# TYPE gnss_solver_iterations histogram\n' in text
+    assert 'gnss_solver_iterations_bucket{le="1"} 1\n' in text
+    assert 'gnss_solver_iterations_bucket{le="3"} 3\n' in text
+    assert 'gnss_solver_iterations_bucket{le="60"} 3\n' in text
+    assert 'gnss_solver_iterations_bucket{le="+Inf"} 4\n' in text
+    assert 'gnss_solver_iterations_sum 107.0\n' in text
+    assert 'gnss_solver_iterations_count 4\n' in text
+
+
+def test_worker_values_merge_into_the_parent():
+    parent, worker = MetricsRegistry(), MetricsRegistry()
+    with parent.time('solve'):
+        pass
+    with worker.time('solve'):
+        pass
+    worker.observe_fix_satellites(['G', 'G', 'E', 'G'], epoch_index=[0, 0, 0, 1])
+    parent.merge(worker.collect(reset=True))
+
+    assert worker.collect() == {}
+    assert [row[:2] for row in parent.stage_summary()] == [('solve', 2)]
+    fix_satellites = parent.collect()[('gnss_fix_satellites', (('constellation', 'G'),))]
+    # one fix with two GPS satellites, one with one
+    assert fix_satellites[2] == 2 and fix_satellites[1] == 3
@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+import numpy as np
+import simulation
+from orbit import orbit_parameters, satellite_positions, week_seconds
+
+SIMULATED_TIME = datetime(1980, 1, 6) + timedelta(weeks=simulation.GPS_WEEK, seconds=simulation.TOW0)
+SATELLITES = ['G01', 'G07', 'G19', 'E05', 'E11']
+
+
+def broadcast(manager, nav):
+    ephemeris = manager.get_ephemeris(SIMULATED_TIME, SATELLITES)
+    records = {record.sv: record for record in nav.itertuples() if record.Toe == ephemeris['t_oe'].iloc[0]}
+    return ephemeris, [records[sv] for sv in ephemeris.index]
+
+
+def test_orbits_match_the_reference_model(manager, nav):
+    ephemeris, records = broadcast(manager, nav)
+    times = simulation.TOW0 + np.array([-3000.0, 0.0, 1234.5, 3600.0])
+    # every record at every time in one call
+    rows = np.repeat(np.arange(len(records)), len(times))
+    params = {field: values[rows] for field, values in orbit_parameters(ephemeris).items()}
+    result = satellite_positions(params, np.tile(times, len(records)))
+
+    expected = np.array([np.r_[simulation.satellite_state(records[row], t)] for row, t in zip(rows, np.tile(times, len(records)))])
+    assert np.abs(result[:, :3] - expected[:, :3]).max() < 1e-3
+    assert np.abs(result[:, 3] - expected[:, 3]).max() < 1e-12
+
+
+def test_velocity_is_the_derivative_of_position(manager, nav):
+    ephemeris, _ = broadcast(manager, nav)
+    t = simulation.TOW0 + 100.0
+    state = satellite_positions(ephemeris, t, velocity=True)
+    later, earlier = satellite_positions(ephemeris, t + 0.5), satellite_positions(ephemeris, t - 0.5)
+    assert np.abs(state[:, 4:7] - (later[:, :3] - earlier[:, :3])).max() < 1e-3
+    assert np.abs(state[:, 7] - (later[:, 3] - earlier[:, 3])).max() < 1e-15
+
+
+def test_times_wrap_across_the_week():
+    assert week_seconds(np.array([-604000.0, 604000.0, 100.0])).tolist() == [800.0, -800.0, 100.0]
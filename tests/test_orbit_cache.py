@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+import numpy as np
+import simulation
+from orbit import orbit_parameters, satellite_positions
+from orbit_cache import OrbitCache
+
+SIMULATED_TIME = datetime(1980, 1, 6) + timedelta(weeks=simulation.GPS_WEEK, seconds=simulation.TOW0)
+
+
+def test_interpolated_orbits_match_the_direct_ones(manager):
+    ephemeris = manager.get_ephemeris(SIMULATED_TIME, ['G01', 'G07', 'G19', 'E05', 'E11'])
+    t_oe = ephemeris['t_oe'].to_numpy()
+    rows = np.repeat(np.arange(len(ephemeris)), 50)
+    params = {field: values[rows] for field, values in orbit_parameters(ephemeris).items()}
+    # across the whole window and a bit past it on either side
+    times = t_oe[rows] + np.tile(np.linspace(-7300.0, 7300.0, 50), len(ephemeris))
+    records = ephemeris['record'].to_numpy()[rows]
+
+    cache = OrbitCache(max_records=3)
+    interpolated = cache.satellite_positions(params, times, records)
+    direct = satellite_positions(params, times)
+    assert np.abs(interpolated[:, :3] - direct[:, :3]).max() < 1e-3
+    assert np.abs(interpolated[:, 3] - direct[:, 3]).max() < 1e-12
+    # outside the fitted window the direct orbit is used as is
+    outside = np.abs(times - t_oe[rows]) > 7200.0
+    assert (interpolated[outside] == direct[outside]).all()
+    # only the most recently used records stay fitted
+    assert len(cache.tables) == 3
+    assert list(cache.tables) == list(dict.fromkeys(records))[-3:]
+
+
+def test_interpolated_velocities_match_the_analytic_ones(manager):
+    ephemeris = manager.get_ephemeris(SIMULATED_TIME, ['G01', 'G07', 'E05'])
+    t_oe = ephemeris['t_oe'].to_numpy()
+    rows = np.repeat(np.arange(len(ephemeris)), 40)
+    params = {field: values[rows] for field, values in orbit_parameters(ephemeris).items()}
+    times = t_oe[rows] + np.tile(np.linspace(-7300.0, 7300.0, 40), len(ephemeris))
+    records = ephemeris['record'].to_numpy()[rows]
+
+    interpolated = OrbitCache().satellite_positions(params, times, records, velocity=True)
+    direct = satellite_positions(params, times, velocity=True)
+    assert interpolated.shape == direct.shape == (len(times), 8)
+    assert np.abs(interpolated[:, :3] - direct[:, :3]).max() < 1e-3
+    assert np.abs(interpolated[:, 4:7] - direct[:, 4:7]).max() < 1e-4
+    assert np.abs(interpolated[:, 7] - direct[:, 7]).max() < 1e-14
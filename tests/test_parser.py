@@ -0,0 +1,22 @@
+import numpy as np
+import simulation
+from measurement_stream import measurements_to_frame
+from pseudorange_solver import LIGHTSPEED
+
+
+def test_solve_epochs_recovers_every_epoch(nav, parser):
+    measurements, truth = simulation.simulate(nav, epochs=20, atmosphere=True)
+    trajectory = parser.solve_epochs(parser.formatDF(measurements_to_frame(measurements)))
+
+    assert len(trajectory) == 20
+    error = np.linalg.norm(trajectory[['Pos.X', 'Pos.Y', 'Pos.Z']].to_numpy() - truth['position'], axis=1)
+    assert error.max() < 1.5
+    assert set(trajectory.columns) >= {'ClockBias.G', 'ClockBias.E', 'NumSats', 'Cost'}
+
+
+def test_batch_velocity_from_doppler(nav, parser):
+    measurements, truth = simulation.simulate(nav, epochs=5, clock_drift=20 / LIGHTSPEED, velocity_enu=(-7.0, 12.0, 0.5))
+    trajectory = parser.solve_epochs(parser.formatDF(measurements_to_frame(measurements)))
+
+    error = np.linalg.norm(trajectory[['Vel.X', 'Vel.Y', 'Vel.Z']].to_numpy() - truth['velocity'], axis=1)
+    assert error.max() < 0.02
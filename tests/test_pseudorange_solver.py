@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+import simulation
+from pseudorange_solver import PseudorangeSolver
+
+RECEIVER = np.array([4433469.9, 3122697.1, 3366427.4])
+
+
+def geometry(count=9, seed=0):
+    return simulation.random_sky(RECEIVER, count, seed)
+
+
+def pseudoranges(xs, biases, systems):
+    return np.linalg.norm(xs - RECEIVER, axis=1) + np.array([biases[system] for system in systems])
+
+
+def test_joint_solve_recovers_position_and_biases():
+    xs = geometry()
+    systems = np.array(['G'] * 5 + ['E'] * 4)
+    biases = {'G': 90.0, 'E': 96.0}
+    solver = PseudorangeSolver(earth_rotation=False)
+    solution = solver.solve(xs, pseudoranges(xs, biases, systems), systems=systems)
+
+    assert np.linalg.norm(solution.position - RECEIVER) < 1e-3
+    assert solution.clock_biases == pytest.approx(biases, abs=1e-3)
+    # the next epoch starts warm from it
+    assert solver.solve(xs, pseudoranges(xs, biases, systems), systems=systems).iterations == solver.warm_iterations
+
+
+def test_dop_covers_every_clock_bias():
+    xs = geometry()
+    systems = np.array(['G'] * 5 + ['E'] * 4)
+    solution = PseudorangeSolver(earth_rotation=False).solve(xs, pseudoranges(xs, {'G': 90.0, 'E': 96.0}, systems),
+                                                             systems=systems)
+    dop = solution.dop
+
+    # E has fewer satellites to pin its clock down than G
+    assert dop['TDOP_E'] > dop['TDOP_G']
+    assert dop['TDOP'] == dop['TDOP_E']
+    assert dop['GDOP'] ** 2 == pytest.approx(dop['PDOP'] ** 2 + dop['TDOP_G'] ** 2 + dop['TDOP_E'] ** 2)
+
+
+def test_non_finite_solve_keeps_the_previous_fix():
+    xs = geometry()
+    systems = np.array(['G'] * 9)
+    solver = PseudorangeSolver(earth_rotation=False)
+    solver.solve(xs, pseudoranges(xs, {'G': 90.0}, systems), systems=systems)
+    previous = solver.previous
+
+    poisoned = xs.copy()
+    poisoned[0] = np.nan
+    with pytest.raises(np.linalg.LinAlgError):
+        solver.solve(poisoned, pseudoranges(xs, {'G': 90.0}, systems), systems=systems)
+    assert solver.previous is previous
+    solution = solver.solve(xs, pseudoranges(xs, {'G': 90.0}, systems), systems=systems)
+    assert np.linalg.norm(solution.position - RECEIVER) < 1e-3
+
+
+def test_earth_rotation_during_transit_is_corrected(nav):
+    receiver = simulation.geodetic_to_ecef(*simulation.START_LLA)
+    records = [record for record in nav.itertuples() if record.Toe == simulation.TOW0 - 1800]
+    paths = [simulation.signal_path(record, receiver, simulation.TOW0) for record in records]
+    # satellites at their transmission time, ranges as received
+    xs = np.array([simulation.satellite_state(record, transmit)[0] for record, (transmit, _, _) in zip(records, paths)])
+    ranges = np.array([np.linalg.norm(rotated - receiver) for _, rotated, _ in paths])
+    up = (xs - receiver) @ (receiver / np.linalg.norm(receiver)) > 0
+    xs, ranges = xs[up], ranges[up] + 90.0
+
+    rotating = PseudorangeSolver().solve(xs, ranges)
+    assert np.linalg.norm(rotating.position - receiver) < 1e-3
+    assert np.linalg.norm(PseudorangeSolver(earth_rotation=False).solve(xs, ranges).position - receiver) > 5.0
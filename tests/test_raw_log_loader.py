@@ -0,0 +1,48 @@
+import os
+import numpy as np
+import simulation
+import raw_log_loader
+from raw_log_loader import load_log_records, sidecar_path
+
+
+def test_sidecar_is_written_and_memory_mapped(nav, tmp_path):
+    measurements, _ = simulation.simulate(nav, epochs=2)
+    path = simulation.write_log(measurements, str(tmp_path / 'gnss_log.txt'))
+
+    records = load_log_records(path)
+    assert isinstance(records, np.memmap)
+    assert os.path.exists(sidecar_path(path))
+    assert len(records) == len(measurements)
+    assert records['ReceivedSvTimeNanos'].tolist() == [m['receivedSvTimeNanos'] for m in measurements]
+
+
+def test_unwritable_sidecar_falls_back_to_parsed_records(nav, tmp_path, monkeypatch):
+    measurements, _ = simulation.simulate(nav, epochs=2)
+    path = simulation.write_log(measurements, str(tmp_path / 'gnss_log.txt'))
+
+    def read_only(*args, **kwargs):
+        raise PermissionError(13, 'Permission denied')
+
+    monkeypatch.setattr(raw_log_loader.np, 'save', read_only)
+    records = load_log_records(path)
+    assert not os.path.exists(sidecar_path(path))
+    assert os.listdir(tmp_path) == ['gnss_log.txt']
+    assert len(records) == len(measurements)
+
+
+def test_failed_sidecar_write_keeps_the_previous_one(nav, tmp_path, monkeypatch):
+    measurements, _ = simulation.simulate(nav, epochs=2)
+    path = simulation.write_log(measurements, str(tmp_path / 'gnss_log.txt'))
+    load_log_records(path)
+    before = open(sidecar_path(path), 'rb').read()
+    os.utime(path, (os.path.getmtime(sidecar_path(path)) + 10,) * 2)
+
+    def disk_full(f, records):
+        f.write(b'partial')
+        raise OSError(28, 'No space left on device')
+
+    monkeypatch.setattr(raw_log_loader.np, 'save', disk_full)
+    records = load_log_records(path)
+    assert len(records) == len(measurements)
+    assert open(sidecar_path(path), 'rb').read() == before
+    assert sorted(os.listdir(tmp_path)) == ['gnss_log.txt', os.path.basename(sidecar_path(path))]
@@ -0,0 +1,142 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+import simulation
+import server
+from device_session import DeviceSession
+from measurement_stream import BINARY_CONTENT_TYPE, frame_to_binary, measurements_to_frame
+
+
+def test_satellites_without_orbit_are_left_out(nav, parser, monkeypatch):
+    monkeypatch.setattr(server, 'parser', parser)
+    calculate_satellite_position = parser.calculate_satellite_position
+
+    def without_first_orbit(ephemeris, transmit_time):
+        # what a record without Keplerian elements produces
+        positions = calculate_satellite_position(ephemeris, transmit_time)
+        positions.iloc[0] = np.nan
+        return positions
+
+    monkeypatch.setattr(parser, 'calculate_satellite_position', without_first_orbit)
+    measurements, truth = simulation.simulate(nav, epochs=1, atmosphere=True)
+    session = DeviceSession('orbits')
+    response, status = server.process_measurements(session, measurements_to_frame(measurements), measurements[-1])
+
+    assert status == 200, response
+    assert np.isfinite(session.solver.previous[0]).all()
+    assert np.linalg.norm(session.solver.previous[0] - truth['position'][0]) < 1.0
+
+
+def test_one_batch_per_device_at_a_time(nav, monkeypatch):
+    running = {}
+    peaks = {}
+    guard = threading.Lock()
+
+    def slow_process(session, measurements, latest_measurement):
+        with guard:
+            running[session.device_id] = running.get(session.device_id, 0) + 1
+            peaks[session.device_id] = max(peaks.get(session.device_id, 0), running[session.device_id])
+            peaks['all'] = max(peaks.get('all', 0), sum(running.values()))
+        time.sleep(0.05)
+        with guard:
+            running[session.device_id] -= 1
+        return {"status": "success"}, 200
+
+    monkeypatch.setattr(server, 'process_measurements', slow_process)
+    measurements, _ = simulation.simulate(nav, epochs=1)
+    client = server.app.test_client()
+
+    def post(device):
+        return client.post('/gnssdata', json=measurements, headers={'X-Device-Id': device}).status_code
+
+    with ThreadPoolExecutor(max_workers=8) as posters:
+        statuses = list(posters.map(post, ['busy'] * 6 + ['other'] * 2))
+
+    assert statuses == [200] * 8
+    assert peaks['busy'] == peaks['other'] == 1
+    # the two devices were solved side by side
+    assert peaks['all'] == 2
+
+
+def test_fix_reports_speed_and_heading(nav, parser, monkeypatch):
+    monkeypatch.setattr(server, 'parser', parser)
+    measurements, _ = simulation.simulate(nav, epochs=1, atmosphere=True, velocity_enu=(3.0, -4.0, 0.0))
+    response, status = server.process_measurements(DeviceSession('moving'), measurements_to_frame(measurements), measurements[-1])
+
+    assert status == 200, response
+    assert abs(response['speed'] - 5.0) < 0.02
+    assert abs(response['heading'] - np.degrees(np.arctan2(3.0, -4.0))) < 0.5
+
+
+def test_binary_batches_are_solved_like_json(nav, parser, monkeypatch):
+    monkeypatch.setattr(server, 'parser', parser)
+    measurements, _ = simulation.simulate(nav, epochs=1, atmosphere=True)
+    payload = frame_to_binary(measurements_to_frame(measurements))
+    client = server.app.test_client()
+
+    binary = client.post('/gnssdata', data=payload, content_type=BINARY_CONTENT_TYPE, headers={'X-Device-Id': 'binary'})
+    json_batch = client.post('/gnssdata', json=measurements, headers={'X-Device-Id': 'json'})
+    assert binary.status_code == json_batch.status_code == 200
+    assert np.allclose(binary.get_json()['position'], json_batch.get_json()['position'], atol=1e-7)
+    assert client.post('/gnssdata', data=payload[:-3], content_type=BINARY_CONTENT_TYPE).status_code == 400
+
+
+def test_every_epoch_of_a_batch_is_solved(nav, parser, monkeypatch):
+    monkeypatch.setattr(server, 'parser', parser)
+    measurements, truth = simulation.simulate(nav, epochs=5, atmosphere=True, velocity_enu=(3.0, 4.0, 0.0))
+    session = DeviceSession('batched')
+    response, status = server.process_measurements(session, measurements_to_frame(measurements), measurements[-1])
+
+    assert status == 200, response
+    # the tracker has stepped through to the last epoch of the batch
+    assert session.tracker.time - session.tracker.time // 604800 * 604800 == pytest.approx(simulation.TOW0 + 4, abs=1e-3)
+    assert np.linalg.norm(session.tracker.position - truth['position'][-1]) < 1.0
+    assert server.process_measurements(session, measurements_to_frame(measurements), measurements[-1])[0]['status'] == 'duplicate'
+
+
+def test_measurements_without_state_are_solved(nav, parser, monkeypatch):
+    monkeypatch.setattr(server, 'parser', parser)
+    measurements, _ = simulation.simulate(nav, epochs=1, atmosphere=True)
+    for measurement in measurements:
+        del measurement['state']
+    response = server.app.test_client().post('/gnssdata', json=measurements, headers={'X-Device-Id': 'stateless'})
+
+    assert response.status_code == 200, response.get_json()
+
+
+def test_nav_files_dropped_into_the_rinex_directory_are_picked_up(nav, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, 'data_directory', str(tmp_path / 'data'))
+    monkeypatch.setattr(server, 'ephemerisManager', None)
+    monkeypatch.setattr(server, 'parser', None)
+    dropbox = tmp_path / 'rinex'
+    dropbox.mkdir()
+    server.setup(str(dropbox))
+    assert server.ephemerisManager.rinex_directory == str(dropbox)
+    measurements, _ = simulation.simulate(nav, epochs=2, atmosphere=True)
+    first, second = simulation.epochs_of(measurements)
+    client = server.app.test_client()
+
+    # the nav file arrives after the server started with none
+    simulation.write_nav(str(dropbox / 'synthetic.rnx'))
+    client.post('/gnssdata', json=first, headers={'X-Device-Id': 'dropbox'})
+    server.ephemerisManager.refresher.join()
+    response = client.post('/gnssdata', json=second, headers={'X-Device-Id': 'dropbox'})
+
+    assert response.status_code == 200, response.get_json()
+    assert str(dropbox / 'synthetic.rnx') in server.ephemerisManager.files
+
+
+@pytest.mark.parametrize('field, value', [(None, None), ('timeNanos', 'soon'), ('cn0DbHz', [1, 2])])
+def test_malformed_json_batches_are_rejected(nav, field, value):
+    measurements, _ = simulation.simulate(nav, epochs=1)
+    if field is None:
+        body = measurements[0]
+    else:
+        body = [dict(measurements[0], **{field: value})] + measurements[1:]
+    response = server.app.test_client().post('/gnssdata', json=body, headers={'X-Device-Id': 'malformed'})
+
+    assert response.status_code == 400
+    assert response.get_json()['status'] == 'failure'
+    assert response.get_json()['error'] != "No measurements received"
@@ -0,0 +1,36 @@
+import simulation
+import server
+from device_session import DeviceSession
+from measurement_stream import measurements_to_frame
+from pseudorange_solver import LIGHTSPEED
+
+
+def alerts_of(session, measurements):
+    alerts = []
+    for epoch in simulation.epochs_of(measurements):
+        response, status = server.process_measurements(session, measurements_to_frame(epoch), epoch[-1])
+        assert status == 200, response
+        alerts.append(response['alerts'])
+    return alerts
+
+
+def test_clean_log_raises_no_alerts(nav, parser, monkeypatch):
+    monkeypatch.setattr(server, 'parser', parser)
+    measurements, _ = simulation.simulate(nav, epochs=60, clock_drift=50 / LIGHTSPEED, noise=1.0, atmosphere=True)
+    alerts = alerts_of(DeviceSession('clean'), measurements)
+
+    assert not any(alert['spoofing'] or alert['jamming'] or alert['satellites'] for alert in alerts)
+
+
+def test_receiver_clock_jump_is_reported(nav, parser, monkeypatch):
+    monkeypatch.setattr(server, 'parser', parser)
+    measurements, _ = simulation.simulate(nav, epochs=40, clock_drift=50 / LIGHTSPEED, noise=1.0, atmosphere=True)
+    jump = int(round(25.0 / LIGHTSPEED * 1e9))
+    for measurement in measurements:
+        if measurement['timeNanos'] >= 10 ** 12 + 30 * 10 ** 9:
+            # every pseudorange 25 m longer from epoch 30 on, as a time-pushing spoofer would do
+            measurement['receivedSvTimeNanos'] -= jump
+    alerts = alerts_of(DeviceSession('jump'), measurements)
+
+    assert not any(alert['spoofing'] for alert in alerts[:30])
+    assert 'receiver clock jump' in alerts[30]['reasons']
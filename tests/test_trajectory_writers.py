@@ -0,0 +1,25 @@
+import xml.etree.ElementTree as ET
+import numpy as np
+from trajectory_writers import Decimator, KmlTrajectoryWriter
+
+
+def test_decimator_thresholds():
+    lat = np.full(5, 32.1)
+    lon = 34.8 + np.array([0.0, 1e-6, 2e-6, 1e-3, 1e-3])
+    times = np.arange(5.0)
+
+    assert Decimator(min_distance=10.0).keep(lat, lon).tolist() == [True, False, False, True, False]
+    assert Decimator(min_distance=10.0, min_interval=2.0).keep(lat, lon, times).tolist() == [True, False, True, True, False]
+    # no times to compare: the interval holds nothing back
+    assert Decimator(min_interval=2.0).keep(lat, lon).all()
+
+
+def test_kml_name_is_escaped(tmp_path):
+    path = str(tmp_path / 'track.kml')
+    with KmlTrajectoryWriter(path, points=True, name='Drive <A&B>') as writer:
+        writer.write([32.1, 32.2], [34.8, 34.9], [30.0, 31.0])
+
+    namespace = {'kml': 'http://www.opengis.net/kml/2.2'}
+    document = ET.parse(path).getroot()
+    assert document.find('.//kml:Placemark/kml:name', namespace).text == 'Drive <A&B>'
+    assert len(document.findall('.//kml:Point', namespace)) == 2
@@ -0,0 +1,206 @@
+import io
+import os
+import tempfile
+from xml.sax.saxutils import escape
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS = 6371008.8
+
+
+def to_seconds(times):
+    # seconds as float64 from numbers, datetimes or timestamp strings
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.number):
+        return times.astype(np.float64)
+    nanos = pd.to_datetime(pd.Series(times), utc=True).dt.tz_convert(None).astype('datetime64[ns]').to_numpy().view(np.int64)
+    return nanos / 1e9
+
+
+class Decimator():
+    """Drops points that are within min_distance meters and min_interval seconds of the last kept one.
+
+    A threshold left as None does not hold points back, so with only min_distance a parked
+    receiver writes nothing and with both set it still writes one point per min_interval.
+    """
+    def __init__(self, min_distance=None, min_interval=None):
+        self.min_distance = min_distance
+        self.min_interval = min_interval
+        self.last = None
+
+    def keep(self, lat, lon, times=None):
+        keep = np.ones(len(lat), dtype=bool)
+        if self.min_distance is None and self.min_interval is None:
+            return keep
+        lat, lon = np.radians(lat), np.radians(lon)
+        seconds = to_seconds(times) if times is not None else np.zeros(len(lat))
+        for i in range(len(lat)):
+            if self.last is not None:
+                last_lat, last_lon, last_time = self.last
+                near = True
+                if self.min_distance is not None:
+                    # equirectangular distance, plenty for thresholds of meters to kilometers
+                    north = lat[i] - last_lat
+                    east = (lon[i] - last_lon) * np.cos((lat[i] + last_lat) / 2)
+                    near = EARTH_RADIUS * np.hypot(north, east) < self.min_distance
+                # without times no point counts as recent, so min_interval keeps them all
+                recent = self.min_interval is None or (times is not None and seconds[i] - last_time < self.min_interval)
+                if near and recent:
+                    keep[i] = False
+                    continue
+            self.last = (lat[i], lon[i], seconds[i])
+        return keep
+
+
+class TrajectoryWriter():
+    """Base of the streaming writers: each write() appends a chunk of points to the open file.
+
+    Nothing but the file handle and the decimator state is kept between chunks, so memory
+    does not grow with the trajectory. Use as a context manager, or call close() to write
+    the closing part of the document.
+    """
+    def __init__(self, path, min_distance=None, min_interval=None):
+        self.path = path
+        self.decimator = Decimator(min_distance, min_interval)
+        self.count = 0
+        self.file = open(path, 'w')
+        self.begin()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, lat, lon, alt, times=None):
+        # returns the number of points kept from this chunk
+        lat, lon, alt = (np.atleast_1d(np.asarray(values, dtype=np.float64)) for values in (lat, lon, alt))
+        keep = self.decimator.keep(lat, lon, times) & np.isfinite(lat) & np.isfinite(lon) & np.isfinite(alt)
+        if times is not None:
+            times = np.atleast_1d(np.asarray(times))[keep]
+        if keep.any():
+            self.append(lat[keep], lon[keep], alt[keep], times)
+            self.count += int(keep.sum())
+        return int(keep.sum())
+
+    def close(self):
+        if self.file is None:
+            return
+        self.end()
+        self.file.close()
+        self.file = None
+
+    def begin(self):
+        pass
+
+    def append(self, lat, lon, alt, times):
+        raise NotImplementedError
+
+    def end(self):
+        pass
+
+    @staticmethod
+    def format_rows(columns, row_format, separator):
+        text = io.StringIO()
+        np.savetxt(text, np.column_stack(columns), fmt=row_format, newline=separator)
+        return text.getvalue()[:-len(separator)]
+
+    @staticmethod
+    def iso_times(times):
+        return pd.to_datetime(pd.Series(times), utc=True).dt.strftime('%Y-%m-%dT%H:%M:%S.%fZ').to_numpy()
+
+
+class CsvTrajectoryWriter(TrajectoryWriter):
+    # Lat, Lon, Alt columns like lla_coordinates.csv, led by UnixTime when times are given
+    def append(self, lat, lon, alt, times):
+        chunk = pd.DataFrame({'Lat': lat, 'Lon': lon, 'Alt': alt})
+        if times is not None:
+            chunk.insert(0, 'UnixTime', times)
+        chunk.to_csv(self.file, header=self.count == 0, index=False)
+
+
+class KmlTrajectoryWriter(TrajectoryWriter):
+    """KML with the trajectory as a LineString and/or one Point placemark per fix.
+
+    The LineString coordinates stream straight into the document; points are spooled to a
+    temporary file and copied in after the line when the writer closes.
+    """
+    def __init__(self, path, min_distance=None, min_interval=None, line=True, points=False, name='Trajectory'):
+        self.line = line
+        self.points = tempfile.TemporaryFile('w+', dir=os.path.dirname(os.path.abspath(path))) if points else None
+        self.name = name
+        super().__init__(path, min_distance, min_interval)
+
+    def begin(self):
+        self.file.write('<?xml version="1.0" encoding="UTF-8"?>\n<kml xmlns="http://www.opengis.net/kml/2.2">\n<Document>\n')
+        if self.line:
+            self.file.write(f'<Placemark>\n<name>{escape(self.name)}</name>\n<LineString>\n<tessellate>1</tessellate>\n'
+                            '<altitudeMode>absolute</altitudeMode>\n<coordinates>\n')
+
+    def append(self, lat, lon, alt, times):
+        if self.line:
+            self.file.write(self.format_rows([lon, lat, alt], '%.9f,%.9f,%.3f', '\n') + '\n')
+        if self.points is not None:
+            if times is None:
+                rows = self.format_rows([lon, lat, alt], '<Placemark><Point><coordinates>%.9f,%.9f,%.3f</coordinates></Point></Placemark>', '\n')
+            else:
+                rows = '\n'.join(f'<Placemark><TimeStamp><when>{when}</when></TimeStamp><Point><coordinates>{x:.9f},{y:.9f},{z:.3f}</coordinates></Point></Placemark>'
+                                 for when, x, y, z in zip(self.iso_times(times), lon, lat, alt))
+            self.points.write(rows + '\n')
+
+    def end(self):
+        if self.line:
+            self.file.write('</coordinates>\n</LineString>\n</Placemark>\n')
+        if self.points is not None:
+            self.file.write('<Folder>\n<name>Fixes</name>\n')
+            self.points.seek(0)
+            while True:
+                block = self.points.read(1 << 20)
+                if not block:
+                    break
+                self.file.write(block)
+            self.points.close()
+            self.file.write('</Folder>\n')
+        self.file.write('</Document>\n</kml>\n')
+
+
+class GeoJsonTrajectoryWriter(TrajectoryWriter):
+    # A FeatureCollection holding one LineString feature, or one Point feature per fix
+    # (with a time property when times are given) when line is False
+    def __init__(self, path, min_distance=None, min_interval=None, line=True):
+        self.line = line
+        super().__init__(path, min_distance, min_interval)
+
+    def begin(self):
+        self.file.write('{"type": "FeatureCollection", "features": [')
+        if self.line:
+            self.file.write('{"type": "Feature", "properties": {}, "geometry": {"type": "LineString", "coordinates": [\n')
+
+    def append(self, lat, lon, alt, times):
+        if self.line:
+            rows = self.format_rows([lon, lat, alt], '[%.9f, %.9f, %.3f]', ',\n')
+        elif times is None:
+            rows = self.format_rows([lon, lat, alt], '{"type": "Feature", "properties": {}, '
+                                    '"geometry": {"type": "Point", "coordinates": [%.9f, %.9f, %.3f]}}', ',\n')
+        else:
+            rows = ',\n'.join(f'{{"type": "Feature", "properties": {{"time": "{when}"}}, '
+                              f'"geometry": {{"type": "Point", "coordinates": [{x:.9f}, {y:.9f}, {z:.3f}]}}}}'
+                              for when, x, y, z in zip(self.iso_times(times), lon, lat, alt))
+        self.file.write((',\n' if self.count else '\n') + rows)
+
+    def end(self):
+        if self.line:
+            self.file.write('\n]}}')
+        self.file.write(']}\n')
+
+
+def trajectory_writer(path, **options):
+    # picks the writer from the file extension: .kml, .geojson/.json or .csv
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.kml':
+        return KmlTrajectoryWriter(path, **options)
+    if extension in ('.geojson', '.json'):
+        return GeoJsonTrajectoryWriter(path, **options)
+    if extension == '.csv':
+        return CsvTrajectoryWriter(path, **options)
+    raise ValueError(f"Unknown trajectory format: {path}")